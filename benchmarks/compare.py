@@ -0,0 +1,49 @@
+"""
+Compare two benchmarks.run result files:
+
+    python -m benchmarks.compare before.json after.json [--threshold 0.1] [--fail-on-regression]
+"""
+import argparse
+import json
+
+
+def result_key(entry: dict) -> tuple:
+    return entry["name"], entry["size"], json.dumps(entry["params"], sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    previous = {result_key(entry): entry for entry in before["results"]}
+    regressions = 0
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    for entry in after["results"]:
+        old = previous.get(result_key(entry))
+        params = " ".join(f"{key}={value}" for key, value in entry["params"].items())
+        if old is None:
+            print(f"{entry['name']:<16} {entry['size']:>8}  new  {entry['best'] * 1000:10.1f}ms  {params}")
+            continue
+        ratio = entry["best"] / old["best"] if old["best"] else float("inf")
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{entry['name']:<16} {entry['size']:>8}  {old['best'] * 1000:10.1f}ms -> "
+              f"{entry['best'] * 1000:10.1f}ms  x{ratio:.2f}  {params}{flag}")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
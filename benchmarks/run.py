@@ -0,0 +1,223 @@
+"""
+Time the hot paths on synthetic deals and write the results as JSON.
+
+    python -m benchmarks.run --sizes 1000,10000 --output benchmarks/results/after.json
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+
+Results go to benchmarks/results/ (gitignored) unless --output says otherwise.
+
+Zoho and gspread are always local stubs (--zoho-latency / --sheet-latency add
+a per-request delay). The database is an in-memory fake unless BENCH_DB_URL
+points at a scratch Postgres, which then gets a Bigin.deals table filled with
+the generated rows.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.stubs import gsheet_stub, install_database, install_zoho_stub
+from benchmarks.synthetic import generate_deals, iter_sample_deals, to_db_row, to_zoho_record
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCHMARKS = (
+    "zoho_fetch", "db_upsert", "db_fetch", "deal_set_load", "deal_set_memory", "deal_columns_load",
+    "deals_metrics", "weekly_metrics", "weekly_backfill", "gsheet_export",
+)
+
+
+def timed(fn, repeat: int, quiet: bool = True) -> list[float]:
+    """Run `fn` `repeat` times; the services' progress prints are swallowed unless quiet=False."""
+    runs = []
+    for _ in range(repeat):
+        sink = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+        with sink:
+            started = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - started)
+    return runs
+
+
+def result(name: str, size: int, runs: list[float], counters: dict = None, **params) -> dict:
+    """One result entry; `params` identify it between files, `counters` are informational."""
+    best = min(runs)
+    return {
+        "name": name,
+        "size": size,
+        "params": params,
+        "counters": counters or {},
+        "runs": [round(run, 6) for run in runs],
+        "best": round(best, 6),
+        "median": round(statistics.median(runs), 6),
+        "per_deal_us": round(best / size * 1e6, 3) if size else None,
+    }
+
+
+def traced_megabytes(build):
+    """(result of build(), MB still allocated by it afterwards) under tracemalloc."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        return built, round((tracemalloc.get_traced_memory()[0] - before) / 1e6, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run_size(size: int, args) -> list[dict]:
+    from service.metric_serice import (
+        get_deals_metrics, calculate_weekly_spreadsheet_metrics, calculate_weekly_metrics_for_weeks
+    )
+    from service.deal_model import DealSet
+    from service.supabase_serice import insert_deals_in_supabase, fetch_all_deals
+    from service.zoho_service import get_all_deals_with_stage_history
+    from utils.utils import get_weeks_for_offsets
+
+    deals = generate_deals(size, seed=args.seed)
+    results = []
+    selected = set(args.only.split(",")) if args.only else set(BENCHMARKS)
+
+    if "zoho_fetch" in selected:
+        adapter = install_zoho_stub(deals, latency=args.zoho_latency)
+        runs = timed(lambda: get_all_deals_with_stage_history(workers=args.workers), args.repeat)
+        results.append(result("zoho_fetch", size, runs, {"requests_per_run": adapter.requests // args.repeat},
+                              workers=args.workers, latency=args.zoho_latency))
+
+    db_kind = "postgres" if args.db_url else "fake"
+    if "db_upsert" in selected:
+        # Half the ids are already stored, so the first run times inserts and updates
+        # (the later runs only update); the stage transitions and weekly aggregates are written too
+        install_database(deals[: size // 2], args.db_url)
+        records = [dict(to_zoho_record(deal), stage_history=deal["stage_history"]) for deal in deals]
+        upserts = []
+        runs = timed(lambda: upserts.append(insert_deals_in_supabase(records)), args.repeat)
+        results.append(result("db_upsert", size, runs, {"first_run_" + key: value for key, value in upserts[0].items()},
+                              db=db_kind))
+
+    if "db_fetch" in selected:
+        install_database(deals, args.db_url)
+        runs = timed(lambda: fetch_all_deals(), args.repeat)
+        results.append(result("db_fetch", size, runs, db=db_kind))
+
+    if "deal_set_memory" in selected:
+        # deals.json repeated up to `size` deals (400000 = the sample scaled 1000x): the rows
+        # as a list versus the DealSet loaded from them one at a time
+        rows, rows_mb = traced_megabytes(lambda: list(iter_sample_deals(size)))
+        del rows
+        deal_set, deal_set_mb = traced_megabytes(lambda: DealSet.from_records(iter_sample_deals(size)))
+        del deal_set
+        runs = timed(lambda: DealSet.from_records(iter_sample_deals(size)), args.repeat)
+        results.append(result("deal_set_memory", size, runs, {"rows_mb": rows_mb, "deal_set_mb": deal_set_mb},
+                              source="deals.json"))
+
+    # The metrics run on a DealSet loaded once, like the routes and the CLI do
+    rows = [to_db_row(deal) for deal in deals]
+    if "deal_set_load" in selected:
+        runs = timed(lambda: DealSet.from_records(rows), args.repeat)
+        results.append(result("deal_set_load", size, runs))
+    deal_set = DealSet.from_records(rows)
+    del rows
+    engines = args.engines.split(",")
+    if "deal_columns_load" in selected and "numpy" in engines:
+        from service.metric_vectorized import DealColumns
+
+        # Paid by the first numpy call on a DealSet only: the columns are kept on it
+        runs = timed(lambda: DealColumns(deal_set), args.repeat)
+        results.append(result("deal_columns_load", size, runs))
+    for engine in engines:
+        if "deals_metrics" in selected:
+            runs = timed(lambda: get_deals_metrics(deal_set, engine=engine), args.repeat)
+            results.append(result("deals_metrics", size, runs, engine=engine, input="deal_set"))
+        if "weekly_metrics" in selected:
+            runs = timed(lambda: calculate_weekly_spreadsheet_metrics(deal_set, week_offset=1, engine=engine),
+                         args.repeat)
+            results.append(result("weekly_metrics", size, runs, engine=engine, input="deal_set"))
+        if "weekly_backfill" in selected:
+            weeks = get_weeks_for_offsets(0, 51)
+            runs = timed(lambda: calculate_weekly_metrics_for_weeks(deal_set, weeks, engine=engine), args.repeat)
+            results.append(result("weekly_backfill", size, runs, engine=engine, weeks=len(weeks), input="deal_set"))
+
+    if "gsheet_export" in selected:
+        from service.spreadsheet_service import insert_deals_to_gsheet, flatten_deal_for_sheet
+
+        records = [to_zoho_record(deal) for deal in deals]
+        # Half the deals are already on the sheet, a tenth of those with a new stage
+        existing = [flatten_deal_for_sheet(record) for record in records[: size // 2]]
+        for row in existing[::10]:
+            row[3] = "Stale Stage"
+        worksheets = []
+
+        def export():
+            with gsheet_stub(existing, latency=args.sheet_latency) as worksheet:
+                worksheets.append(worksheet)
+                insert_deals_to_gsheet(records)
+
+        runs = timed(export, args.repeat)
+        results.append(result("gsheet_export", size, runs, {"requests_per_run": worksheets[-1].requests},
+                              latency=args.sheet_latency))
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sync, upsert, metrics and sheet export paths")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma separated deal counts, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help=f"Comma separated subset of {','.join(BENCHMARKS)}")
+    default_engines = "python,numpy" if importlib.util.find_spec("numpy") else "python"
+    parser.add_argument("--engines", default=default_engines, help="Metric engines to time")
+    parser.add_argument("--workers", type=int, default=8, help="Stage history workers for zoho_fetch")
+    parser.add_argument("--zoho-latency", type=float, default=0.0, help="Seconds added to every stub Zoho request")
+    parser.add_argument("--sheet-latency", type=float, default=0.0, help="Seconds added to every stub Sheets request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "benchmark_results.json"))
+    args = parser.parse_args()
+    args.db_url = os.getenv("BENCH_DB_URL")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+    for size in sizes:
+        for entry in run_size(size, args):
+            params = " ".join(f"{key}={value}" for key, value in {**entry["params"], **entry["counters"]}.items())
+            print(f"{entry['name']:<16} {size:>8} deals  best {entry['best'] * 1000:10.1f}ms  "
+                  f"{entry['per_deal_us']:8.2f}us/deal  {params}")
+            results.append(entry)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "db": "postgres" if args.db_url else "fake",
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+# Local stand-ins for the services the hot paths talk to, so the benchmarks
+# run without network or credentials:
+# - Zoho: a requests adapter (or an ASGI app for the async client, or an HTTP
+#   server on a local socket) serving Pipelines pages and Stage_History from
+#   generated deals
+# - Postgres: an in-memory fake pool, or a real database when BENCH_DB_URL is set
+# - gspread: an in-memory worksheet
+import asyncio
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from psycopg2 import sql
+from psycopg2.extensions import adapt
+from requests.adapters import BaseAdapter
+
+from benchmarks.synthetic import to_zoho_record, to_db_row
+
+ZOHO_STUB_BASE_URL = "http://zoho.stub/bigin/v2/"
+
+
+# === Zoho ===
+
+class ZohoStub:
+    """
+    Answers Pipelines, Pipelines/{id}/Stage_History and the Pipelines fields like
+    the Bigin API. With an If-Modified-Since header the Pipelines pages only hold
+    the records modified after it, and a 304 answers when there are none.
+    """
+
+    def __init__(self, deals: list[dict], page_size: int = 200, latency: float = 0.0):
+        self.records = [to_zoho_record(deal) for deal in deals]
+        self.histories = {str(deal["id"]): deal["stage_history"] for deal in deals}
+        self.page_size = page_size
+        self.latency = latency
+        self.requests = 0
+        self.history_requests = 0
+        self._count_lock = threading.Lock()
+        # deal id -> status code its Stage_History request fails with
+        self.history_errors = {}
+        # If-Modified-Since of every Pipelines request (None when absent)
+        self.modified_since = []
+
+    def answer(self, path: str, query: str, headers: dict = None) -> tuple[int, dict]:
+        """(status code, JSON body) for a GET of the URL `path` with `query` and `headers`."""
+        with self._count_lock:
+            self.requests += 1
+        parts = path[len(urlsplit(ZOHO_STUB_BASE_URL).path):].split("/")
+
+        if parts == ["Pipelines"]:
+            modified_since = (headers or {}).get("If-Modified-Since")
+            self.modified_since.append(modified_since)
+            records = self.records
+            if modified_since:
+                since = datetime.fromisoformat(modified_since)
+                records = [record for record in records if datetime.fromisoformat(record["Modified_Time"]) > since]
+                if not records:
+                    return 304, {}
+
+            page = int(parse_qs(query).get("page_token", ["0"])[0])
+            start = page * self.page_size
+            more = start + self.page_size < len(records)
+            body = {
+                "data": records[start:start + self.page_size],
+                "info": {"next_page_token": str(page + 1) if more else None, "more_records": more},
+            }
+            return (200 if records else 204), body
+        if len(parts) == 3 and parts[0] == "Pipelines" and parts[2] == "Stage_History":
+            with self._count_lock:
+                self.history_requests += 1
+            if parts[1] in self.history_errors:
+                return self.history_errors[parts[1]], {"code": "INTERNAL_ERROR"}
+            return 200, {"data": self.histories.get(parts[1], [])}
+        if parts == ["settings", "fields"]:
+            return 200, {"fields": STUB_PIPELINE_FIELDS}
+        return 404, {"code": "INVALID_URL_PATTERN"}
+
+
+STUB_PIPELINE_FIELDS = [
+    {"api_name": "Deal_Name", "field_label": "Deal Name"},
+    {"api_name": "Stage", "field_label": "Stage", "pick_list_values": [{"display_value": "Qualification"}]},
+    {"api_name": "Amount", "field_label": "Amount"},
+]
+
+
+class ZohoStubAdapter(ZohoStub, BaseAdapter):
+    """ZohoStub as a requests adapter, answering after `latency` seconds."""
+
+    def __init__(self, deals: list[dict], page_size: int = 200, latency: float = 0.0):
+        BaseAdapter.__init__(self)
+        ZohoStub.__init__(self, deals, page_size, latency)
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(request.url)
+        status, body = self.answer(url.path, url.query, request.headers)
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode() if status not in (204, 304) else b""
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+class ZohoStubApp(ZohoStub):
+    """ZohoStub as an ASGI app (for httpx.ASGITransport), answering after `latency` seconds without blocking the loop."""
+
+    async def __call__(self, scope, receive, send):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        headers = {name.decode().title(): value.decode() for name, value in scope["headers"]}
+        status, body = self.answer(scope["path"], scope["query_string"].decode(), headers)
+        content = json.dumps(body).encode() if status not in (204, 304) else b""
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": content})
+
+
+class ZohoStubServer(ZohoStub):
+    """
+    ZohoStub behind a threaded HTTP/1.1 server on 127.0.0.1, so requests go
+    through real sockets and the client's connection pool. Counts the
+    connections opened and the most requests it was answering at once.
+    """
+
+    def __init__(self, deals: list[dict], page_size: int = 200, latency: float = 0.0):
+        super().__init__(deals, page_size, latency)
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                with stub._count_lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                stub.serve(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}{urlsplit(ZOHO_STUB_BASE_URL).path}"
+
+    def serve(self, handler: BaseHTTPRequestHandler):
+        with self._count_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            url = urlsplit(handler.path)
+            status, body = self.answer(url.path, url.query, handler.headers)
+        finally:
+            with self._count_lock:
+                self.in_flight -= 1
+
+        content = json.dumps(body).encode() if status not in (204, 304) else b""
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+def install_zoho_client(base_url: str = ZOHO_STUB_BASE_URL):
+    """Make a ZohoClient for `base_url` (no rate limit, no cache) the process-wide one, with valid tokens."""
+    from service import zoho_client
+    from service.zoho_cache import ResponseCache
+    from service.zoho_service import token_manager
+
+    client = zoho_client.ZohoClient(
+        base_url=base_url,
+        rate_limiter=zoho_client.RateLimiter(rate=1e9, burst=10 ** 9),
+        cache=ResponseCache(mode="off"),
+    )
+    zoho_client._client = client
+    token_manager._tokens = {"access_token": "benchmark", "refresh_token": "benchmark", "expiry_time": time.time() + 86400}
+    return client
+
+
+def install_zoho_stub(deals: list[dict], page_size: int = 200, latency: float = 0.0) -> ZohoStubAdapter:
+    """Point the process-wide ZohoClient at a stub of the Bigin API (no rate limit, no cache)."""
+    adapter = ZohoStubAdapter(deals, page_size, latency)
+    install_zoho_client().session.mount(ZOHO_STUB_BASE_URL, adapter)
+    return adapter
+
+
+@contextmanager
+def zoho_stub_server(deals: list[dict], page_size: int = 200, latency: float = 0.0):
+    """
+    Serve a stub of the Bigin API on a local port and point the process-wide
+    ZohoClient at it; yields the ZohoStubServer and stops it on exit.
+    """
+    server = ZohoStubServer(deals, page_size, latency)
+    thread = threading.Thread(target=server.httpd.serve_forever, args=(0.05,), name="zoho-stub-server", daemon=True)
+    thread.start()
+    client = install_zoho_client(server.base_url)
+    try:
+        yield server
+    finally:
+        client.session.close()
+        server.httpd.shutdown()
+        server.httpd.server_close()
+        thread.join()
+
+
+def install_async_zoho_stub(deals: list[dict], page_size: int = 200, latency: float = 0.0,
+                            max_retries: int = 0) -> ZohoStubApp:
+    """
+    Point the async routes at an ASGI stub of the Bigin API (no rate limit, no
+    cache). Call it from the event loop the routes run on.
+    """
+    import httpx
+    from service import zoho_client
+    from service.zoho_async_service import AsyncZohoClient, set_async_zoho_client
+    from service.zoho_cache import ResponseCache
+    from service.zoho_service import token_manager
+
+    app = ZohoStubApp(deals, page_size, latency)
+    set_async_zoho_client(AsyncZohoClient(
+        base_url=ZOHO_STUB_BASE_URL,
+        max_retries=max_retries,
+        rate_limiter=zoho_client.RateLimiter(rate=1e9, burst=10 ** 9),
+        transport=httpx.ASGITransport(app=app),
+        cache=ResponseCache(mode="off"),
+    ))
+    token_manager._tokens = {"access_token": "benchmark", "refresh_token": "benchmark", "expiry_time": time.time() + 86400}
+    return app
+
+
+# === Postgres ===
+
+# SELECT <columns> FROM "Bigin"."deals" WHERE id = ANY(%s): the reads by id
+# (stored fingerprints, rows read back for the weekly aggregates)
+SELECT_BY_IDS = re.compile(r'SELECT (.+?) FROM "Bigin"\."deals" WHERE "?id"? = ANY\(%s\)')
+
+
+def quote_value(value) -> bytes:
+    """`value` as an SQL literal, quoted without a connection."""
+    adapted = adapt(value)
+    if hasattr(adapted, "encoding"):
+        adapted.encoding = "utf8"
+    return adapted.getquoted()
+
+
+def render_query(query: sql.Composable) -> str:
+    """
+    The text of a psycopg2.sql statement for the fakes: Composable.as_string
+    needs a real connection to quote identifiers and literals.
+    """
+    if isinstance(query, sql.Composed):
+        return "".join(render_query(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join('"' + name.replace('"', '""') + '"' for name in query.strings)
+    if isinstance(query, sql.Literal):
+        return quote_value(query.wrapped).decode()
+    if isinstance(query, sql.Placeholder):
+        return "%s" if query.name is None else f"%({query.name})s"
+    raise TypeError(f"Can't render {query!r}")
+
+
+class FakeCursor:
+    """
+    Models the Bigin.deals table of its FakeDatabase for the statements the
+    services send: the multi-row upsert (execute_values) stores its rows and
+    answers RETURNING (xmax = 0) with True for new ids and False for stored
+    ones; reads by id, MAX(modified_time) and a named cursor (iter_deals)
+    answer from the stored rows. Every other statement is accepted and
+    returns nothing.
+    """
+
+    def __init__(self, connection, name=None):
+        self.connection = connection
+        self.name = name
+        self.itersize = 2000
+        self.description = None
+        self._rows = []
+        self._values = []
+
+    def mogrify(self, template, args=None):
+        if isinstance(template, sql.Composable):
+            template = render_query(template)
+        if isinstance(template, str):
+            template = template.encode()
+        if args is None:
+            return template
+        self._values.append(args)
+        return template % tuple(quote_value(value) for value in args)
+
+    def execute(self, query, params=None):
+        database = self.connection.database
+        database.statements += 1
+        if isinstance(query, sql.Composable):
+            query = render_query(query)
+        if isinstance(query, bytes):
+            query = query.decode()
+        values, self._values = self._values, []
+        self._rows = []
+
+        if self.name:
+            self.description = [(column,) for column in database.columns]
+            self._rows = [tuple(row[column] for column in database.columns) for row in database.deals.values()]
+        elif query.startswith('INSERT INTO "Bigin"."deals"'):
+            for row in values:
+                row = dict(zip(database.columns, row))
+                self._rows.append((row["id"] not in database.deals,))
+                database.deals[row["id"]] = row
+        elif query.startswith("SELECT MAX(modified_time)"):
+            self._rows = [(max((row["modified_time"] for row in database.deals.values() if row["modified_time"]),
+                               default=None),)]
+        else:
+            match = SELECT_BY_IDS.match(query)
+            if match:
+                columns = [column.strip().strip('"') for column in match.group(1).split(",")]
+                ids = params[0]
+                self._rows = [
+                    tuple(database.deals[deal_id][column] for column in columns)
+                    for deal_id in ids if deal_id in database.deals
+                ]
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    encoding = "UTF8"
+    closed = 0
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeDatabase:
+    """In-memory stand-in for the connection pool; `deals` are the stored rows, by id."""
+
+    def __init__(self, deals: list[dict] = None):
+        from service.supabase_serice import DEAL_COLUMNS
+        self.columns = DEAL_COLUMNS
+        self.deals = {deal["id"]: to_db_row(deal) for deal in deals or []}
+        self.statements = 0
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+    def stats(self) -> dict:
+        return {"statements": self.statements}
+
+
+BENCH_DEALS_DDL = """
+CREATE SCHEMA IF NOT EXISTS "Bigin";
+CREATE TABLE IF NOT EXISTS "Bigin"."deals" (
+    id bigint PRIMARY KEY,
+    deal_name text,
+    amount text,
+    stage text,
+    contact_id bigint,
+    contact_name text,
+    closing_date date,
+    stage_history text,
+    pipeline text,
+    created_time timestamptz,
+    modified_time timestamptz
+)
+"""
+
+
+def install_database(deals: list[dict], db_url: str = None):
+    """
+    Use a real Postgres at `db_url` (its Bigin.deals table is created if needed
+    and gets the benchmark rows, so use a scratch database), or else an
+    in-memory FakeDatabase preloaded with `deals`. Returns the fake or the pool.
+    """
+    from service import db_pool
+
+    if db_url:
+        pool = db_pool.ConnectionPool(db_url)
+        with pool.connection() as connection, connection.cursor() as cursor:
+            cursor.execute(BENCH_DEALS_DDL)
+        db_pool._pool = pool
+        return pool
+
+    database = FakeDatabase(deals)
+    db_pool._pool = database
+    return database
+
+
+# === gspread ===
+
+class FakeWorksheet:
+    def __init__(self, header: list, rows: list[list] = None, latency: float = 0.0):
+        self.header = header
+        self.rows = [list(row) for row in rows or []]
+        self.latency = latency
+        self.requests = 0
+
+    def _request(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_records(self):
+        self._request()
+        return [dict(zip(self.header, row)) for row in self.rows]
+
+    def batch_update(self, data):
+        self._request()
+        for update in data:
+            # "A12:H12" -> data row 12 - 2
+            row_index = int(update["range"].split(":")[0][1:]) - 2
+            self.rows[row_index] = ["" if value is None else value for value in update["values"][0]]
+
+    def append_rows(self, rows):
+        self._request()
+        self.rows.extend(["" if value is None else value for value in row] for row in rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet: FakeWorksheet):
+        self._worksheet = worksheet
+
+    def worksheet(self, title):
+        return self._worksheet
+
+
+class FakeGsheetClient:
+    def __init__(self, worksheet: FakeWorksheet):
+        self.worksheet = worksheet
+
+    def open_by_key(self, key):
+        return FakeSpreadsheet(self.worksheet)
+
+
+@contextmanager
+def gsheet_stub(existing_rows: list[list] = None, latency: float = 0.0):
+    """
+    Make insert_deals_to_gsheet write to an in-memory worksheet holding `existing_rows`;
+    yields the FakeWorksheet and puts the real gspread client back on exit.
+    """
+    from service import spreadsheet_service
+
+    worksheet = FakeWorksheet(spreadsheet_service.DEAL_SHEET_COLUMNS, existing_rows, latency)
+    original = spreadsheet_service.get_gsheet_client
+    spreadsheet_service.get_gsheet_client = lambda: FakeGsheetClient(worksheet)
+    try:
+        yield worksheet
+    finally:
+        spreadsheet_service.get_gsheet_client = original
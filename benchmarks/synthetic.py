@@ -0,0 +1,129 @@
+# Synthetic deals shaped like deals.json (Bigin.Deals rows) and like the
+# Pipelines records the Zoho API returns, for any number of deals.
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from utils.constants import (
+    CLOSED_QUAL_LOST, CLOSED_SALES_LOST, CLOSED_SLOWMO_LOST,
+    CLOSED_QUAL_POSITIVE, CLOSED_SALES_POSITIVE, CLOSED_SLOWMO_POSITIVE
+)
+
+# Pipeline mix and open stages roughly as in deals.json
+PIPELINE_WEIGHTS = {"Qual": 84, "Sales": 12, "SloMo": 3, "Partnerships": 1}
+OPEN_STAGES = {
+    "Qual": ["Replied", "No Reply", "Not Interested", "Different Person Connected", "Duplicates", "Interested"],
+    "Sales": ["Qualified", "Book Meeting", "Ask Data / Integrate", "Establish ROI / Urgency",
+              "Proposal / Pricing", "Reach Decision Maker", "Redtape", "Meeting No Show"],
+    "SloMo": ["Introduction", "Connect Later", "Waiting On 1st Call", "Habit Formation"],
+    "Partnerships": ["Introduction", "First Use", "Implementation"],
+}
+CLOSED_STAGES = {
+    "Qual": CLOSED_QUAL_LOST + CLOSED_QUAL_POSITIVE,
+    "Sales": CLOSED_SALES_LOST + CLOSED_SALES_POSITIVE,
+    "SloMo": CLOSED_SLOWMO_LOST + CLOSED_SLOWMO_POSITIVE,
+    "Partnerships": [],
+}
+IST = timezone(timedelta(hours=5, minutes=30))
+BASE_ID = 869438000000000000
+
+
+def generate_deals(count: int, seed: int = 0, days: int = 365, end: datetime = None) -> list[dict]:
+    """
+    `count` deals as stored in Bigin.Deals (the shape of deals.json), created
+    over the `days` days before `end`, each with 1-7 stage transitions
+    (newest first, like Zoho returns them) ending in its current stage.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc)
+    pipelines = list(PIPELINE_WEIGHTS)
+    weights = list(PIPELINE_WEIGHTS.values())
+    deals = []
+    for i in range(count):
+        deal_id = BASE_ID + i * 7
+        pipeline = rng.choices(pipelines, weights)[0]
+        created = end - timedelta(seconds=rng.randrange(days * 86400))
+
+        transitions = rng.choices([1, 2, 3, 4, 5, 6, 7], [14, 56, 12, 8, 5, 3, 2])[0]
+        moment = created
+        history = []
+        for step in range(transitions):
+            if step:
+                moment = min(moment + timedelta(seconds=rng.randrange(14 * 86400)), end)
+            last = step == transitions - 1
+            if last and CLOSED_STAGES[pipeline] and rng.random() < 0.6:
+                stage = rng.choice(CLOSED_STAGES[pipeline])
+            else:
+                stage = rng.choice(OPEN_STAGES[pipeline])
+            history.append({
+                "id": str(deal_id + 100000 + step),
+                "Stage": stage,
+                "Modified_Time": moment.astimezone(IST).isoformat(timespec="seconds"),
+            })
+        history.reverse()
+
+        closing = moment + timedelta(days=rng.randrange(-10, 30))
+        deals.append({
+            "id": deal_id,
+            "deal_name": f"[Li] Company {i}",
+            "amount": str(rng.randrange(1000, 20000, 500)) if rng.random() < 0.2 else None,
+            "stage": history[0]["Stage"],
+            "contact_id": BASE_ID + 500000 + i,
+            "contact_name": f"Contact {i}",
+            "stage_history": history,
+            "closing_date": closing.date().isoformat() if rng.random() < 0.5 else None,
+            "pipeline": pipeline,
+            "created_time": created.isoformat(sep=" ", timespec="seconds"),
+            "modified_time": moment.astimezone(timezone.utc).isoformat(sep=" ", timespec="seconds"),
+        })
+    return deals
+
+
+def to_zoho_record(deal: dict) -> dict:
+    """A generated deal as a Zoho Pipelines record (without its stage history)."""
+    created = datetime.fromisoformat(deal["created_time"]).astimezone(IST)
+    modified = datetime.fromisoformat(deal["modified_time"]).astimezone(IST)
+    return {
+        "id": str(deal["id"]),
+        "Deal_Name": deal["deal_name"],
+        "Amount": deal["amount"],
+        "Stage": deal["stage"],
+        "Closing_Date": deal["closing_date"],
+        "Contact_Name": {"id": str(deal["contact_id"]), "name": deal["contact_name"]},
+        "Pipeline": {"name": deal["pipeline"], "id": "8694380000001"},
+        "Created_Time": created.isoformat(timespec="seconds"),
+        "Modified_Time": modified.isoformat(timespec="seconds"),
+    }
+
+
+def to_db_row(deal: dict) -> dict:
+    """A generated deal as fetch_all_deals returns it (datetimes parsed, stage_history as JSON text)."""
+    return dict(
+        deal,
+        stage_history=json.dumps(deal["stage_history"]),
+        created_time=datetime.fromisoformat(deal["created_time"]),
+        modified_time=datetime.fromisoformat(deal["modified_time"]),
+    )
+
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deals.json")
+# The deals.json ids span less than this, so the ids of the copies never collide
+SAMPLE_ID_STRIDE = 10_000_000
+
+
+def iter_sample_deals(count: int, path: str = SAMPLE_FILE):
+    """
+    Yield `count` deals by repeating the deals.json sample, each copy parsed
+    afresh (so no two copies share objects) and given new ids.
+    """
+    with open(path) as f:
+        text = f.read()
+    copy = 0
+    while count > 0:
+        deals = json.loads(text)[:count]
+        for deal in deals:
+            deal["id"] += copy * SAMPLE_ID_STRIDE
+        yield from deals
+        count -= len(deals)
+        copy += 1
@@ -0,0 +1,180 @@
+import argparse
+import json
+from datetime import datetime
+
+from utils.utils import get_weeks_for_offsets, get_weeks_for_months
+
+
+def parse_range(value: str):
+    """"3" -> (3, 3), "0-51" -> (0, 51)"""
+    first, _, last = value.partition("-")
+    return int(first), int(last or first)
+
+
+def parse_month_range(value: str):
+    """"2025-09" or "2025-01:2025-09" -> (first day of start month, first day of end month)"""
+    first, _, last = value.partition(":")
+    start = datetime.strptime(first, "%Y-%m").date()
+    end = datetime.strptime(last, "%Y-%m").date() if last else start
+    return start, end
+
+
+def write_metrics(metrics, args):
+    if args.compact:
+        from service.metric_export import export_weekly_metrics
+        export_weekly_metrics(metrics, args.output)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(metrics, f, default=str, indent=2)
+
+
+def weeks_from_args(args):
+    if args.months:
+        return get_weeks_for_months(*parse_month_range(args.months))
+    return get_weeks_for_offsets(*parse_range(args.weeks))
+
+
+def stored_weekly_metrics(weeks, source: str):
+    """Weekly metrics for `weeks` from the stage_transitions query ("sql") or the stored buckets ("aggregates")."""
+    if source == "sql":
+        from service.metric_sql import aggregate_weekly_metrics_sql
+        return aggregate_weekly_metrics_sql(weeks)
+    from service.weekly_aggregates import aggregate_weekly_metrics_stored
+    return aggregate_weekly_metrics_stored(weeks)
+
+
+def backfill(args):
+    from service.metric_serice import calculate_weekly_metrics_for_weeks
+    from service.supabase_serice import fetch_deals_for_weeks
+
+    weeks = weeks_from_args(args)
+    if args.source != "deals":
+        metrics = {week["name"]: results for week, results in zip(weeks, stored_weekly_metrics(weeks, args.source))}
+    else:
+        if args.input:
+            from service.deal_model import DealSet
+
+            # Only the DealSet is kept, the parsed JSON is dropped once it is loaded
+            with open(args.input) as f:
+                deals = DealSet.from_records(json.load(f))
+        else:
+            deals = fetch_deals_for_weeks(weeks)
+        metrics = calculate_weekly_metrics_for_weeks(deals, weeks)
+
+    write_metrics(metrics, args)
+    print(f"Metrics for {len(metrics)} weeks written to {args.output}")
+
+
+def export_weekly(args):
+    from service.metric_serice import calculate_weekly_spreadsheet_metrics
+    from service.supabase_serice import fetch_deals_for_weeks
+    from utils.utils import get_week_data
+
+    week_data = get_week_data(args.week_offset)
+    if args.source != "deals":
+        metrics = stored_weekly_metrics([week_data], args.source)[0]
+    else:
+        deals = fetch_deals_for_weeks([week_data])
+        metrics = calculate_weekly_spreadsheet_metrics(deals, args.week_offset)
+    write_metrics(metrics, args)
+    print(f"Weekly metrics written to {args.output}")
+
+
+def expand_metrics(args):
+    from service.metric_export import load_weekly_metrics
+
+    metrics = load_weekly_metrics(args.input)
+    with open(args.output, "w") as f:
+        json.dump(metrics, f, default=str, indent=2)
+    print(f"Weekly metrics written to {args.output}")
+
+
+def rebuild_transitions(args):
+    from service.supabase_serice import rebuild_stage_transitions
+
+    rebuild_stage_transitions()
+
+
+def rebuild_aggregates(args):
+    from service.weekly_aggregates import rebuild_weekly_aggregates
+
+    rebuild_weekly_aggregates()
+
+
+def check_aggregates(args):
+    from service.weekly_aggregates import check_weekly_aggregates
+
+    weeks = weeks_from_args(args)
+    mismatches = check_weekly_aggregates(weeks)
+    for mismatch in mismatches:
+        print(f"{mismatch['week']} {mismatch['pipeline']} {mismatch['metric']}: "
+              f"missing {mismatch['missing']}, unexpected {mismatch['unexpected']}")
+    print(f"{len(weeks)} weeks checked, {len(mismatches)} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def add_compact_argument(parser):
+    parser.add_argument("--compact", action="store_true",
+                        help="Store deal ids in the lists and each deal once; "
+                             "an --output ending in .gz is gzipped, .msgpack is MessagePack")
+
+
+def add_period_arguments(parser):
+    period = parser.add_mutually_exclusive_group(required=True)
+    period.add_argument("--weeks", help="Week offset or range of offsets, e.g. 0-51 (0 = current week)")
+    period.add_argument("--months", help="Month or range of months, e.g. 2025-01:2025-09")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bigin sales automation batch jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Compute weekly metrics for a range of weeks or months")
+    add_period_arguments(backfill_parser)
+    backfill_parser.add_argument("--input", help="Read deals from a JSON dump (like deals.json) instead of the database")
+    backfill_parser.add_argument("--output", default="weekly_metrics_backfill.json")
+    backfill_parser.add_argument("--source", choices=["deals", "sql", "aggregates"], default="deals",
+                                 help="sql: aggregate query over Bigin.stage_transitions, "
+                                      "aggregates: Bigin.weekly_pipeline_metrics (both ignore --input)")
+    add_compact_argument(backfill_parser)
+    backfill_parser.set_defaults(func=backfill)
+
+    export_parser = subparsers.add_parser("export-weekly", help="Export one week's metrics to JSON")
+    export_parser.add_argument("--week-offset", type=int, default=1, help="0 = current week, 1 = last week, ...")
+    export_parser.add_argument("--output", default="weekly_metrics.json")
+    export_parser.add_argument("--source", choices=["deals", "sql", "aggregates"], default="deals",
+                               help="sql: aggregate query over Bigin.stage_transitions, "
+                                    "aggregates: Bigin.weekly_pipeline_metrics")
+    add_compact_argument(export_parser)
+    export_parser.set_defaults(func=export_weekly)
+
+    expand_parser = subparsers.add_parser(
+        "expand-metrics", help="Turn a --compact export back into the plain weekly metrics JSON"
+    )
+    expand_parser.add_argument("--input", required=True)
+    expand_parser.add_argument("--output", default="weekly_metrics.json")
+    expand_parser.set_defaults(func=expand_metrics)
+
+    transitions_parser = subparsers.add_parser(
+        "rebuild-transitions", help="Create Bigin.stage_transitions and refill it from the stored stage histories"
+    )
+    transitions_parser.set_defaults(func=rebuild_transitions)
+
+    rebuild_parser = subparsers.add_parser(
+        "rebuild-aggregates", help="Recompute Bigin.weekly_pipeline_metrics from the deals table"
+    )
+    rebuild_parser.set_defaults(func=rebuild_aggregates)
+
+    check_parser = subparsers.add_parser(
+        "check-aggregates", help="Compare Bigin.weekly_pipeline_metrics with the metrics computed from the deals"
+    )
+    add_period_arguments(check_parser)
+    check_parser.set_defaults(func=check_aggregates)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
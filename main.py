@@ -1,22 +1,35 @@
-import json
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from routes import zoho_routes
-from utils.utils import get_time_stamp,get_week_data
-from service.supabase_serice import insert_deals_in_supabase,fetch_all_deals
-from service.metric_serice import calculate_weekly_spreadsheet_metrics, format_metrics_for_spreadsheet
-app = FastAPI()
 
-# Include Zoho routes
-# app.include_router(zoho_routes.router)
+from utils.instrumentation import span
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    from service.zoho_async_service import close_async_zoho_client
+    await close_async_zoho_client()
+
 
-data = fetch_all_deals()
-week_data = get_week_data(previous_week_count=0)
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI app. Nothing here touches the network or the database:
+    DB connections, the Zoho client and tokens are all set up on first use.
+    The weekly metrics export lives in cli.py (python cli.py export-weekly).
+    """
+    # Import and router setup time, as the app_create span of GET /metrics
+    with span("app_create"):
+        from routes import zoho_routes, metrics_routes, observability_routes
 
-data = calculate_weekly_spreadsheet_metrics(data, 1)
-print(data)
-with open('weekly_metrics.json', 'w') as f:
-    json.dump(data, f, default=str, indent=2)
+        app = FastAPI(lifespan=lifespan)
 
+        # Include Zoho, metrics and /metrics (Prometheus) routes
+        app.include_router(zoho_routes.router)
+        app.include_router(metrics_routes.router)
+        app.include_router(observability_routes.router)
 
+    return app
 
 
+app = create_app()
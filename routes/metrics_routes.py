@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from datetime import date
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+
+from service.metric_serice import get_deals_metrics, calculate_weekly_spreadsheet_metrics, PIPELINES
+from service.supabase_serice import fetch_deal_set, fetch_deals_for_weeks
+from utils.auth import require_api_key
+from utils.cache import TTLCache, get_data_version, on_data_version_change
+from utils.utils import get_week_data
+
+METRICS_CACHE_TTL = int(os.getenv("METRICS_CACHE_TTL", "300"))
+METRICS_CACHE_SIZE = int(os.getenv("METRICS_CACHE_SIZE", "64"))
+# "deals" computes the weekly metrics in Python from the deals rows,
+# "sql" runs the aggregate query over Bigin.stage_transitions (see service.metric_sql),
+# "aggregates" reads the buckets the sync keeps in Bigin.weekly_pipeline_metrics
+WEEKLY_METRICS_SOURCE = os.getenv("WEEKLY_METRICS_SOURCE", "deals")
+
+router = APIRouter()
+# The metrics carry deal rows (names, contacts, amounts): same X-API-Key as the Zoho routes
+protected = [Depends(require_api_key)]
+
+# (endpoint, week, pipeline, data version) -> (etag, json body)
+metrics_cache = TTLCache(maxsize=METRICS_CACHE_SIZE, ttl=METRICS_CACHE_TTL)
+on_data_version_change(lambda version: metrics_cache.clear())
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match check with the weak comparison RFC 9110 asks for: a list of
+    entity tags matches if any of them, W/ prefix ignored, is `etag`, and * matches anything.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def cached_metrics_response(key: tuple, compute, if_none_match: str = None) -> Response:
+    """
+    Serve `compute()` as JSON from the metrics cache, with an ETag of the body.
+    A matching If-None-Match gets an empty 304.
+    """
+    key = key + (get_data_version(),)
+    cached = metrics_cache.get(key)
+    if cached is None:
+        body = json.dumps(compute(), default=str)
+        etag = '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+        cached = (etag, body)
+        metrics_cache.set(key, cached)
+
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def check_pipeline(pipeline: str):
+    if pipeline and pipeline not in PIPELINES:
+        raise HTTPException(status_code=400, detail=f"Unknown pipeline '{pipeline}', expected one of {PIPELINES}")
+
+
+@router.get("/deal-metrics/current", dependencies=protected)
+def current_deal_metrics(pipeline: str = None, if_none_match: str = Header(None)):
+    """Totals, overdue and due today deals (get_deals_metrics), optionally for one pipeline."""
+    check_pipeline(pipeline)
+
+    def compute():
+        return get_deals_metrics(fetch_deal_set(pipeline=pipeline))
+
+    # Keyed on today's date because overdue / due today depend on it
+    return cached_metrics_response(("current", date.today().isoformat(), pipeline), compute, if_none_match)
+
+
+@router.get("/deal-metrics/weekly", dependencies=protected)
+def weekly_deal_metrics(week_offset: int = 0, pipeline: str = None, if_none_match: str = Header(None)):
+    """Weekly spreadsheet metrics for a week (0 = current week, 1 = last week, ...)."""
+    check_pipeline(pipeline)
+    week_data = get_week_data(week_offset)
+
+    def compute():
+        if WEEKLY_METRICS_SOURCE == "sql":
+            from service.metric_sql import aggregate_weekly_metrics_sql
+            metrics = aggregate_weekly_metrics_sql([week_data], pipeline)[0]
+        elif WEEKLY_METRICS_SOURCE == "aggregates":
+            from service.weekly_aggregates import aggregate_weekly_metrics_stored
+            metrics = aggregate_weekly_metrics_stored([week_data], pipeline)[0]
+        else:
+            deals = fetch_deals_for_weeks([week_data], pipeline=pipeline)
+            metrics = calculate_weekly_spreadsheet_metrics(deals, week_offset)
+        return [metric for metric in metrics if not pipeline or metric["pipeline"] == pipeline]
+
+    # Keyed on the week itself so the cache rolls over when the week changes
+    return cached_metrics_response(("weekly", week_data["name"], pipeline), compute, if_none_match)
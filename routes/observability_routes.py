@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from service.db_pool import pool_gauges
+from service.job_service import job_gauges
+from service.zoho_async_service import async_zoho_gauges
+from service.zoho_client import zoho_gauges
+from utils.auth import require_api_key
+from utils.instrumentation import register_gauge_source, render_prometheus
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter()
+
+for source in (pool_gauges, zoho_gauges, async_zoho_gauges, job_gauges):
+    register_gauge_source(source)
+
+
+# The job gauges and span names say what the service is doing: scrape with the X-API-Key header
+# once ADMIN_API_KEY is set (utils.auth)
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_api_key)])
+def prometheus_metrics():
+    """
+    Spans, counters and gauges in the Prometheus text format: Zoho requests,
+    DB statements, Sheets calls, metric phases, the connection pool, the Zoho
+    response cache and the running sync job.
+    """
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
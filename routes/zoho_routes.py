@@ -1,53 +1,116 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.responses import RedirectResponse
-from service.spreadsheet_service import insert_deals_to_gsheet
 from service.zoho_service import (
-    get_all_deals_with_stage_history,
-    get_all_stages,
     get_oauth_url,
     exchange_code_for_token,
-    get_all_deals,
     refresh_access_token
 )
-from service.supabase_serice import  insert_deals_in_supabase
-from utils.token import load_tokens
+from service.zoho_async_service import get_all_stages_async, get_all_deals_async
+from service.job_service import start_sync_job, get_job, list_jobs, cancel_job, SyncAlreadyRunning
+from utils.auth import api_key_matches, require_api_key, sign_token, verify_token
+from utils.cache import TTLCache
+from utils.instrumentation import JOB_PROFILERS
 
 router = APIRouter()
 
+# The routes need the X-API-Key header once ADMIN_API_KEY is set (utils.auth).
+# The OAuth flow runs in a browser, which can't send it: /oauth-link hands out
+# a one-time /get-oauth-code link, and the /auth callback is tied to that
+# /get-oauth-code call through a signed OAuth state.
+protected = [Depends(require_api_key)]
+OAUTH_LINK_TTL = 300
+OAUTH_STATE_TTL = 600
+# Links and states already used by this worker. The signature is checked by any
+# worker; this only stops replays within one worker
+used_tokens = TTLCache(maxsize=256, ttl=OAUTH_STATE_TTL)
+
+
+def use_token(purpose: str, token: str) -> bool:
+    """verify_token, and the token has not been used on this worker yet."""
+    if not verify_token(purpose, token) or used_tokens.get(token):
+        return False
+    used_tokens.set(token, True)
+    return True
+
+# Handlers that only wait on Zoho or touch in-memory state are async; the token
+# exchange/refresh ones block on requests.post and stay plain def (threadpool).
+# Token values are never sent back: they stay in keys/zoho_tokens.json.
+
+@router.get("/oauth-link", dependencies=protected)
+async def oauth_link(request: Request):
+    """A /get-oauth-code link that opens the Zoho consent once, without the X-API-Key header."""
+    url = request.url_for("oauth_redirect").include_query_params(ticket=sign_token("oauth-link", OAUTH_LINK_TTL))
+    return {"url": str(url), "expires_in": OAUTH_LINK_TTL}
+
 @router.get("/get-oauth-code")
-def oauth_redirect():
-    return RedirectResponse(url=get_oauth_url())
+async def oauth_redirect(ticket: str = None, x_api_key: str = Header(None)):
+    if not (api_key_matches(x_api_key) or use_token("oauth-link", ticket)):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-API-Key header or /oauth-link ticket")
+    return RedirectResponse(url=get_oauth_url(sign_token("oauth-state", OAUTH_STATE_TTL)))
 
 @router.get("/auth")
-def auth_callback(code: str):
-    token_data = exchange_code_for_token(code)
-    return {"message": "Tokens saved successfully", "token_data": token_data}
+def auth_callback(code: str, state: str = None):
+    if not use_token("oauth-state", state):
+        raise HTTPException(status_code=400, detail="Unknown or expired OAuth state, start again from /get-oauth-code")
+    try:
+        exchange_code_for_token(code)
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"message": "Tokens saved successfully"}
 
-@router.get("/refresh-token")
+@router.get("/refresh-token", dependencies=protected)
 def refresh_token_endpoint():
-    tokens = refresh_access_token(load_tokens().get("refresh_token"))
-    return {"message": "Token refreshed successfully", "tokens": tokens}
+    tokens = refresh_access_token()
+    return {"message": "Token refreshed successfully", "expiry_time": tokens["expiry_time"]}
 
-@router.get("/stages")
-def get_stages():
-    stages = get_all_stages()
+@router.get("/stages", dependencies=protected)
+async def get_stages():
+    stages = await get_all_stages_async()
     return {"stages": stages}
 
-@router.get("/deals")
-def get_deals():
-    deals = get_all_deals()
+@router.get("/deals", dependencies=protected)
+async def get_deals():
+    deals = await get_all_deals_async()
     return {"deals": deals}
 
-@router.get("/fetch-and-store-deals")
-def fetch_and_store_deals():
-    
-    print("Fetching and storing deals...")
-    deals = get_all_deals_with_stage_history()
-    print(f"Total deals fetched: {len(deals)}")
-    
-    insert_deals_in_supabase(deals)
-    print(f"Total deals stored: {len(deals)}")
+@router.get("/fetch-and-store-deals", status_code=202, dependencies=protected)
+async def fetch_and_store_deals(full_resync: bool = False, resume: bool = True, force_refetch: bool = False,
+                                profile: str = None):
+    """
+    Start a background sync of deals from Bigin into Supabase and return its job id.
+    By default only deals modified since the newest stored modified_time are
+    fetched; pass full_resync=true to re-download everything. An interrupted
+    sync continues from its last stored page unless resume=false.
+    Stage histories of unchanged deals are reused unless force_refetch=true.
+    profile=cprofile or profile=pyinstrument writes a profile of the job to PROFILE_DIR.
+    """
+    if profile and profile not in JOB_PROFILERS:
+        raise HTTPException(status_code=400, detail=f"Unknown profiler '{profile}', expected one of {JOB_PROFILERS}")
+    try:
+        job = start_sync_job(full_resync=full_resync, resume=resume, force_refetch=force_refetch, profile=profile)
+    except SyncAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job.id})
+
+    return {
+        "message": "Sync started.",
+        "job_id": job.id,
+        "status_url": f"/sync-jobs/{job.id}",
+    }
+
+@router.get("/sync-jobs", dependencies=protected)
+async def get_sync_jobs():
+    return {"jobs": [job.to_dict() for job in list_jobs()]}
 
-    
-    return {"message": f"{len(deals)} deals fetched and stored successfully."}
+@router.get("/sync-jobs/{job_id}", dependencies=protected)
+async def get_sync_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.to_dict()
 
+@router.post("/sync-jobs/{job_id}/cancel", dependencies=protected)
+async def cancel_sync_job(job_id: str):
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.to_dict()
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, sql
+from dotenv import load_dotenv
+load_dotenv()
+
+from utils.instrumentation import span
+
+DB_URL = os.getenv("DB_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Idle connections above the minimum are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# Connections are replaced after this many seconds, however busy they are
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Connections idle for longer than this are checked with SELECT 1 before use
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+
+
+# First word of a statement -> "verb" label of the db_execute spans; anything else is "other"
+STATEMENT_VERBS = {"select", "insert", "update", "delete", "with", "create", "alter", "drop", "truncate"}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class InstrumentedCursor(extensions.cursor):
+    """psycopg2 cursor timing every execute / executemany as a db_execute span, labelled by statement verb."""
+
+    def statement_verb(self, query) -> str:
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        if isinstance(query, bytes):
+            query = query[:32].decode("utf-8", "replace")
+        words = query.split(None, 1)
+        verb = words[0].lower() if words else ""
+        return verb if verb in STATEMENT_VERBS else "other"
+
+    def execute(self, query, vars=None):
+        with span("db_execute", verb=self.statement_verb(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with span("db_execute", verb=self.statement_verb(query)):
+            return super().executemany(query, vars_list)
+
+
+class PooledConnection:
+    __slots__ = ("connection", "created_at", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool. Callers beyond max_size wait (up
+    to `timeout` seconds) for a connection to be returned. Connections that
+    sat idle are health-checked before use, and idle or old ones are closed.
+    New connections come from `connect(dsn, cursor_factory=...)`, psycopg2.connect by default.
+    """
+
+    def __init__(self, dsn: str, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, max_idle: float = DB_POOL_MAX_IDLE,
+                 max_lifetime: float = DB_POOL_MAX_LIFETIME, check_after: float = DB_POOL_CHECK_AFTER,
+                 connect=psycopg2.connect):
+        self.dsn = dsn
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "failed_health_checks": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def _close(self, pooled: PooledConnection):
+        self._size -= 1
+        self._stats["connections_closed"] += 1
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _expired(self, pooled: PooledConnection, now: float) -> bool:
+        return now - pooled.created_at > self.max_lifetime
+
+    def _prune_idle(self):
+        """Close idle connections that are too old, or idle too long beyond min_size. Caller holds the lock."""
+        now = time.monotonic()
+        for pooled in list(self._idle):
+            too_idle = now - pooled.last_used > self.max_idle and self._size > self.min_size
+            if too_idle or self._expired(pooled, now):
+                self._idle.remove(pooled)
+                self._close(pooled)
+
+    def _is_healthy(self, pooled: PooledConnection) -> bool:
+        if pooled.connection.closed:
+            return False
+        if time.monotonic() - pooled.last_used < self.check_after:
+            return True
+        try:
+            with pooled.connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            pooled.connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        pooled = None
+        with self._cond:
+            while True:
+                self._prune_idle()
+                if self._idle:
+                    pooled = self._idle.pop()  # most recently used: likeliest to be alive
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # reserve a slot, connect outside the lock
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        if pooled is not None and not self._is_healthy(pooled):
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+                self._close(pooled)
+                self._size += 1
+            pooled = None
+
+        if pooled is None:
+            try:
+                pooled = PooledConnection(self.connect(self.dsn, cursor_factory=InstrumentedCursor))
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["connections_created"] += 1
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._in_use[id(pooled.connection)] = pooled
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return pooled.connection
+
+    def putconn(self, connection, discard: bool = False):
+        with self._cond:
+            pooled = self._in_use.pop(id(connection))
+            pooled.last_used = time.monotonic()
+            if not discard and not connection.closed:
+                try:
+                    # Never hand out a connection in the middle of a transaction
+                    if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                except psycopg2.Error:
+                    discard = True
+            if discard or connection.closed or self._expired(pooled, pooled.last_used):
+                self._close(pooled)
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error, then return it."""
+        connection = self.getconn()
+        discard = False
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(connection, discard=discard)
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop())
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                checked_out=len(self._in_use),
+                max_size=self.max_size,
+            )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool, created on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_URL)
+    return _pool
+
+
+def pool_gauges() -> list:
+    """Stats of the process-wide pool for /metrics (none until something has used the database)."""
+    if _pool is None:
+        return []
+    return [(f"db_pool_{name}", {}, value) for name, value in _pool.stats().items()]
@@ -0,0 +1,197 @@
+from array import array
+from datetime import datetime, date
+import json
+import sys
+
+
+def parse_created_date(created_time):
+    """created_time (ISO string or datetime) -> date, None if it can't be parsed."""
+    try:
+        if isinstance(created_time, str):
+            return datetime.fromisoformat(created_time.replace('Z', '+00:00')).date()
+        return created_time.date()
+    except Exception:
+        return None
+
+
+def parse_modified_date(modified_time):
+    """Stage history Modified_Time (e.g. "2025-09-13T10:39:20+05:30") -> date, None if it can't be parsed."""
+    try:
+        if isinstance(modified_time, str):
+            return datetime.fromisoformat(modified_time).date()
+        return modified_time.date()
+    except Exception:
+        return None
+
+
+def parse_closing_date(closing_date):
+    """closing_date ("YYYY-MM-DD", date or datetime) -> date, None if missing or bad format."""
+    try:
+        if isinstance(closing_date, str):
+            if len(closing_date) == 10 and closing_date[4] == closing_date[7] == "-":
+                try:
+                    # Same result as the strptime below for zero-padded dates, several times faster
+                    return date.fromisoformat(closing_date)
+                except ValueError:
+                    pass
+            return datetime.strptime(closing_date, "%Y-%m-%d").date()
+        if isinstance(closing_date, datetime):
+            return closing_date.date()
+        if isinstance(closing_date, date):
+            return closing_date
+    except Exception:
+        pass
+    return None
+
+
+class CompactDeal:
+    """
+    A deal with every timestamp parsed once.
+    Dates are stored as ordinals (date.toordinal()) of the day in the
+    timestamp's own offset, which is what the metrics compare on.
+    `history` is a flat array of (stage_id, day) pairs in stage history order;
+    entries without a usable Modified_Time are dropped.
+    `layout` is the (keys, stage_history position) of the original row, shared
+    by every deal with the same keys, and `values` its values in key order
+    with a list stage_history stored as compact JSON bytes; row() rebuilds the
+    row from them.
+    """
+    __slots__ = ("layout", "values", "pipeline", "stage_id", "created_day", "closing_day", "history")
+
+    def __init__(self, layout, values, pipeline, stage_id, created_day, closing_day, history):
+        self.layout = layout
+        self.values = values
+        self.pipeline = pipeline
+        self.stage_id = stage_id
+        self.created_day = created_day
+        self.closing_day = closing_day
+        self.history = history
+
+    def row(self) -> dict:
+        """The original row, as it appears in the metric lists (stage history included)."""
+        keys, history_position = self.layout
+        row = dict(zip(keys, self.values))
+        if history_position is not None:
+            stage_history = self.values[history_position]
+            if isinstance(stage_history, bytes):
+                row["stage_history"] = json.loads(stage_history)
+        return row
+
+    def transitions(self):
+        """Yield (stage_id, day) for each stage history entry."""
+        history = self.history
+        for i in range(0, len(history), 2):
+            yield history[i], history[i + 1]
+
+
+class DealSet:
+    """
+    Deals loaded into CompactDeal objects plus the table of interned stage
+    names their stage ids point to. Build it once with DealSet.from_records
+    and pass it to any number of metric calls.
+    """
+    __slots__ = ("deals", "stage_names", "stage_ids", "layouts", "derived")
+
+    def __init__(self):
+        self.deals = []
+        self.stage_names = []
+        self.stage_ids = {}
+        # row keys -> (keys, stage_history position), shared by the CompactDeals
+        self.layouts = {}
+        # Structures built from the deals by the engines (metric_vectorized's
+        # DealColumns), kept for the next call and dropped when a deal is added
+        self.derived = {}
+
+    def stage_id(self, name) -> int:
+        stage_id = self.stage_ids.get(name)
+        if stage_id is None:
+            stage_id = len(self.stage_names)
+            self.stage_names.append(sys.intern(name) if isinstance(name, str) else name)
+            self.stage_ids[name] = stage_id
+        return stage_id
+
+    def stage_id_set(self, names) -> set:
+        """Ids of the given stage names (names never seen are left out)."""
+        return {self.stage_ids[name] for name in names if name in self.stage_ids}
+
+    def layout(self, keys: tuple) -> tuple:
+        layout = self.layouts.get(keys)
+        if layout is None:
+            keys = tuple(sys.intern(key) if isinstance(key, str) else key for key in keys)
+            position = keys.index("stage_history") if "stage_history" in keys else None
+            layout = self.layouts[keys] = (keys, position)
+        return layout
+
+    def add(self, record: dict):
+        if self.derived:
+            self.derived.clear()
+        created_time = record.get("created_time")
+        created_date = parse_created_date(created_time) if created_time else None
+        closing_date = record.get("closing_date")
+        closing_date = parse_closing_date(closing_date) if closing_date else None
+
+        raw_history = record.get("stage_history")
+        stage_history = raw_history or []
+        if isinstance(stage_history, str):
+            stage_history = json.loads(stage_history)
+
+        stage_ids = self.stage_ids
+        history = array("i")
+        for stage_entry in stage_history:
+            modified_time = stage_entry.get("Modified_Time")
+            if not modified_time:
+                continue
+            modified_date = parse_modified_date(modified_time)
+            if modified_date is None:
+                continue
+            stage = stage_entry.get("Stage")
+            stage_id = stage_ids.get(stage)
+            history.append(self.stage_id(stage) if stage_id is None else stage_id)
+            history.append(modified_date.toordinal())
+
+        layout = self.layout(tuple(record))
+        values = tuple(record.values())
+        if isinstance(raw_history, list):
+            # The parsed history is much bigger than its JSON; row() decodes it again
+            try:
+                encoded = json.dumps(raw_history, ensure_ascii=False, separators=(",", ":")).encode()
+            except (TypeError, ValueError):
+                pass
+            else:
+                position = layout[1]
+                values = values[:position] + (encoded,) + values[position + 1:]
+
+        pipeline = record.get("pipeline")
+        self.deals.append(CompactDeal(
+            layout,
+            values,
+            sys.intern(pipeline) if isinstance(pipeline, str) else pipeline,
+            self.stage_id(record.get("stage")),
+            created_date.toordinal() if created_date else None,
+            closing_date.toordinal() if closing_date else None,
+            history,
+        ))
+
+    @classmethod
+    def from_records(cls, records) -> "DealSet":
+        deal_set = cls()
+        for record in records:
+            deal_set.add(record)
+        return deal_set
+
+    def __len__(self):
+        return len(self.deals)
+
+    def __iter__(self):
+        return iter(self.deals)
+
+
+def as_deal_set(deals) -> DealSet:
+    """
+    Accept either a DealSet or an iterable of deal dicts. Loading dicts costs
+    more than a metric call on a DealSet, so callers running several metrics
+    over the same deals should load them once.
+    """
+    if isinstance(deals, DealSet):
+        return deals
+    return DealSet.from_records(deals)
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from service.sync_service import sync_deals, SyncCancelled
+from utils.instrumentation import profile_job, span
+
+# How many finished jobs to remember for the status endpoint
+MAX_FINISHED_JOBS = 20
+
+
+class SyncAlreadyRunning(Exception):
+    def __init__(self, job):
+        self.job = job
+        super().__init__(f"Sync job {job.id} is already running")
+
+
+class SyncJob:
+    def __init__(self, params: dict, profile: str = None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.profile = profile
+        self.status = "running"
+        self.error = None
+        self.result = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.progress = {"deals_fetched": 0, "histories_fetched": 0, "histories_reused": 0, "rows_upserted": 0}
+        self.cancel_event = threading.Event()
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "profile": self.profile,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(elapsed, 1),
+            "progress": dict(self.progress),
+            "rows_per_second": round(self.progress["rows_upserted"] / elapsed, 1) if elapsed > 0 else 0,
+            "cancel_requested": self.cancel_event.is_set(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+_jobs = OrderedDict()
+_running_job = None
+_lock = threading.Lock()
+
+
+def _run(job: SyncJob):
+    global _running_job
+    try:
+        with span("sync_job"), profile_job(f"sync-{job.id}", job.profile):
+            job.result = sync_deals(progress=job.progress, cancel_event=job.cancel_event, **job.params)
+        job.status = "succeeded"
+    except SyncCancelled:
+        job.status = "cancelled"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        print(f"Sync job {job.id} failed: {e}")
+    finally:
+        job.finished_at = time.time()
+        with _lock:
+            _running_job = None
+
+
+def start_sync_job(full_resync: bool = False, resume: bool = True, force_refetch: bool = False,
+                   profile: str = None) -> SyncJob:
+    """
+    Run sync_deals in a background thread; only one sync may run at a time.
+    profile: "cprofile" or "pyinstrument" to profile this run (defaults to JOB_PROFILER).
+    """
+    global _running_job
+    with _lock:
+        if _running_job is not None:
+            raise SyncAlreadyRunning(_running_job)
+        job = SyncJob({"full_resync": full_resync, "resume": resume, "force_refetch": force_refetch}, profile)
+        _running_job = job
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_FINISHED_JOBS + 1:
+            _jobs.popitem(last=False)
+
+    threading.Thread(target=_run, args=(job,), name=f"sync-{job.id}", daemon=True).start()
+    return job
+
+
+def get_job(job_id: str):
+    return _jobs.get(job_id)
+
+
+def list_jobs() -> list:
+    return list(reversed(_jobs.values()))
+
+
+def cancel_job(job_id: str):
+    """Ask a running job to stop after its current page. Returns the job (None if unknown)."""
+    job = _jobs.get(job_id)
+    if job is not None and job.status == "running":
+        job.cancel_event.set()
+    return job
+
+
+def job_gauges():
+    """Progress counters of the running sync job, for /metrics."""
+    job = _running_job
+    if job is None:
+        return [("sync_job_running", {}, 0)]
+    gauges = [("sync_job_running", {}, 1), ("sync_job_elapsed_seconds", {}, round(time.time() - job.started_at, 3))]
+    gauges += [("sync_job_progress", {"counter": name}, value) for name, value in job.progress.items()]
+    return gauges
@@ -0,0 +1,175 @@
+# Compact export of the weekly metrics. The metric lists (new_deals_list,
+# closed_deals_list, won_deals_list, movements_list) hold deal ids, and every
+# deal is stored once in a shared column/row table:
+#
+#   {"format": "weekly_metrics_compact", "version": 1,
+#    "metrics": <calculate_weekly_spreadsheet_metrics list, or {week: list}>,
+#    "deal_columns": ["id", "deal_name", ...], "deals": [[...], ...]}
+#
+# The metrics come first so the writer can stream them week by week; the
+# deal table, complete only after the last week, follows.
+#
+# Files ending in .gz are gzipped JSON, files ending in .msgpack are MessagePack
+# (needs the optional msgpack package). load_weekly_metrics turns any of them
+# back into the usual structure with full deal dicts.
+import gzip
+import json
+import os
+from functools import partial
+
+COMPACT_FORMAT = "weekly_metrics_compact"
+COMPACT_VERSION = 1
+DEAL_LIST_KEYS = ("new_deals_list", "closed_deals_list", "won_deals_list", "movements_list")
+
+
+class DealTable:
+    """The distinct deals of the lists compacted so far, by id in order of first appearance."""
+
+    def __init__(self):
+        self.deals = {}
+
+    def compact_results(self, results):
+        """One week's results with deal ids in the lists; the deals are added to the table."""
+        deals = self.deals
+
+        def deal_ids(records):
+            ids = []
+            for deal in records:
+                deals.setdefault(deal["id"], deal)
+                ids.append(deal["id"])
+            return ids
+
+        return [
+            {key: deal_ids(value) if key in DEAL_LIST_KEYS else value for key, value in result.items()}
+            for result in results
+        ]
+
+    def columns(self) -> list:
+        columns = {}
+        for deal in self.deals.values():
+            for column in deal:
+                columns.setdefault(column, None)
+        return list(columns)
+
+    def rows(self, columns: list):
+        """Yield one row per deal, in `columns` order."""
+        for deal in self.deals.values():
+            yield [deal.get(column) for column in columns]
+
+
+def open_export(path: str, mode: str):
+    """Open a JSON export for text reading ("r") or writing ("w"), gzipped if it ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", compresslevel=6)
+    return open(path, mode)
+
+
+def write_compact_json(f, metrics, table: DealTable):
+    """
+    Write the document piece by piece: each week is compacted and written
+    before the next one, and the deal table comes last, one row at a time.
+    """
+    dumps = partial(json.dumps, default=str, separators=(",", ":"))
+    f.write('{"format": %s, "version": %d, "metrics": ' % (json.dumps(COMPACT_FORMAT), COMPACT_VERSION))
+    if isinstance(metrics, dict):
+        f.write("{")
+        for i, (week, results) in enumerate(metrics.items()):
+            f.write(",\n" if i else "\n")
+            f.write("%s:%s" % (dumps(week), dumps(table.compact_results(results))))
+        f.write("\n}")
+    else:
+        f.write(dumps(table.compact_results(metrics)))
+
+    deal_columns = table.columns()
+    f.write(', "deal_columns": %s, "deals": [' % json.dumps(deal_columns))
+    for i, row in enumerate(table.rows(deal_columns)):
+        f.write(",\n" if i else "\n")
+        f.write(dumps(row))
+    f.write("\n]}\n")
+
+
+def write_compact_msgpack(f, metrics, table: DealTable):
+    """MessagePack version of write_compact_json, in the same order."""
+    import msgpack
+
+    packer = msgpack.Packer(default=str)
+    f.write(packer.pack_map_header(5))
+    for key, value in (("format", COMPACT_FORMAT), ("version", COMPACT_VERSION)):
+        f.write(packer.pack(key))
+        f.write(packer.pack(value))
+    f.write(packer.pack("metrics"))
+    if isinstance(metrics, dict):
+        f.write(packer.pack_map_header(len(metrics)))
+        for week, results in metrics.items():
+            f.write(packer.pack(week))
+            f.write(packer.pack(table.compact_results(results)))
+    else:
+        f.write(packer.pack(table.compact_results(metrics)))
+
+    deal_columns = table.columns()
+    f.write(packer.pack("deal_columns"))
+    f.write(packer.pack(deal_columns))
+    f.write(packer.pack("deals"))
+    f.write(packer.pack_array_header(len(table.deals)))
+    for row in table.rows(deal_columns):
+        f.write(packer.pack(row))
+
+
+def export_weekly_metrics(metrics, path: str) -> dict:
+    """
+    Stream `metrics` (one week's list or a {week: list} backfill) to `path` in the
+    compact format; the extension picks gzip (.gz) or MessagePack (.msgpack).
+    Only the deal table is kept while writing, never a compacted copy of all weeks.
+    Returns {"deals": number of distinct deals, "bytes": file size}.
+    """
+    table = DealTable()
+    if path.endswith(".msgpack"):
+        with open(path, "wb") as f:
+            write_compact_msgpack(f, metrics, table)
+    else:
+        with open_export(path, "w") as f:
+            write_compact_json(f, metrics, table)
+
+    return {"deals": len(table.deals), "bytes": os.path.getsize(path)}
+
+
+def expand_weekly_metrics(document: dict):
+    """Compact document -> the metrics with full deal dicts in the lists (shared between lists)."""
+    deal_columns = document["deal_columns"]
+    deals = {}
+    for row in document["deals"]:
+        deal = dict(zip(deal_columns, row))
+        deals[deal["id"]] = deal
+
+    def expand_results(results):
+        return [
+            {key: [deals[deal_id] for deal_id in value] if key in DEAL_LIST_KEYS else value
+             for key, value in result.items()}
+            for result in results
+        ]
+
+    metrics = document["metrics"]
+    if isinstance(metrics, dict):
+        return {week: expand_results(results) for week, results in metrics.items()}
+    return expand_results(metrics)
+
+
+def load_weekly_metrics(path: str):
+    """
+    Read weekly metrics written by export_weekly_metrics (JSON, .gz or .msgpack)
+    or a plain json.dump of the metrics, and return the usual structure.
+    """
+    if path.endswith(".msgpack"):
+        import msgpack
+
+        with open(path, "rb") as f:
+            document = msgpack.unpack(f, strict_map_key=False)
+    else:
+        with open_export(path, "r") as f:
+            document = json.load(f)
+
+    if isinstance(document, dict) and document.get("format") == COMPACT_FORMAT:
+        if document.get("version") != COMPACT_VERSION:
+            raise ValueError(f"Unsupported weekly metrics export version {document.get('version')}")
+        return expand_weekly_metrics(document)
+    return document
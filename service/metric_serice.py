@@ -1,70 +1,101 @@
 from datetime import datetime, date, timedelta
 import calendar
+import os
 
 from utils.utils import get_time_stamp,get_week_data
+from service.deal_model import as_deal_set
+from utils.instrumentation import PhaseTimer
 from utils.constants import (
     CLOSED_QUAL_LOST, CLOSED_SALES_LOST, CLOSED_SLOWMO_LOST,
     CLOSED_QUAL_POSITIVE, CLOSED_SALES_POSITIVE, CLOSED_SLOWMO_POSITIVE
 )
 
+# Closed (won/lost) and positive (won) stage names for each pipeline
+CLOSED_STAGES = {
+    "Qual": set(CLOSED_QUAL_LOST + CLOSED_QUAL_POSITIVE),
+    "Sales": set(CLOSED_SALES_LOST + CLOSED_SALES_POSITIVE),
+    "SloMo": set(CLOSED_SLOWMO_LOST + CLOSED_SLOWMO_POSITIVE),
+}
+POSITIVE_STAGES = {
+    "Qual": set(CLOSED_QUAL_POSITIVE),
+    "Sales": set(CLOSED_SALES_POSITIVE),
+    "SloMo": set(CLOSED_SLOWMO_POSITIVE),
+}
+PIPELINES = ["Sales", "Qual", "SloMo"]
 
+# "python" walks the deals in pure Python, "numpy" uses the vectorized backend
+METRICS_ENGINES = ("python", "numpy")
+METRICS_ENGINE = os.getenv("METRICS_ENGINE", "python")
 
-def get_deals_metrics(deals: list[dict]):
+
+def resolve_engine(engine: str = None) -> str:
+    engine = engine or METRICS_ENGINE
+    if engine not in METRICS_ENGINES:
+        raise ValueError(f"Unknown metrics engine '{engine}', expected one of {METRICS_ENGINES}")
+    return engine
+
+
+def get_deals_metrics(deals, engine: str = None):
     """
-    Takes a list of deals (from Supabase/DB) and splits them into
+    Takes a list of deals (from Supabase/DB) or a DealSet and splits them into
     - overdue: closing date < today
     - due_today: closing date == today
-    Returns: (overdue, due_today)
+    engine: "python" or "numpy" (defaults to METRICS_ENGINE)
+    Returns: metrics dict with totals and the overdue / due today deals per pipeline
     """
-    today = date.today()
+    if resolve_engine(engine) == "numpy":
+        from service.metric_vectorized import get_deals_metrics_vectorized
+        return get_deals_metrics_vectorized(deals)
+
+    timer = PhaseTimer("current", engine="python")
+    deal_set = as_deal_set(deals)
+    timer.mark("load")
+    today = date.today().toordinal()
     overdue = []
     due_today = []
 
-    sales_total = [deal for deal in deals if deal.get("pipeline") == "Sales"]
-    qual_total = [deal for deal in deals if deal.get("pipeline") == "Qual"]
-    slowmo_total = [deal for deal in deals if deal.get("pipeline") == "SloMo"]
-    for deal in deals:
-        closing_date = deal.get("closing_date")
-        if not closing_date:
-            continue  # skip if missing
-                
-        try:
-            # Normalize closing_date to a date object
-            if isinstance(closing_date, str):
-                closing_date = datetime.strptime(closing_date, "%Y-%m-%d").date()
-            elif isinstance(closing_date, datetime):
-                closing_date = closing_date.date()
-        except Exception:
-            continue  # skip if bad format
-
-        if closing_date < today:
-            overdue.append(deal)
-        elif closing_date == today:
-            due_today.append(deal)
-
-    sales_overdue = [deal for deal in overdue if deal.get("pipeline") == "Sales"]
-    sales_due_today = [deal for deal in due_today if deal.get("pipeline") == "Sales"]
-
-    quals_overdue = [deal for deal in overdue if deal.get("pipeline") == "Qual"]
-    quals_due_today = [deal for deal in due_today if deal.get("pipeline") == "Qual"]
-    
-    slowmo_overdue = [deal for deal in overdue if deal.get("pipeline") == "SloMo"]
-    slowmo_due_today = [deal for deal in due_today if deal.get("pipeline") == "SloMo"]
+    totals = {pipeline: 0 for pipeline in PIPELINES}
+    pipeline_overdue = {pipeline: [] for pipeline in PIPELINES}
+    pipeline_due_today = {pipeline: [] for pipeline in PIPELINES}
 
+    for deal in deal_set:
+        if deal.pipeline in totals:
+            totals[deal.pipeline] += 1
+
+        closing_day = deal.closing_day
+        if closing_day is None:
+            continue  # skip if missing or bad format
+
+        if closing_day < today:
+            row = deal.row()
+            overdue.append(row)
+            if deal.pipeline in pipeline_overdue:
+                pipeline_overdue[deal.pipeline].append(row)
+        elif closing_day == today:
+            row = deal.row()
+            due_today.append(row)
+            if deal.pipeline in pipeline_due_today:
+                pipeline_due_today[deal.pipeline].append(row)
+
+    timer.mark("classify")
+    return build_deals_metrics(len(deal_set), overdue, due_today, totals, pipeline_overdue, pipeline_due_today)
+
+
+def build_deals_metrics(total_deals, overdue, due_today, totals, pipeline_overdue, pipeline_due_today):
     metrics = {
-        "total_deals": len(deals),
+        "total_deals": total_deals,
         "total_overdue": len(overdue),
         "total_due_today": len(due_today),
         "total_due_today_list":due_today,
-        "sales_total": len(sales_total),
-        "sales_overdue": sales_overdue,
-        "sales_due_today": sales_due_today,
-        "qual_total": len(qual_total),
-        "quals_overdue": quals_overdue,
-        "quals_due_today": quals_due_today,
-        "slowmo_total": len(slowmo_total),
-        "slowmo_overdue": slowmo_overdue,
-        "slowmo_due_today": slowmo_due_today,
+        "sales_total": totals["Sales"],
+        "sales_overdue": pipeline_overdue["Sales"],
+        "sales_due_today": pipeline_due_today["Sales"],
+        "qual_total": totals["Qual"],
+        "quals_overdue": pipeline_overdue["Qual"],
+        "quals_due_today": pipeline_due_today["Qual"],
+        "slowmo_total": totals["SloMo"],
+        "slowmo_overdue": pipeline_overdue["SloMo"],
+        "slowmo_due_today": pipeline_due_today["SloMo"],
     }
     
     return metrics
@@ -85,7 +116,132 @@ def get_metrics_by_week(deals: list[dict],week_data):
     print(pipelines)
 
 
-def calculate_weekly_spreadsheet_metrics(deals: list[dict], week_offset: int = 0):
+def build_week_day_index(weeks: list[dict]) -> dict:
+    """
+    Map every day (as a date ordinal) covered by `weeks` (get_week_data dicts)
+    to the positions of the weeks containing it. Weeks can overlap at month boundaries.
+    """
+    day_index = {}
+    for position, week in enumerate(weeks):
+        week_start_day = datetime.fromtimestamp(week["start_date"]).date().toordinal()
+        week_end_day = datetime.fromtimestamp(week["end_date"]).date().toordinal()
+        for day in range(week_start_day, week_end_day + 1):
+            day_index.setdefault(day, []).append(position)
+    return day_index
+
+
+def aggregate_weekly_buckets(deals, weeks: list[dict]) -> list[dict]:
+    """
+    Bucket every deal and every stage transition by (week, pipeline) in a
+    single pass over `deals` (deal dicts or a DealSet).
+    Returns one {pipeline: {"new", "closed", "won", "movements"}} dict per week.
+    """
+    timer = PhaseTimer("weekly", engine="python")
+    day_index = build_week_day_index(weeks)
+    buckets = [
+        {pipeline: {"new": [], "closed": [], "won": [], "movements": []} for pipeline in PIPELINES}
+        for _ in weeks
+    ]
+
+    deal_set = as_deal_set(deals)
+    closed_stage_ids = {pipeline: deal_set.stage_id_set(CLOSED_STAGES[pipeline]) for pipeline in PIPELINES}
+    positive_stage_ids = {pipeline: deal_set.stage_id_set(POSITIVE_STAGES[pipeline]) for pipeline in PIPELINES}
+    timer.mark("load")
+
+    for deal in deal_set:
+        pipeline = deal.pipeline
+        if pipeline not in CLOSED_STAGES:
+            continue
+        row = None  # built the first time the deal lands in a bucket
+
+        # New deals: created in the week
+        if deal.created_day is not None:
+            for position in day_index.get(deal.created_day, ()):
+                row = row or deal.row()
+                buckets[position][pipeline]["new"].append(row)
+
+        closed_stages = closed_stage_ids[pipeline]
+        is_closed = deal.stage_id in closed_stages
+        moved_weeks = set()
+        closed_weeks = set()
+
+        history = deal.history
+        for i in range(0, len(history), 2):
+            stage_id = history[i]
+            positions = day_index.get(history[i + 1])
+            if not positions:
+                continue
+
+            # Total movements: any stage change in the week, each deal counted once
+            for position in positions:
+                if position not in moved_weeks:
+                    moved_weeks.add(position)
+                    row = row or deal.row()
+                    buckets[position][pipeline]["movements"].append(row)
+
+            # Closed deals: currently in a closed stage and moved to a closed
+            # stage in the week; the first such transition decides won or lost
+            if is_closed and stage_id in closed_stages:
+                for position in positions:
+                    if position not in closed_weeks:
+                        closed_weeks.add(position)
+                        bucket = buckets[position][pipeline]
+                        row = row or deal.row()
+                        bucket["closed"].append(row)
+                        if stage_id in positive_stage_ids[pipeline]:
+                            bucket["won"].append(row)
+
+    timer.mark("bucket")
+    return buckets
+
+
+def build_weekly_results(weeks: list[dict], buckets: list[dict]) -> list[list[dict]]:
+    all_results = []
+    for week, week_buckets in zip(weeks, buckets):
+        results = []
+        for pipeline in PIPELINES:
+            bucket = week_buckets[pipeline]
+
+            # Calculate win percentage
+            win_percentage = 0
+            if len(bucket["closed"]) > 0:
+                win_percentage = round((len(bucket["won"]) / len(bucket["closed"])) * 100, 1)
+
+            results.append({
+                "week": week["name"],
+                "pipeline": pipeline,
+                "new_deals": len(bucket["new"]),
+                "closed_deals": len(bucket["closed"]),
+                "total_movements": len(bucket["movements"]),
+                "win_percentage": win_percentage,
+                "new_deals_list": bucket["new"],
+                "closed_deals_list": bucket["closed"],
+                "won_deals_list": bucket["won"],
+                "movements_list": bucket["movements"]
+            })
+        all_results.append(results)
+
+    return all_results
+
+
+def aggregate_weekly_metrics(deals, weeks: list[dict], engine: str = None) -> list[list[dict]]:
+    """
+    Weekly metrics for every entry of `weeks` in the calculate_weekly_spreadsheet_metrics
+    format, computed in one sweep by the selected engine ("python" or "numpy").
+    """
+    engine = resolve_engine(engine)
+    if engine == "numpy":
+        from service.metric_vectorized import aggregate_weekly_buckets_vectorized
+        buckets = aggregate_weekly_buckets_vectorized(deals, weeks)
+    else:
+        buckets = aggregate_weekly_buckets(deals, weeks)
+    timer = PhaseTimer("weekly", engine=engine)
+    results = build_weekly_results(weeks, buckets)
+    timer.mark("build")
+    return results
+
+
+def calculate_weekly_spreadsheet_metrics(deals: list[dict], week_offset: int = 0, engine: str = None):
     """
     Calculate weekly metrics for spreadsheet for a specific week:
     - week: Week identifier
@@ -98,132 +254,27 @@ def calculate_weekly_spreadsheet_metrics(deals: list[dict], week_offset: int = 0
     Args:
         deals: List of deal dictionaries
         week_offset: Number of weeks back from current week (0 = current week, 1 = last week, etc.)
+        engine: "python" or "numpy" (defaults to METRICS_ENGINE)
     
     Returns:
         List of dictionaries with weekly metrics for each pipeline (one week only)
     """
-    
-    # Get all closed stage names for each pipeline
-    closed_stages = {
-        "Qual": CLOSED_QUAL_LOST + CLOSED_QUAL_POSITIVE,
-        "Sales": CLOSED_SALES_LOST + CLOSED_SALES_POSITIVE, 
-        "SloMo": CLOSED_SLOWMO_LOST + CLOSED_SLOWMO_POSITIVE
-    }
-    
-    # Get positive (won) stage names for each pipeline
-    positive_stages = {
-        "Qual": CLOSED_QUAL_POSITIVE,
-        "Sales": CLOSED_SALES_POSITIVE,
-        "SloMo": CLOSED_SLOWMO_POSITIVE
+    return aggregate_weekly_metrics(deals, [get_week_data(week_offset)], engine)[0]
+
+
+def calculate_weekly_metrics_for_weeks(deals: list[dict], weeks: list[dict], engine: str = None) -> dict:
+    """
+    Backfill weekly metrics for many weeks at once (see utils.get_weeks_for_offsets
+    and utils.get_weeks_for_months). The deals are scanned once for all weeks.
+
+    Returns:
+        {week name: list of per-pipeline metrics}, each value identical to what
+        calculate_weekly_spreadsheet_metrics returns for that week
+    """
+    return {
+        week["name"]: results
+        for week, results in zip(weeks, aggregate_weekly_metrics(deals, weeks, engine))
     }
-    
-    results = []
-    
-    # Get week data for the specified week offset
-    week_data = get_week_data(week_offset)
-    week_start_timestamp = week_data["start_date"]
-    week_end_timestamp = week_data["end_date"]
-    week_name = week_data["name"]
-    
-    # Convert timestamps back to dates for comparison
-    week_start_date = datetime.fromtimestamp(week_start_timestamp).date()
-    week_end_date = datetime.fromtimestamp(week_end_timestamp).date()
-    
-    # Calculate metrics for each pipeline
-    for pipeline in ["Sales", "Qual", "SloMo"]:
-        pipeline_deals = [deal for deal in deals if deal.get("pipeline") == pipeline]
-        
-        # New deals: created in this week
-        new_deals = []
-        for deal in pipeline_deals:
-            created_time = deal.get("created_time")
-            if created_time:
-                try:
-                    if isinstance(created_time, str):
-                        created_date = datetime.fromisoformat(created_time.replace('Z', '+00:00')).date()
-                    else:
-                        created_date = created_time.date()
-                    
-                    if week_start_date <= created_date <= week_end_date:
-                        new_deals.append(deal)
-                except Exception:
-                    continue
-        
-        # Closed deals: deals that moved to a closed stage in this week
-        closed_deals = []
-        won_deals = []
-        
-        for deal in pipeline_deals:
-            stage_history = deal.get("stage_history", [])
-            current_stage = deal.get("stage")
-            
-            # Check if deal is currently in a closed stage and was closed this week
-            if current_stage in closed_stages.get(pipeline, []):
-                # Look at stage history to see when it was closed
-                for stage_entry in stage_history:
-                    stage_name = stage_entry.get("Stage")
-                    modified_time = stage_entry.get("Modified_Time")
-                    
-                    if stage_name in closed_stages.get(pipeline, []) and modified_time:
-                        try:
-                            # Parse the modified time
-                            if isinstance(modified_time, str):
-                                # Handle timezone format like "2025-09-13T10:39:20+05:30"
-                                modified_date = datetime.fromisoformat(modified_time).date()
-                            else:
-                                modified_date = modified_time.date()
-                            
-                            if week_start_date <= modified_date <= week_end_date:
-                                closed_deals.append(deal)
-                                
-                                # Check if it's a won deal
-                                if stage_name in positive_stages.get(pipeline, []):
-                                    won_deals.append(deal)
-                                break
-                        except Exception:
-                            continue
-        
-        # Total movements: any deals that had stage changes in this week
-        movements = []
-        for deal in pipeline_deals:
-            stage_history = deal.get("stage_history", [])
-            
-            for stage_entry in stage_history:
-                modified_time = stage_entry.get("Modified_Time")
-                if modified_time:
-                    try:
-                        if isinstance(modified_time, str):
-                            modified_date = datetime.fromisoformat(modified_time).date()
-                        else:
-                            modified_date = modified_time.date()
-                        
-                        if week_start_date <= modified_date <= week_end_date:
-                            if deal not in movements:
-                                movements.append(deal)
-                            break
-                    except Exception:
-                        continue
-        
-        # Calculate win percentage
-        win_percentage = 0
-        if len(closed_deals) > 0:
-            win_percentage = round((len(won_deals) / len(closed_deals)) * 100, 1)
-        
-        # Add metrics for this week and pipeline
-        results.append({
-            "week": week_name,
-            "pipeline": pipeline,
-            "new_deals": len(new_deals),
-            "closed_deals": len(closed_deals),
-            "total_movements": len(movements),
-            "win_percentage": win_percentage,
-            "new_deals_list": new_deals,
-            "closed_deals_list": closed_deals,
-            "won_deals_list": won_deals,
-            "movements_list": movements
-        })
-    
-    return results
 
 
 def format_metrics_for_spreadsheet(weekly_metrics: list[dict]):
@@ -0,0 +1,162 @@
+# SQL backend for the weekly metrics: new / closed / won / movements are
+# computed by Postgres from Bigin.Deals and Bigin.stage_transitions in one
+# aggregate query, so only the deals that show up in the weeks are downloaded.
+# Gives the same results as aggregate_weekly_buckets in service.metric_serice,
+# with every deal list in id order whatever plan Postgres picks.
+from datetime import datetime
+
+from psycopg2 import sql
+
+from service.metric_serice import CLOSED_STAGES, POSITIVE_STAGES, PIPELINES, build_weekly_results
+from service.supabase_serice import (
+    get_db_connection, iter_deals, schema_name, table_name, transitions_table_name
+)
+from utils.instrumentation import PhaseTimer
+
+# Both sides of a stage transition's day are unknown to Postgres (the day is in the
+# timestamp's own offset, the date casts are in the session's), so the
+# modified_time range used to hit the index is widened by this many days
+TRANSITION_DAY_MARGIN = 2
+
+WEEKLY_BUCKETS_QUERY = sql.SQL("""
+WITH weeks AS (
+    SELECT * FROM unnest(%(positions)s::int[], %(start_days)s::date[], %(end_days)s::date[])
+        AS week(position, start_day, end_day)
+),
+closed_stages AS (
+    SELECT * FROM unnest(%(closed_pipelines)s::text[], %(closed_stages)s::text[], %(positive)s::boolean[])
+        AS closed(pipeline, stage, positive)
+),
+week_transitions AS (
+    SELECT weeks.position AS week, transition.deal_id, transition.pipeline, transition.stage, transition.position
+    FROM weeks
+    JOIN {transitions} AS transition
+      ON transition.pipeline = ANY(%(pipelines)s)
+     AND transition.modified_time >= weeks.start_day - %(margin)s
+     AND transition.modified_time < weeks.end_day + 1 + %(margin)s
+     AND transition.modified_date BETWEEN weeks.start_day AND weeks.end_day
+),
+first_closes AS (
+    -- Deals currently in a closed stage; their first move to a closed stage in the week decides won or lost
+    SELECT DISTINCT ON (week_transitions.week, week_transitions.deal_id)
+           week_transitions.week, week_transitions.deal_id, week_transitions.pipeline, closed.positive
+    FROM week_transitions
+    JOIN closed_stages AS closed
+      ON closed.pipeline = week_transitions.pipeline AND closed.stage = week_transitions.stage
+    JOIN {deals} AS deal ON deal.id = week_transitions.deal_id
+    JOIN closed_stages AS current_stage
+      ON current_stage.pipeline = deal.pipeline AND current_stage.stage = deal.stage
+    ORDER BY week_transitions.week, week_transitions.deal_id, week_transitions.position
+)
+SELECT weeks.position, deal.pipeline, 'new', array_agg(deal.id ORDER BY deal.id)
+FROM weeks
+JOIN {deals} AS deal
+  ON deal.pipeline = ANY(%(pipelines)s)
+ AND deal.created_time >= weeks.start_day
+ AND deal.created_time < weeks.end_day + 1
+GROUP BY weeks.position, deal.pipeline
+UNION ALL
+SELECT week, pipeline, 'movements', array_agg(DISTINCT deal_id ORDER BY deal_id)
+FROM week_transitions
+GROUP BY week, pipeline
+UNION ALL
+SELECT week, pipeline, 'closed', array_agg(deal_id ORDER BY deal_id)
+FROM first_closes
+GROUP BY week, pipeline
+UNION ALL
+SELECT week, pipeline, 'won', array_agg(deal_id ORDER BY deal_id)
+FROM first_closes
+WHERE positive
+GROUP BY week, pipeline
+""")
+
+
+def build_weekly_query_params(weeks: list[dict], pipeline=None) -> dict:
+    """Query parameters for `weeks` (get_week_data dicts), with the days worked out like build_week_day_index."""
+    if pipeline:
+        pipelines = [pipeline] if isinstance(pipeline, str) else list(pipeline)
+    else:
+        pipelines = PIPELINES
+
+    closed_pipelines, closed_stages, positive = [], [], []
+    for name in pipelines:
+        for stage in sorted(CLOSED_STAGES[name]):
+            closed_pipelines.append(name)
+            closed_stages.append(stage)
+            positive.append(stage in POSITIVE_STAGES[name])
+
+    return {
+        "positions": list(range(len(weeks))),
+        "start_days": [datetime.fromtimestamp(week["start_date"]).date() for week in weeks],
+        "end_days": [datetime.fromtimestamp(week["end_date"]).date() for week in weeks],
+        "closed_pipelines": closed_pipelines,
+        "closed_stages": closed_stages,
+        "positive": positive,
+        "pipelines": pipelines,
+        "margin": TRANSITION_DAY_MARGIN,
+    }
+
+
+def query_weekly_bucket_ids(weeks: list[dict], pipeline=None) -> list[dict]:
+    """
+    Run the weekly aggregate query. Returns one
+    {pipeline: {"new", "closed", "won", "movements"}} dict of deal id lists per week.
+    """
+    buckets = [
+        {name: {"new": [], "closed": [], "won": [], "movements": []} for name in PIPELINES}
+        for _ in weeks
+    ]
+    if not weeks:
+        return buckets
+
+    query = WEEKLY_BUCKETS_QUERY.format(
+        deals=sql.SQL("{}.{}").format(sql.Identifier(schema_name), sql.Identifier(table_name)),
+        transitions=sql.SQL("{}.{}").format(sql.Identifier(schema_name), sql.Identifier(transitions_table_name)),
+    )
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(query, build_weekly_query_params(weeks, pipeline))
+        for position, deal_pipeline, metric, deal_ids in cursor:
+            buckets[position][deal_pipeline][metric] = deal_ids
+    return buckets
+
+
+def expand_bucket_ids(id_buckets: list[dict]) -> list[dict]:
+    """Replace the deal ids in weekly id buckets by the deal rows, fetched in one query."""
+    deal_ids = {
+        deal_id
+        for week_buckets in id_buckets
+        for bucket in week_buckets.values()
+        for ids in bucket.values()
+        for deal_id in ids
+    }
+    deals = {deal["id"]: deal for deal in iter_deals(ids=deal_ids)} if deal_ids else {}
+
+    return [
+        {
+            name: {metric: [deals[deal_id] for deal_id in ids if deal_id in deals] for metric, ids in bucket.items()}
+            for name, bucket in week_buckets.items()
+        }
+        for week_buckets in id_buckets
+    ]
+
+
+def aggregate_weekly_buckets_sql(weeks: list[dict], pipeline=None) -> list[dict]:
+    """
+    aggregate_weekly_buckets computed in Postgres: the deal rows are fetched
+    only for the ids that land in a bucket.
+    """
+    timer = PhaseTimer("weekly", engine="sql")
+    id_buckets = query_weekly_bucket_ids(weeks, pipeline)
+    timer.mark("query")
+    buckets = expand_bucket_ids(id_buckets)
+    timer.mark("expand")
+    return buckets
+
+
+def aggregate_weekly_metrics_sql(weeks: list[dict], pipeline=None) -> list[list[dict]]:
+    """aggregate_weekly_metrics for `weeks`, straight from the database."""
+    buckets = aggregate_weekly_buckets_sql(weeks, pipeline)
+    timer = PhaseTimer("weekly", engine="sql")
+    results = build_weekly_results(weeks, buckets)
+    timer.mark("build")
+    return results
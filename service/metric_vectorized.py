@@ -0,0 +1,250 @@
+# NumPy backend for the deal metrics, selected with METRICS_ENGINE=numpy or engine="numpy".
+# Gives the same results as the pure-Python engine in service.metric_serice.
+# numpy is optional (requirements-optional.txt); metric_serice imports this
+# module only when the numpy engine is picked.
+# The deal lists hold one dict per deal in both engines, and building those
+# dicts is most of the time of get_deals_metrics and of long backfills; there
+# the two engines run at about the same speed. A single week is several times faster.
+from array import array
+from datetime import date, datetime
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "The numpy metrics engine needs numpy (pip install -r requirements-optional.txt); "
+        "use METRICS_ENGINE=python or engine=\"python\" without it"
+    ) from e
+
+from service.deal_model import as_deal_set
+from utils.instrumentation import PhaseTimer
+from service.metric_serice import (
+    CLOSED_STAGES, POSITIVE_STAGES, PIPELINES, build_deals_metrics
+)
+
+MISSING_DAY = -1  # date ordinals are always >= 1
+
+
+class DealColumns:
+    """
+    A DealSet laid out as column arrays:
+    - pipeline: index into PIPELINES (-1 for any other pipeline)
+    - stage, created_day, closing_day: per deal (days are date ordinals, MISSING_DAY if absent)
+    - history_deal, history_stage, history_day: one entry per stage transition,
+      grouped by deal in deal order; history_offsets[i]:history_offsets[i + 1]
+      are the entries of deal i
+    - created_order / history_order: deal and entry indices sorted by day, with
+      the days in that order (created_sorted, history_sorted), so the deals or
+      entries of a week are one searchsorted slice
+    Build it through as_deal_columns, which keeps it on the DealSet.
+    """
+
+    def __init__(self, deal_set):
+        deals = deal_set.deals
+        count = len(deals)
+        pipeline_codes = {pipeline: code for code, pipeline in enumerate(PIPELINES)}
+
+        self.deals = deals
+        self.stage_names = deal_set.stage_names
+        self.pipeline = np.fromiter((pipeline_codes.get(deal.pipeline, -1) for deal in deals), np.int8, count)
+        self.stage = np.fromiter((deal.stage_id for deal in deals), np.int32, count)
+        self.created_day = np.fromiter(
+            (MISSING_DAY if deal.created_day is None else deal.created_day for deal in deals), np.int32, count
+        )
+        self.closing_day = np.fromiter(
+            (MISSING_DAY if deal.closing_day is None else deal.closing_day for deal in deals), np.int32, count
+        )
+
+        flat_history = array("i")
+        lengths = np.fromiter((len(deal.history) // 2 for deal in deals), np.int64, count)
+        for deal in deals:
+            flat_history.extend(deal.history)
+        pairs = np.frombuffer(flat_history, dtype=np.intc).reshape(-1, 2) if flat_history else np.empty((0, 2), np.intc)
+
+        self.history_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.history_deal = np.repeat(np.arange(count, dtype=np.int64), lengths)
+        self.history_stage = pairs[:, 0].astype(np.int32)
+        self.history_day = pairs[:, 1].astype(np.int32)
+
+        self.created_order = np.argsort(self.created_day, kind="stable")
+        self.created_sorted = self.created_day[self.created_order]
+        self.history_order = np.argsort(self.history_day, kind="stable")
+        self.history_sorted = self.history_day[self.history_order]
+
+    def __len__(self):
+        return len(self.deals)
+
+    def stage_lookup(self, stages_by_pipeline: dict):
+        """Boolean table [pipeline code, stage id] -> stage is in stages_by_pipeline[pipeline]."""
+        table = np.zeros((len(PIPELINES), len(self.stage_names)), dtype=bool)
+        for code, pipeline in enumerate(PIPELINES):
+            for stage_id, name in enumerate(self.stage_names):
+                table[code, stage_id] = name in stages_by_pipeline[pipeline]
+        return table
+
+    def row_picker(self) -> "RowPicker":
+        return RowPicker(self.deals)
+
+
+class RowPicker:
+    """
+    CompactDeal.row() of the deals at given indices, built once per deal and
+    shared by every list the deal lands in during one metric call.
+    """
+
+    def __init__(self, deals):
+        self.deals = deals
+        self.rows = [None] * len(deals)
+
+    def pick(self, indices) -> list[dict]:
+        deals, rows = self.deals, self.rows
+        indices = indices.tolist()
+        for i in indices:
+            if rows[i] is None:
+                rows[i] = deals[i].row()
+        return [rows[i] for i in indices]
+
+
+def as_deal_columns(deals) -> DealColumns:
+    """
+    Accept DealColumns, a DealSet or an iterable of deal dicts. The columns of
+    a DealSet are built on the first call and kept on it for the next ones.
+    """
+    if isinstance(deals, DealColumns):
+        return deals
+    deal_set = as_deal_set(deals)
+    columns = deal_set.derived.get("columns")
+    if columns is None:
+        columns = deal_set.derived["columns"] = DealColumns(deal_set)
+    return columns
+
+
+def select_by_week(order, sorted_days, weeks_start_day, weeks_end_day):
+    """
+    The `order` indices whose day falls in each week, as (week position, index)
+    arrays sorted by week and then index: one searchsorted slice per week.
+    """
+    starts = np.searchsorted(sorted_days, weeks_start_day, side="left").tolist()
+    ends = np.searchsorted(sorted_days, weeks_end_day, side="right").tolist()
+    selected = np.concatenate([order[start:end] for start, end in zip(starts, ends)] or [order[:0]])
+    week = np.repeat(np.arange(len(starts)), np.subtract(ends, starts, dtype=np.int64))
+    stride = max(len(order), 1)
+    key = week * stride + selected
+    key.sort()
+    return key // stride, key % stride
+
+
+def first_per_week_and_deal(week, deal):
+    """Mask of the first entry of each (week, deal) run in arrays sorted by week then deal."""
+    first = np.ones(len(deal), dtype=bool)
+    first[1:] = (deal[1:] != deal[:-1]) | (week[1:] != week[:-1])
+    return first
+
+
+def pick_by_week_and_pipeline(columns, rows, week_count: int, week, deal) -> list[list[list[dict]]]:
+    """
+    The rows of the (week position, deal index) pairs, sorted by week then deal,
+    split by pipeline code: result[week][code] is a list of rows in deal order.
+    Deals of other pipelines are left out.
+    """
+    groups = len(PIPELINES)
+    codes = columns.pipeline[deal]
+    known = codes >= 0
+    deal, keys = deal[known], week[known] * groups + codes[known]
+    # Stable, so the deals of a (week, pipeline) group stay in deal order
+    order = np.argsort(keys, kind="stable")
+    bounds = np.searchsorted(keys[order], np.arange(week_count * groups + 1)).tolist()
+    picked = rows.pick(deal[order])
+    return [
+        [picked[bounds[group]:bounds[group + 1]] for group in range(position * groups, (position + 1) * groups)]
+        for position in range(week_count)
+    ]
+
+
+def get_deals_metrics_vectorized(deals):
+    timer = PhaseTimer("current", engine="numpy")
+    columns = as_deal_columns(deals)
+    timer.mark("load")
+    today = date.today().toordinal()
+    has_closing = columns.closing_day != MISSING_DAY
+    overdue = np.flatnonzero(has_closing & (columns.closing_day < today))
+    due_today = np.flatnonzero(columns.closing_day == today)
+
+    rows = columns.row_picker()
+    overdue_rows = rows.pick(overdue)
+    due_today_rows = rows.pick(due_today)
+    overdue_pipeline = columns.pipeline[overdue]
+    due_today_pipeline = columns.pipeline[due_today]
+
+    known = columns.pipeline >= 0
+    pipeline_counts = np.bincount(columns.pipeline[known], minlength=len(PIPELINES))
+    totals, pipeline_overdue, pipeline_due_today = {}, {}, {}
+    for code, pipeline in enumerate(PIPELINES):
+        totals[pipeline] = int(pipeline_counts[code])
+        pipeline_overdue[pipeline] = [overdue_rows[j] for j in np.flatnonzero(overdue_pipeline == code).tolist()]
+        pipeline_due_today[pipeline] = [
+            due_today_rows[j] for j in np.flatnonzero(due_today_pipeline == code).tolist()
+        ]
+
+    timer.mark("classify")
+    return build_deals_metrics(
+        len(columns), overdue_rows, due_today_rows, totals, pipeline_overdue, pipeline_due_today,
+    )
+
+
+def aggregate_weekly_buckets_vectorized(deals, weeks: list[dict]) -> list[dict]:
+    """Array version of metric_serice.aggregate_weekly_buckets."""
+    timer = PhaseTimer("weekly", engine="numpy")
+    columns = as_deal_columns(deals)
+    timer.mark("load")
+    closed_lookup = columns.stage_lookup(CLOSED_STAGES)
+    positive_lookup = columns.stage_lookup(POSITIVE_STAGES)
+
+    # Everything that does not depend on the week is computed once
+    known = columns.pipeline >= 0
+    pipeline_index = np.where(known, columns.pipeline, 0)
+    deal_is_closed = known & closed_lookup[pipeline_index, columns.stage]
+
+    entry_pipeline = pipeline_index[columns.history_deal]
+    entry_closing = (
+        deal_is_closed[columns.history_deal]
+        & closed_lookup[entry_pipeline, columns.history_stage]
+    )
+    entry_positive = positive_lookup[entry_pipeline, columns.history_stage]
+
+    weeks_start_day = [datetime.fromtimestamp(week["start_date"]).date().toordinal() for week in weeks]
+    weeks_end_day = [datetime.fromtimestamp(week["end_date"]).date().toordinal() for week in weeks]
+
+    # (week, deal) pairs of every list, for all weeks at once, sorted by week and deal
+    new_week, new_deal = select_by_week(columns.created_order, columns.created_sorted, weeks_start_day, weeks_end_day)
+    entry_week, entry = select_by_week(columns.history_order, columns.history_sorted, weeks_start_day, weeks_end_day)
+    entry_deal = columns.history_deal[entry]
+    moved = first_per_week_and_deal(entry_week, entry_deal)
+
+    # The first closing entry per (week, deal) is the transition that decides won or lost
+    closing = entry_closing[entry]
+    closing_week, closing_entry, closing_deal = entry_week[closing], entry[closing], entry_deal[closing]
+    first = first_per_week_and_deal(closing_week, closing_deal)
+    closed_week, closed_deal = closing_week[first], closing_deal[first]
+    won = entry_positive[closing_entry[first]]
+
+    rows = columns.row_picker()
+    lists = {
+        metric: pick_by_week_and_pipeline(columns, rows, len(weeks), week, deal)
+        for metric, (week, deal) in {
+            "new": (new_week, new_deal),
+            "closed": (closed_week, closed_deal),
+            "won": (closed_week[won], closed_deal[won]),
+            "movements": (entry_week[moved], entry_deal[moved]),
+        }.items()
+    }
+    buckets = [
+        {
+            pipeline: {metric: by_week[position][code] for metric, by_week in lists.items()}
+            for code, pipeline in enumerate(PIPELINES)
+        }
+        for position in range(len(weeks))
+    ]
+
+    timer.mark("bucket")
+    return buckets
@@ -4,8 +4,14 @@ import os
 import json
 from datetime import datetime, date
 
+from utils.instrumentation import increment, span
+
 # === CONFIG ===
 TAB_NAME = "Deals"
+DEAL_SHEET_COLUMNS = ["id", "deal_name", "amount", "stage", "contact_id", "contact_name", "closing_date", "stage_history"]
+# Rows per batch_update / append_rows call, and a cap on each request's payload
+GSHEET_BATCH_SIZE = int(os.getenv("GSHEET_BATCH_SIZE", "500"))
+GSHEET_MAX_REQUEST_BYTES = int(os.getenv("GSHEET_MAX_REQUEST_BYTES", str(2 * 1024 * 1024)))
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 
 # Auth client
@@ -22,7 +28,90 @@ def get_or_create_worksheet(spreadsheet, tab_name="Deals", rows=100, cols=20):
         print(f"🆕 Created worksheet: {tab_name}")
     return worksheet
 
-# need to work on upsert logic
+
+def flatten_deal_for_sheet(deal: dict) -> list:
+    flat_row = {
+        "id": int(deal["id"]),
+        "deal_name": deal.get("Deal_Name"),
+        "amount": deal.get("Amount"),
+        "stage": deal.get("Stage"),
+        "contact_id": int(deal["Contact_Name"]["id"]) if deal.get("Contact_Name") else None,
+        "contact_name": deal["Contact_Name"]["name"] if deal.get("Contact_Name") else None,
+        "closing_date": deal.get("Closing_Date"),
+        "stage_history": json.dumps(deal.get("Stage_History")) if deal.get("Stage_History") else None
+    }
+    return [flat_row[col] for col in DEAL_SHEET_COLUMNS]
+
+
+def sheet_value(value) -> str:
+    """Normalize a cell value so rows we send compare equal to what get_all_records returns."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def chunk_requests(items: list, max_items: int, max_bytes: int = GSHEET_MAX_REQUEST_BYTES):
+    """Split items into chunks of at most max_items and roughly max_bytes of JSON each."""
+    chunk, chunk_bytes = [], 0
+    for item in items:
+        item_bytes = len(json.dumps(item, default=str))
+        if chunk and (len(chunk) >= max_items or chunk_bytes + item_bytes > max_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
+
+
+def upsert_rows_to_worksheet(worksheet, rows: list[list], batch_size: int = None) -> dict:
+    """
+    Diff rows (keyed by the id in the first column) against the worksheet and write
+    only what changed: changed rows go out in batch_update calls and new rows in
+    append_rows calls, batch_size rows per request.
+    Returns {"updated": n, "appended": m, "unchanged": k}.
+    """
+    batch_size = batch_size or GSHEET_BATCH_SIZE
+    last_col = number_to_column(len(DEAL_SHEET_COLUMNS))
+
+    # Existing rows (as dicts)
+    with span("sheets_request", method="get_all_records"):
+        existing = worksheet.get_all_records()
+    existing_rows = {
+        str(row["id"]): (i + 2, [sheet_value(row.get(col)) for col in DEAL_SHEET_COLUMNS])  # +2 because headers + 1-indexed
+        for i, row in enumerate(existing)
+    }
+
+    # One row per id (last one wins)
+    rows = {str(row[0]): row for row in rows}
+
+    updates = []
+    new_rows = []
+    unchanged = 0
+    for deal_id, row_values in rows.items():
+        if deal_id not in existing_rows:
+            new_rows.append(row_values)
+            continue
+        row_index, current_values = existing_rows[deal_id]
+        if [sheet_value(value) for value in row_values] == current_values:
+            unchanged += 1
+            continue
+        updates.append({"range": f"A{row_index}:{last_col}{row_index}", "values": [row_values]})
+
+    for chunk in chunk_requests(updates, batch_size):
+        with span("sheets_request", method="batch_update"):
+            worksheet.batch_update(chunk)  # update in place
+    for chunk in chunk_requests(new_rows, batch_size):
+        with span("sheets_request", method="append_rows"):
+            worksheet.append_rows(chunk)  # add new rows
+
+    increment("sheet_rows_written", len(updates), operation="updated")
+    increment("sheet_rows_written", len(new_rows), operation="appended")
+    return {"updated": len(updates), "appended": len(new_rows), "unchanged": unchanged}
+
+
 def insert_deals_to_gsheet(deals: list[dict]):
     """
     Upsert deals into the Google Sheet.
@@ -32,33 +121,11 @@ def insert_deals_to_gsheet(deals: list[dict]):
     spreadsheet = client.open_by_key(os.getenv("SPREAD_SHEET_ID"))
     worksheet = get_or_create_worksheet(spreadsheet, TAB_NAME)
 
-    # Existing rows (as dicts)
-    existing = worksheet.get_all_records()
-    id_map = {str(row["id"]): i+2 for i, row in enumerate(existing)}  # +2 because headers + 1-indexed
-
-    for idx, deal in enumerate(deals, 1):
-        print(f"[{idx}/{len(deals)}] Upserting deal ID: {deal['id']}")
-
-        flat_row = {
-            "id": int(deal["id"]),
-            "deal_name": deal.get("Deal_Name"),
-            "amount": deal.get("Amount"),
-            "stage": deal.get("Stage"),
-            "contact_id": int(deal["Contact_Name"]["id"]) if deal.get("Contact_Name") else None,
-            "contact_name": deal["Contact_Name"]["name"] if deal.get("Contact_Name") else None,
-            "closing_date": deal.get("Closing_Date"),
-            "stage_history": json.dumps(deal.get("Stage_History")) if deal.get("Stage_History") else None
-        }
+    result = upsert_rows_to_worksheet(worksheet, [flatten_deal_for_sheet(deal) for deal in deals])
 
-        row_values = list(flat_row.values())
-
-        if str(flat_row["id"]) in id_map:
-            row_index = id_map[str(flat_row["id"])]
-            worksheet.update(f"A{row_index}:H{row_index}", [row_values])  # update in place
-        else:
-            worksheet.append_row(row_values)  # add new row
-
-    print(f"✅ {len(deals)} deals upserted successfully!")
+    print(f"✅ {len(deals)} deals upserted successfully! "
+          f"({result['updated']} updated, {result['appended']} appended, {result['unchanged']} unchanged)")
+    return result
 
 def number_to_column(n: int) -> str:
     """Convert 1-indexed column number to Excel/Sheets column letters."""
@@ -69,40 +136,63 @@ def number_to_column(n: int) -> str:
     return result
 
 
-def get_row_and_col(worksheet, search_value):
-    print(f"Searching for '{search_value}' in the worksheet..."
-          )
-    cell = worksheet.find(search_value)
-    if cell:
-        return cell.row, cell.col
-    return None, None
+def get_sheet_layout(worksheet) -> dict:
+    """
+    Read the worksheet once and index every label to the (row, col) of the
+    first cell containing it, like worksheet.find does. The update_deals_sheet_*
+    functions read it once per refresh and pass it to the helpers below, so a
+    label moved on the sheet is picked up by the next refresh.
+    """
+    layout = {}
+    with span("sheets_request", method="get_all_values"):
+        values_by_row = worksheet.get_all_values()
+    for row, values in enumerate(values_by_row, 1):
+        for col, value in enumerate(values, 1):
+            if value and value not in layout:
+                layout[value] = (row, col)
+    return layout
+
+
+def get_row_and_col(worksheet, search_value, layout: dict = None):
+    if layout is None:
+        layout = get_sheet_layout(worksheet)
+    return layout.get(search_value, (None, None))
+
 
-def update_summary(worksheet, summary, summary_data):
+def write_range(worksheet, range_name, values, updates: list = None):
+    """Write now, or queue the write in `updates` for a single batch_update."""
+    if updates is None:
+        with span("sheets_request", method="update"):
+            worksheet.update(range_name, values)
+    else:
+        updates.append({"range": range_name, "values": values})
+
+
+def update_summary(worksheet, summary, summary_data, updates: list = None, layout: dict = None):
     
-    row,col = get_row_and_col(worksheet, summary)
+    row,col = get_row_and_col(worksheet, summary, layout)
     
     if row and col:
         col = number_to_column(col)
         values_row = row + 3  # Assuming values are 3 rows below the summary title
-        worksheet.update(f"{col}{values_row}", [summary_data])
+        write_range(worksheet, f"{col}{values_row}", [summary_data], updates)
     else:
         print(f"Summary '{summary}' not found.") 
 
 
-def update_due_today_list(worksheet, due_today):
-    row, col = get_row_and_col(worksheet, "Due_Today")
-    print(row)
+def update_due_today_list(worksheet, due_today, updates: list = None, layout: dict = None):
+    row, col = get_row_and_col(worksheet, "Due_Today", layout)
     due_today = [[deal.get("deal_name"), deal.get("stage"), deal.get("pipeline")] for deal in due_today]
 
     if row and col:
         values_row = row + 3  # Assuming values are 3 rows below the summary title
-        worksheet.update(f"A{values_row}", due_today)
+        write_range(worksheet, f"A{values_row}", due_today, updates)
     else:
         print(f"Due Today list not found.")
 
 
-def update_table(worksheet, table_name,table_data):
-    row, col = get_row_and_col(worksheet, table_name)
+def update_table(worksheet, table_name,table_data, updates: list = None, layout: dict = None):
+    row, col = get_row_and_col(worksheet, table_name, layout)
     
     col = number_to_column(col)
     if row and col:
@@ -117,7 +207,7 @@ def update_table(worksheet, table_name,table_data):
             ]
             for data in table_data
         ]        
-        worksheet.update(f"{col}{start_row}", table_data)
+        write_range(worksheet, f"{col}{start_row}", table_data, updates)
     else:
         print(f"Table '{table_name}' not found.")
     
@@ -136,10 +226,16 @@ def update_deals_sheet_summary(deals_object:dict[str:any], table_name="pipeline_
     qual_summary = [deals_object.get("qual_total", 0), len(deals_object.get("quals_overdue", [])), len(deals_object.get("quals_due_today", []))]
     slowmo_summary = [deals_object.get("slowmo_total", 0), len(deals_object.get("slowmo_overdue", [])), len(deals_object.get("slowmo_due_today", []))]
 
-    update_summary(worksheet, "Overall_Summary", overall_summary)
-    update_summary(worksheet, "Sales_Summary", sales_summary)
-    update_summary(worksheet, "Quals_Summary", qual_summary)
-    update_summary(worksheet, "Slowmo_Summary", slowmo_summary)
+    # One layout read, then every write goes out in a single request
+    layout = get_sheet_layout(worksheet)
+    updates = []
+    update_summary(worksheet, "Overall_Summary", overall_summary, updates, layout)
+    update_summary(worksheet, "Sales_Summary", sales_summary, updates, layout)
+    update_summary(worksheet, "Quals_Summary", qual_summary, updates, layout)
+    update_summary(worksheet, "Slowmo_Summary", slowmo_summary, updates, layout)
+    if updates:
+        with span("sheets_request", method="batch_update"):
+            worksheet.batch_update(updates)
 
     
     
@@ -152,14 +248,21 @@ def update_deals_sheet_tables(deals_object:dict[str:any], table_name="todos_summ
     spreadsheet = client.open_by_key("18UncISysDR82lgZ9gOHkk64MXLVz3nWhZNTgYaZ-gZA")
     worksheet = get_or_create_worksheet(spreadsheet, table_name)
     
-    update_due_today_list(worksheet, deals_object.get("total_due_today_list", []))
+    # One layout read, then every write goes out in a single request
+    layout = get_sheet_layout(worksheet)
+    updates = []
+    update_due_today_list(worksheet, deals_object.get("total_due_today_list", []), updates, layout)
     
     
-    update_table(worksheet, "Sales_Overdue", deals_object.get("sales_overdue", []))
+    update_table(worksheet, "Sales_Overdue", deals_object.get("sales_overdue", []), updates, layout)
     
-    update_table(worksheet, "Quals_Overdue", deals_object.get("quals_overdue", []))
+    update_table(worksheet, "Quals_Overdue", deals_object.get("quals_overdue", []), updates, layout)
     
-    update_table(worksheet, "Slowmo_Overdue", deals_object.get("slowmo_overdue", []))
+    update_table(worksheet, "Slowmo_Overdue", deals_object.get("slowmo_overdue", []), updates, layout)
+
+    if updates:
+        with span("sheets_request", method="batch_update"):
+            worksheet.batch_update(updates)
 
 
 
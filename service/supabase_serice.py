@@ -1,93 +1,376 @@
-import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import json
 import os
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from utils.utils import parse_iso_datetime
+from utils.instrumentation import ProgressReporter, increment
+from service.db_pool import get_pool
+from service.deal_model import DealSet, parse_modified_date
 load_dotenv()
 
-DB_URL = os.getenv("DB_URL")
 schema_name = "Bigin"
 table_name = "deals"
+transitions_table_name = "stage_transitions"
+DB_UPSERT_BATCH_SIZE = int(os.getenv("DB_UPSERT_BATCH_SIZE", "1000"))
+DB_FETCH_ITERSIZE = int(os.getenv("DB_FETCH_ITERSIZE", "2000"))
+# Keep Bigin.stage_transitions in step with the deals upserted by the sync
+DB_WRITE_STAGE_TRANSITIONS = os.getenv("DB_WRITE_STAGE_TRANSITIONS", "true").lower() in ("1", "true", "yes")
+# Keep Bigin.weekly_pipeline_metrics up to date for the deals upserted by the sync
+DB_WRITE_WEEKLY_AGGREGATES = os.getenv("DB_WRITE_WEEKLY_AGGREGATES", "true").lower() in ("1", "true", "yes")
+
+DEAL_COLUMNS = [
+    "id", "deal_name", "amount", "stage", "contact_id", "contact_name",
+    "closing_date", "stage_history", "pipeline", "created_time", "modified_time",
+]
+# modified_date is the day in Modified_Time's own offset, which is what the weekly metrics compare on
+TRANSITION_COLUMNS = ["deal_id", "position", "pipeline", "stage", "modified_time", "modified_date"]
+
+_created_tables = set()
+
+
+def ensure_table(name: str, create):
+    """Run `create` (a CREATE ... IF NOT EXISTS) the first time `name` is written to in this process."""
+    if name not in _created_tables:
+        create()
+        _created_tables.add(name)
+
 
 def get_db_connection():
-    return psycopg2.connect(DB_URL)
+    """
+    Borrow a connection from the process-wide pool:
+        with get_db_connection() as connection: ...
+    Commits on success, rolls back on error and returns the connection to the pool.
+    """
+    return get_pool().connection()
+
+
+def flatten_deal(deal: dict) -> dict:
+    """
+    Map a Zoho Pipelines record (with its stage_history) to a Bigin.Deals row.
+    """
+    return {
+        "id": int(deal["id"]),
+        "deal_name": deal.get("Deal_Name", None),
+        "amount": deal.get("Amount", None),
+        "stage": deal.get("Stage", None),
+        "contact_id": int(deal["Contact_Name"]["id"]) if deal.get("Contact_Name") else None,
+        "contact_name": deal["Contact_Name"]["name"] if deal.get("Contact_Name") else None,
+        "closing_date": deal.get("Closing_Date", None),
+        "stage_history": json.dumps(deal["stage_history"]) if deal.get("stage_history") is not None else None,
+        "pipeline": deal.get("Pipeline", {}).get("name", None) if deal.get("Pipeline") else None,
+        "created_time": parse_iso_datetime(deal.get("Created_Time", None)),
+        "modified_time": parse_iso_datetime(deal.get("Modified_Time", None)),
+    }
+
+
+def flatten_stage_transitions(deal_id: int, pipeline: str, stage_history) -> list[tuple]:
+    """
+    Bigin.stage_transitions rows (TRANSITION_COLUMNS order) for a deal's stage
+    history (a list, or the JSON text stored in Bigin.Deals). Entries without a
+    usable Modified_Time are left out, like the metric engines do.
+    """
+    if isinstance(stage_history, str):
+        stage_history = json.loads(stage_history)
+
+    rows = []
+    for position, stage_entry in enumerate(stage_history or []):
+        modified_time = stage_entry.get("Modified_Time")
+        if not modified_time:
+            continue
+        modified_date = parse_modified_date(modified_time)
+        if modified_date is None:
+            continue
+        rows.append((deal_id, position, pipeline, stage_entry.get("Stage"),
+                     parse_iso_datetime(modified_time), modified_date))
+    return rows
+
+
+def create_stage_transitions_table():
+    """
+    Create Bigin.stage_transitions (one row per stage history entry) and the
+    indexes the SQL weekly metrics rely on, if they don't exist yet.
+    """
+    statements = [
+        sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {}.{} ("
+            "deal_id bigint NOT NULL, "
+            "position integer NOT NULL, "
+            "pipeline text, "
+            "stage text, "
+            "modified_time timestamptz NOT NULL, "
+            "modified_date date NOT NULL, "
+            "PRIMARY KEY (deal_id, position))"
+        ).format(sql.Identifier(schema_name), sql.Identifier(transitions_table_name)),
+        sql.SQL("CREATE INDEX IF NOT EXISTS stage_transitions_pipeline_modified_time_idx ON {}.{} (pipeline, modified_time)").format(
+            sql.Identifier(schema_name), sql.Identifier(transitions_table_name)
+        ),
+        sql.SQL("CREATE INDEX IF NOT EXISTS deals_pipeline_created_time_idx ON {}.{} (pipeline, created_time)").format(
+            sql.Identifier(schema_name), sql.Identifier(table_name)
+        ),
+    ]
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def replace_stage_transitions(cursor, deal_ids: list[int], transitions: list[tuple]):
+    """Swap the stored transitions of `deal_ids` for `transitions`, on the caller's cursor/transaction."""
+    cursor.execute(
+        sql.SQL("DELETE FROM {}.{} WHERE deal_id = ANY(%s)").format(
+            sql.Identifier(schema_name), sql.Identifier(transitions_table_name)
+        ),
+        (deal_ids,)
+    )
+    if transitions:
+        insert_stmt = sql.SQL("INSERT INTO {}.{} ({}) VALUES %s").format(
+            sql.Identifier(schema_name),
+            sql.Identifier(transitions_table_name),
+            sql.SQL(", ").join(map(sql.Identifier, TRANSITION_COLUMNS))
+        )
+        execute_values(cursor, cursor.mogrify(insert_stmt), transitions, page_size=len(transitions))
+
+
+def rebuild_stage_transitions(batch_size: int = None) -> int:
+    """
+    Recreate Bigin.stage_transitions from the stage_history stored in Bigin.Deals
+    (after creating the table, or if it got out of step). Returns the number of rows written.
+    """
+    batch_size = batch_size or DB_UPSERT_BATCH_SIZE
+    create_stage_transitions_table()
+
+    written = 0
+    # The deals are read on the writing connection: one transaction, one pooled connection
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE {}.{}").format(
+            sql.Identifier(schema_name), sql.Identifier(transitions_table_name)
+        ))
+        deal_ids, transitions = [], []
+        for deal in iter_deals(columns=["id", "pipeline", "stage_history"], connection=connection):
+            deal_ids.append(deal["id"])
+            transitions.extend(flatten_stage_transitions(deal["id"], deal["pipeline"], deal["stage_history"]))
+            if len(deal_ids) >= batch_size:
+                replace_stage_transitions(cursor, deal_ids, transitions)
+                written += len(transitions)
+                deal_ids, transitions = [], []
+        if deal_ids:
+            replace_stage_transitions(cursor, deal_ids, transitions)
+            written += len(transitions)
+
+    print(f"{written} stage transitions written")
+    return written
+
+
+def build_upsert_statement():
+    """
+    INSERT ... VALUES %s ON CONFLICT (id) DO UPDATE for execute_values.
+    RETURNING (xmax = 0) is true for freshly inserted rows and false for updated ones.
+    """
+    # Columns to update if conflict occurs (exclude primary key 'id')
+    update_cols = [col for col in DEAL_COLUMNS if col != "id"]
+
+    return sql.SQL(
+        "INSERT INTO {}.{} ({fields}) VALUES %s "
+        "ON CONFLICT (id) DO UPDATE SET {updates} "
+        "RETURNING (xmax = 0) AS inserted"
+    ).format(
+        sql.Identifier(schema_name),
+        sql.Identifier(table_name),
+        fields=sql.SQL(", ").join(map(sql.Identifier, DEAL_COLUMNS)),
+        updates=sql.SQL(", ").join(
+            sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(col), sql.Identifier(col)) for col in update_cols
+        )
+    )
+
 
-def insert_deals_in_supabase(deals: list[dict]):
+def insert_deals_in_supabase(deals: list[dict], batch_size: int = None) -> dict:
     """
     Upsert deals into the Bigin.Deals table.
     If a deal with the same id exists, overwrite it; otherwise, create a new row.
+    Rows are sent in batches of `batch_size` inside a single transaction,
+    together with the deals' rows in Bigin.stage_transitions and their
+    weekly buckets in Bigin.weekly_pipeline_metrics.
+    Returns {"inserted": n, "updated": m}.
     """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    
+    batch_size = batch_size or DB_UPSERT_BATCH_SIZE
+
+    # One row per id (last one wins): a multi-row upsert cannot touch the same row twice
+    rows = {}
     for deal in deals:
+        flat_row = flatten_deal(deal)
+        rows[flat_row["id"]] = tuple(flat_row[col] for col in DEAL_COLUMNS)
+    rows = list(rows.values())
+    id_col, pipeline_col, history_col = (DEAL_COLUMNS.index(col) for col in ("id", "pipeline", "stage_history"))
 
-        print(f"[{deals.index(deal) + 1}/{len(deals)}] Inserting/Updating deal ID: {deal['id']}")
-        flat_row = {
-            "id": int(deal["id"]),
-            "deal_name": deal.get("Deal_Name", None),
-            "amount": deal.get("Amount", None),
-            "stage": deal.get("Stage", None),
-            "contact_id": int(deal["Contact_Name"]["id"]) if deal.get("Contact_Name") else None,
-            "contact_name": deal["Contact_Name"]["name"] if deal.get("Contact_Name") else None,
-            "closing_date": deal.get("Closing_Date", None),
-            "stage_history": json.dumps(deal.get("stage_history")) if deal.get("stage_history") else None,
-            "pipeline": deal.get("Pipeline", {}).get("name", None) if deal.get("Pipeline") else None,
-            "created_time": parse_iso_datetime(deal.get("Created_Time", None)),
-            "modified_time": parse_iso_datetime(deal.get("Modified_Time", None)),
-            
-        }
-        
-        columns = flat_row.keys()
-        values = [flat_row[col] for col in columns]
-        
-        # Columns to update if conflict occurs (exclude primary key 'id')
-        update_cols = [col for col in columns if col != "id"]
-        
-        insert_stmt = sql.SQL(
-            "INSERT INTO {}.{} ({fields}) VALUES ({placeholders}) "
-            "ON CONFLICT (id) DO UPDATE SET {updates}"
-        ).format(
-            sql.Identifier(schema_name),
-            sql.Identifier(table_name),
-            fields=sql.SQL(", ").join(map(sql.Identifier, columns)),
-            placeholders=sql.SQL(", ").join(sql.Placeholder() * len(values)),
-            updates=sql.SQL(", ").join(
-                sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(col), sql.Identifier(col)) for col in update_cols
-            )
+    inserted = updated = 0
+    if DB_WRITE_STAGE_TRANSITIONS:
+        ensure_table(transitions_table_name, create_stage_transitions_table)
+    if DB_WRITE_WEEKLY_AGGREGATES:
+        from service.weekly_aggregates import (
+            aggregates_table_name, create_weekly_aggregates_table, update_weekly_aggregates
         )
-        
-        cursor.execute(insert_stmt, values)
-    
-    connection.commit()
-    cursor.close()
-    connection.close()
-    print(f"{len(deals)} deals inserted/updated successfully!")
+        ensure_table(aggregates_table_name, create_weekly_aggregates_table)
+
+    # One transaction for all batches
+    progress = ProgressReporter("Deals upserted", total=len(rows))
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        # Rendered once for all batches (mogrify without arguments leaves the VALUES %s in place)
+        insert_stmt = cursor.mogrify(build_upsert_statement())
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            results = execute_values(cursor, insert_stmt, batch, page_size=len(batch), fetch=True)
+            batch_inserted = sum(1 for (is_insert,) in results if is_insert)
+            inserted += batch_inserted
+            updated += len(results) - batch_inserted
+            if DB_WRITE_STAGE_TRANSITIONS:
+                transitions = []
+                for row in batch:
+                    transitions.extend(flatten_stage_transitions(row[id_col], row[pipeline_col], row[history_col]))
+                replace_stage_transitions(cursor, [row[id_col] for row in batch], transitions)
+            progress.update(start + len(batch))
+
+        if DB_WRITE_WEEKLY_AGGREGATES:
+            update_weekly_aggregates(cursor, [row[id_col] for row in rows])
+
+    increment("deals_upserted", inserted, result="inserted")
+    increment("deals_upserted", updated, result="updated")
+    print(f"{len(rows)} deals upserted successfully! ({inserted} inserted, {updated} updated)")
+    return {"inserted": inserted, "updated": updated}
 
 
-def fetch_all_deals():
+def get_deals_watermark():
     """
-    Fetch all deals from the Bigin.Deals table.
+    Return the latest modified_time stored in Bigin.Deals (None if the table is empty).
+    Used as the high-water mark for incremental syncs.
+    """
+    query = sql.SQL("SELECT MAX(modified_time) FROM {}.{}").format(
+        sql.Identifier(schema_name),
+        sql.Identifier(table_name)
+    )
+
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(query)
+        return cursor.fetchone()[0]
+
+
+def get_deal_fingerprints(deal_ids: list[int]) -> dict:
     """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    
-    query = sql.SQL("SELECT * FROM {}.{}").format(
+    {id: (modified_time, stage, history_length, stage_history)} for the stored
+    deals among `deal_ids`, stage_history parsed. history_length is None (and
+    stage_history []) when no history was stored; 0 is a fetched, empty history.
+    The sync compares these with the Pipelines records to tell which deals
+    changed since they were stored.
+    """
+    if not deal_ids:
+        return {}
+    query = sql.SQL("SELECT id, modified_time, stage, stage_history FROM {}.{} WHERE id = ANY(%s)").format(
         sql.Identifier(schema_name),
         sql.Identifier(table_name)
     )
-    
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    
-    # Fetch column names
-    colnames = [desc[0] for desc in cursor.description]
-    
-    # Convert rows to list of dicts
-    deals = [dict(zip(colnames, row)) for row in rows]
-    
-    cursor.close()
-    connection.close()
-    
-    return deals
\ No newline at end of file
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(query, (list(deal_ids),))
+        fingerprints = {}
+        for deal_id, modified_time, stage, stage_history in cursor:
+            if isinstance(stage_history, str):
+                stage_history = json.loads(stage_history)
+            history_length = None if stage_history is None else len(stage_history)
+            fingerprints[deal_id] = (modified_time, stage, history_length, stage_history or [])
+        return fingerprints
+
+
+def iter_deals(columns: list[str] = None, pipeline=None, ids=None,
+               created_from=None, created_to=None,
+               modified_from=None, modified_to=None,
+               itersize: int = None, connection=None):
+    """
+    Stream deals from the Bigin.Deals table through a server-side cursor.
+    - columns: only select these columns (default: all)
+    - pipeline: a pipeline name or a list of names
+    - ids: only these deal ids
+    - created_from/created_to, modified_from/modified_to: time range filters
+      (lower bound inclusive, upper bound exclusive)
+    Rows are pulled `itersize` at a time, so memory stays flat however big the table is.
+    With `connection` the rows are read on it, inside the caller's transaction;
+    otherwise a connection is borrowed from the pool for the duration.
+    """
+    if columns:
+        unknown = [col for col in columns if col not in DEAL_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown deal columns: {unknown}")
+        fields = sql.SQL(", ").join(map(sql.Identifier, columns))
+    else:
+        fields = sql.SQL("*")
+
+    conditions = []
+    params = []
+    if pipeline:
+        conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier("pipeline")))
+        params.append([pipeline] if isinstance(pipeline, str) else list(pipeline))
+    if ids is not None:
+        conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier("id")))
+        params.append(list(ids))
+    for column, operator, value in (
+        ("created_time", ">=", created_from),
+        ("created_time", "<", created_to),
+        ("modified_time", ">=", modified_from),
+        ("modified_time", "<", modified_to),
+    ):
+        if value is not None:
+            conditions.append(sql.SQL("{} " + operator + " %s").format(sql.Identifier(column)))
+            params.append(value)
+
+    query = sql.SQL("SELECT {} FROM {}.{}").format(
+        fields,
+        sql.Identifier(schema_name),
+        sql.Identifier(table_name)
+    )
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+
+    if connection is None:
+        with get_db_connection() as connection:
+            yield from stream_rows(connection, query, params, itersize)
+    else:
+        yield from stream_rows(connection, query, params, itersize)
+
+
+def stream_rows(connection, query, params, itersize: int = None):
+    """Yield the rows of `query` as dicts through a named (server-side) cursor on `connection`."""
+    # A named cursor lives on the server and is fetched itersize rows at a time
+    with connection.cursor(name="iter_deals") as cursor:
+        cursor.itersize = itersize or DB_FETCH_ITERSIZE
+        cursor.execute(query, params)
+        colnames = None
+        for row in cursor:
+            if colnames is None:
+                colnames = [desc[0] for desc in cursor.description]
+            yield dict(zip(colnames, row))
+
+
+def fetch_all_deals(**filters):
+    """
+    Fetch all deals from the Bigin.Deals table.
+    Accepts the same column/filter arguments as iter_deals.
+    """
+    return list(iter_deals(**filters))
+
+
+def fetch_deal_set(**filters) -> DealSet:
+    """
+    Load deals into a DealSet for the metrics, straight off the server-side
+    cursor: each row is parsed as it arrives, with no list of all the rows
+    built first. Accepts the same column/filter arguments as iter_deals.
+    """
+    return DealSet.from_records(iter_deals(**filters))
+
+
+def fetch_deals_for_weeks(weeks: list[dict], **filters) -> DealSet:
+    """
+    Load (fetch_deal_set) the deals that can appear in the weekly metrics of
+    `weeks` (get_week_data dicts): a deal created or moved during a week was
+    modified after the week started (1 day margin for timezones).
+    """
+    earliest_start = min(week["start_date"] for week in weeks)
+    modified_from = datetime.fromtimestamp(earliest_start) - timedelta(days=1)
+    return fetch_deal_set(modified_from=modified_from, **filters)
@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from service.zoho_service import iter_deal_pages, attach_stage_histories
+from service.supabase_serice import insert_deals_in_supabase, get_deals_watermark, get_deal_fingerprints
+from utils.cache import bump_data_version
+from utils.instrumentation import ProgressReporter, increment
+from utils.utils import parse_iso_datetime
+
+SYNC_CHECKPOINT_FILE = os.getenv("SYNC_CHECKPOINT_FILE", "keys/sync_checkpoint.json")
+# Zoho page tokens expire after a day; older checkpoints restart from the first page
+SYNC_PAGE_TOKEN_MAX_AGE = int(os.getenv("SYNC_PAGE_TOKEN_MAX_AGE", str(23 * 3600)))
+
+
+def load_checkpoint() -> dict:
+    if not os.path.exists(SYNC_CHECKPOINT_FILE):
+        return {}
+    with open(SYNC_CHECKPOINT_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint: dict):
+    checkpoint_dir = os.path.dirname(SYNC_CHECKPOINT_FILE) or "."
+    with tempfile.NamedTemporaryFile("w", dir=checkpoint_dir, suffix=".tmp", delete=False) as f:
+        json.dump(checkpoint, f)
+    os.replace(f.name, SYNC_CHECKPOINT_FILE)
+
+
+class SyncCancelled(Exception):
+    pass
+
+
+def clear_checkpoint():
+    if os.path.exists(SYNC_CHECKPOINT_FILE):
+        os.remove(SYNC_CHECKPOINT_FILE)
+
+
+def reuse_stored_stage_histories(deals: list[dict]) -> list[dict]:
+    """
+    Give every deal whose Modified_Time and Stage match the stored row, and
+    that has a stored stage history, that stored history (any stage change
+    moves Modified_Time). A stored empty history is reused too: the deal had
+    no stage changes when it was fetched. Returns the deals whose history
+    still has to be fetched.
+    """
+    fingerprints = get_deal_fingerprints([int(deal["id"]) for deal in deals if deal.get("id")])
+    to_fetch = []
+    for deal in deals:
+        stored = fingerprints.get(int(deal["id"])) if deal.get("id") else None
+        if stored:
+            modified_time, stage, history_length, stage_history = stored
+            if (history_length is not None and stage == deal.get("Stage")
+                    and modified_time == parse_iso_datetime(deal.get("Modified_Time"))):
+                deal["stage_history"] = stage_history
+                continue
+        to_fetch.append(deal)
+    return to_fetch
+
+
+def sync_progress_detail(totals: dict) -> str:
+    return f"in {totals['pages']} pages ({totals['history_calls_saved']} stage history calls saved)"
+
+
+def sync_deals(full_resync: bool = False, resume: bool = True, workers: int = None,
+               progress: dict = None, cancel_event=None, force_refetch: bool = False) -> dict:
+    """
+    Stream deals from Bigin into Supabase one page at a time: each page of
+    Pipelines records gets its stage histories and is upserted before the
+    next page is fetched, so memory is bounded by the page size.
+
+    After every page a checkpoint with the next page token is saved, and an
+    interrupted run continues from there. The checkpoint also keeps the
+    run's original modified_since watermark, because the pages already
+    upserted have moved the watermark in the table forward.
+
+    Deals unchanged since they were stored (same Modified_Time and Stage,
+    with a stored stage history, even an empty one) keep that history instead
+    of costing a Stage_History request; force_refetch=True fetches every
+    history again.
+    If a stage history can't be fetched the page is not stored and the sync
+    fails with ZohoAPIError; the checkpoint makes the next run retry that page.
+
+    progress: optional dict whose deals_fetched / histories_fetched /
+    histories_reused / rows_upserted counters are updated as the sync goes.
+    cancel_event: optional threading.Event; when set the sync stops after the
+    current page with SyncCancelled (the checkpoint is kept).
+    """
+    if progress is None:
+        progress = {}
+    for counter in ("deals_fetched", "histories_fetched", "histories_reused", "rows_upserted"):
+        progress.setdefault(counter, 0)
+
+    checkpoint = load_checkpoint()
+    page_token = None
+    totals = {"pages": 0, "deals": 0, "inserted": 0, "updated": 0, "history_calls_saved": 0}
+
+    # An unfinished run is continued; asking for a full resync supersedes an
+    # unfinished incremental one. With resume=False it restarts from the first page.
+    if checkpoint and (not full_resync or checkpoint.get("full_resync")):
+        full_resync = checkpoint.get("full_resync", False)
+        modified_since = checkpoint.get("modified_since")
+        modified_since = datetime.fromisoformat(modified_since) if modified_since else None
+        token_age = time.time() - checkpoint.get("updated_at", 0)
+        if resume and token_age < SYNC_PAGE_TOKEN_MAX_AGE:
+            page_token = checkpoint.get("next_page_token")
+            totals = dict(totals, **checkpoint.get("totals", {}))
+            print(f"Resuming sync from page token {page_token} ({totals['deals']} deals already stored)")
+    else:
+        modified_since = None if full_resync else get_deals_watermark()
+
+    print(f"Syncing deals... (modified since: {modified_since or 'beginning'})")
+    reporter = ProgressReporter("Deals synced")
+    for deals, next_page_token in iter_deal_pages(modified_since, page_token):
+        progress["deals_fetched"] += len(deals)
+        to_fetch = deals if force_refetch else reuse_stored_stage_histories(deals)
+        attach_stage_histories(to_fetch, workers)
+        progress["histories_fetched"] += len(to_fetch)
+        progress["histories_reused"] += len(deals) - len(to_fetch)
+        upserted = insert_deals_in_supabase(deals) if deals else {"inserted": 0, "updated": 0}
+        progress["rows_upserted"] += upserted["inserted"] + upserted["updated"]
+        if deals:
+            bump_data_version()
+
+        totals["pages"] += 1
+        totals["deals"] += len(deals)
+        totals["inserted"] += upserted["inserted"]
+        totals["updated"] += upserted["updated"]
+        totals["history_calls_saved"] += len(deals) - len(to_fetch)
+        increment("sync_pages")
+        increment("stage_history_calls_saved", len(deals) - len(to_fetch))
+        reporter.update(totals["deals"], detail=sync_progress_detail(totals))
+
+        if next_page_token:
+            save_checkpoint({
+                "full_resync": full_resync,
+                "modified_since": modified_since.isoformat() if modified_since else None,
+                "next_page_token": next_page_token,
+                "totals": totals,
+                "updated_at": time.time(),
+            })
+            # Checked only before fetching another page: a cancel that arrives
+            # during the last page lets the finished run complete
+            if cancel_event is not None and cancel_event.is_set():
+                raise SyncCancelled(f"Sync cancelled after {totals['pages']} pages")
+
+    reporter.finish(detail=sync_progress_detail(totals))
+    clear_checkpoint()
+    return totals
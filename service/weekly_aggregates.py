@@ -0,0 +1,253 @@
+# Materialized weekly metrics: Bigin.weekly_pipeline_metrics keeps, for every
+# (week, pipeline), the ids of the new / closed / won / moved deals. The sync
+# only touches the weeks the upserted deals count in, so reading a week is one
+# row per pipeline however many deals are stored.
+from datetime import date, datetime, timedelta
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from service.deal_model import DealSet
+from service.metric_serice import (
+    PIPELINES, aggregate_weekly_buckets, build_weekly_results, calculate_weekly_metrics_for_weeks
+)
+from service.metric_sql import expand_bucket_ids
+from service.supabase_serice import (
+    get_db_connection, iter_deals, fetch_deals_for_weeks, schema_name, table_name, DB_UPSERT_BATCH_SIZE
+)
+from utils.instrumentation import PhaseTimer
+from utils.utils import get_week_data_for_date
+
+aggregates_table_name = "weekly_pipeline_metrics"
+
+# get_week_data weeks start on these days of the month and run for 6 days
+WEEK_START_DAYS = (1, 8, 15, 22, 29)
+WEEK_LENGTH_DAYS = 6
+
+METRIC_COLUMNS = {"new": "new_ids", "closed": "closed_ids", "won": "won_ids", "movements": "movement_ids"}
+METRIC_LIST_KEYS = {
+    "new": "new_deals_list", "closed": "closed_deals_list",
+    "won": "won_deals_list", "movements": "movements_list",
+}
+# What the weekly metrics need from a Bigin.Deals row
+AGGREGATE_DEAL_COLUMNS = ["id", "pipeline", "stage", "created_time", "closing_date", "stage_history"]
+
+
+def aggregates_table():
+    return sql.SQL("{}.{}").format(sql.Identifier(schema_name), sql.Identifier(aggregates_table_name))
+
+
+def create_weekly_aggregates_table():
+    """Create Bigin.weekly_pipeline_metrics if it doesn't exist yet."""
+    id_columns = sql.SQL(", ").join(
+        sql.SQL("{} bigint[] NOT NULL DEFAULT '{{}}'").format(sql.Identifier(column))
+        for column in METRIC_COLUMNS.values()
+    )
+    statement = sql.SQL(
+        "CREATE TABLE IF NOT EXISTS {} ("
+        "week_start date NOT NULL, "
+        "week_name text NOT NULL, "
+        "pipeline text NOT NULL, "
+        "{}, "
+        "updated_at timestamptz NOT NULL DEFAULT now(), "
+        "PRIMARY KEY (week_start, pipeline))"
+    ).format(aggregates_table(), id_columns)
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(statement)
+
+
+def week_starts_containing(day: date) -> list[date]:
+    """Start days of the weeks containing `day`: none, one, or two where a 29th week runs into the next month."""
+    starts = []
+    for days_back in range(WEEK_LENGTH_DAYS):
+        start = day - timedelta(days=days_back)
+        if start.day in WEEK_START_DAYS:
+            starts.append(start)
+    return starts
+
+
+def weeks_for_deals(deal_set: DealSet) -> list[dict]:
+    """get_week_data dicts of every week the deals can count in (created or moved during it)."""
+    days = set()
+    for deal in deal_set:
+        if deal.created_day is not None:
+            days.add(deal.created_day)
+        days.update(day for _, day in deal.transitions())
+    starts = {start for day in days for start in week_starts_containing(date.fromordinal(day))}
+    return [get_week_data_for_date(start) for start in sorted(starts)]
+
+
+def weekly_contributions(deals) -> dict:
+    """
+    {(week start, week name, pipeline): {metric: [deal ids]}} for `deals` (Bigin.Deals
+    rows), worked out with aggregate_weekly_buckets so the semantics are the same.
+    Only non-empty buckets are returned.
+    """
+    deal_set = DealSet.from_records(deals)
+    weeks = weeks_for_deals(deal_set)
+    contributions = {}
+    for week, week_buckets in zip(weeks, aggregate_weekly_buckets(deal_set, weeks)):
+        week_start = datetime.fromtimestamp(week["start_date"]).date()
+        for pipeline, bucket in week_buckets.items():
+            if any(bucket.values()):
+                contributions[(week_start, week["name"], pipeline)] = {
+                    metric: [deal["id"] for deal in records] for metric, records in bucket.items()
+                }
+    return contributions
+
+
+def remove_from_weekly_aggregates(cursor, deal_ids: list[int]):
+    """Take `deal_ids` out of every bucket they are in."""
+    updates = sql.SQL(", ").join(
+        sql.SQL("{column} = ARRAY(SELECT id FROM unnest({column}) AS id WHERE id <> ALL(%(ids)s::bigint[]))").format(
+            column=sql.Identifier(column)
+        )
+        for column in METRIC_COLUMNS.values()
+    )
+    overlaps = sql.SQL(" OR ").join(
+        sql.SQL("{} && %(ids)s::bigint[]").format(sql.Identifier(column)) for column in METRIC_COLUMNS.values()
+    )
+    cursor.execute(
+        sql.SQL("UPDATE {} SET {}, updated_at = now() WHERE {}").format(aggregates_table(), updates, overlaps),
+        {"ids": deal_ids}
+    )
+
+
+def add_to_weekly_aggregates(cursor, contributions: dict):
+    """Append weekly_contributions to the stored buckets, creating missing (week, pipeline) rows."""
+    if not contributions:
+        return
+    columns = list(METRIC_COLUMNS.values())
+    statement = sql.SQL(
+        "INSERT INTO {table} (week_start, week_name, pipeline, {fields}) VALUES %s "
+        "ON CONFLICT (week_start, pipeline) DO UPDATE SET {appends}, updated_at = now()"
+    ).format(
+        table=aggregates_table(),
+        fields=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        appends=sql.SQL(", ").join(
+            sql.SQL("{column} = {table}.{column} || EXCLUDED.{column}").format(
+                column=sql.Identifier(column), table=sql.Identifier(aggregates_table_name)
+            )
+            for column in columns
+        ),
+    )
+    rows = [
+        (week_start, week_name, pipeline, *(ids[metric] for metric in METRIC_COLUMNS))
+        for (week_start, week_name, pipeline), ids in contributions.items()
+    ]
+    template = "(%s, %s, %s" + ", %s::bigint[]" * len(columns) + ")"
+    execute_values(cursor, cursor.mogrify(statement), rows, template=template, page_size=len(rows))
+
+
+def update_weekly_aggregates(cursor, deal_ids: list[int]):
+    """
+    Bring the buckets up to date for deals just upserted on `cursor`: the rows
+    are read back in the same transaction (so they are exactly what the metrics
+    would load), taken out of their old buckets and added to their new ones.
+    """
+    if not deal_ids:
+        return
+    cursor.execute(
+        sql.SQL("SELECT {} FROM {}.{} WHERE id = ANY(%s)").format(
+            sql.SQL(", ").join(map(sql.Identifier, AGGREGATE_DEAL_COLUMNS)),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name)
+        ),
+        (list(deal_ids),)
+    )
+    deals = [dict(zip(AGGREGATE_DEAL_COLUMNS, row)) for row in cursor.fetchall()]
+    remove_from_weekly_aggregates(cursor, list(deal_ids))
+    add_to_weekly_aggregates(cursor, weekly_contributions(deals))
+
+
+def rebuild_weekly_aggregates(batch_size: int = None) -> int:
+    """Recompute Bigin.weekly_pipeline_metrics from every stored deal. Returns the number of deals read."""
+    batch_size = batch_size or DB_UPSERT_BATCH_SIZE
+    create_weekly_aggregates_table()
+
+    count = 0
+    # The deals are read on the writing connection: one transaction, one pooled connection
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE {}").format(aggregates_table()))
+        batch = []
+        for deal in iter_deals(columns=AGGREGATE_DEAL_COLUMNS, connection=connection):
+            batch.append(deal)
+            if len(batch) >= batch_size:
+                add_to_weekly_aggregates(cursor, weekly_contributions(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            add_to_weekly_aggregates(cursor, weekly_contributions(batch))
+            count += len(batch)
+
+    print(f"Weekly aggregates rebuilt from {count} deals")
+    return count
+
+
+def read_weekly_aggregate_ids(weeks: list[dict], pipeline=None) -> list[dict]:
+    """
+    Stored buckets for `weeks` (get_week_data dicts): one
+    {pipeline: {"new", "closed", "won", "movements"}} dict of deal id lists per week.
+    """
+    buckets = [
+        {name: {metric: [] for metric in METRIC_COLUMNS} for name in PIPELINES}
+        for _ in weeks
+    ]
+    positions = {}
+    for position, week in enumerate(weeks):
+        positions.setdefault(datetime.fromtimestamp(week["start_date"]).date(), []).append(position)
+    if not positions:
+        return buckets
+
+    query = sql.SQL("SELECT week_start, pipeline, {} FROM {} WHERE week_start = ANY(%s::date[])").format(
+        sql.SQL(", ").join(map(sql.Identifier, METRIC_COLUMNS.values())),
+        aggregates_table()
+    )
+    params = [list(positions)]
+    if pipeline:
+        query += sql.SQL(" AND pipeline = ANY(%s)")
+        params.append([pipeline] if isinstance(pipeline, str) else list(pipeline))
+
+    with get_db_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for week_start, row_pipeline, *ids in cursor:
+            if row_pipeline not in PIPELINES:
+                continue
+            for position in positions[week_start]:
+                buckets[position][row_pipeline] = dict(zip(METRIC_COLUMNS, ids))
+    return buckets
+
+
+def aggregate_weekly_metrics_stored(weeks: list[dict], pipeline=None) -> list[list[dict]]:
+    """aggregate_weekly_metrics for `weeks`, read from Bigin.weekly_pipeline_metrics."""
+    timer = PhaseTimer("weekly", engine="aggregates")
+    id_buckets = read_weekly_aggregate_ids(weeks, pipeline)
+    timer.mark("query")
+    buckets = expand_bucket_ids(id_buckets)
+    timer.mark("expand")
+    results = build_weekly_results(weeks, buckets)
+    timer.mark("build")
+    return results
+
+
+def check_weekly_aggregates(weeks: list[dict]) -> list[dict]:
+    """
+    Compare the stored buckets of `weeks` with calculate_weekly_metrics_for_weeks
+    over the deals table. Returns one entry per differing (week, pipeline, metric).
+    """
+    expected = calculate_weekly_metrics_for_weeks(fetch_deals_for_weeks(weeks), weeks)
+    mismatches = []
+    for week, stored in zip(weeks, read_weekly_aggregate_ids(weeks)):
+        for result in expected[week["name"]]:
+            for metric, list_key in METRIC_LIST_KEYS.items():
+                expected_ids = {deal["id"] for deal in result[list_key]}
+                stored_ids = set(stored[result["pipeline"]][metric])
+                if expected_ids != stored_ids:
+                    mismatches.append({
+                        "week": week["name"],
+                        "pipeline": result["pipeline"],
+                        "metric": metric,
+                        "missing": sorted(expected_ids - stored_ids),
+                        "unexpected": sorted(stored_ids - expected_ids),
+                    })
+    return mismatches
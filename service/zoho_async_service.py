@@ -0,0 +1,252 @@
+# asyncio variant of the Bigin calls in service.zoho_service, for the async
+# routes: stages, paginated deals and stage histories on one httpx.AsyncClient.
+# The retry rules, instrumentation, cache and request parsing are the ones of
+# service.zoho_client / service.zoho_service, and requests draw from the same
+# process-wide rate limit; the background sync keeps using the threaded client.
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+from service.zoho_client import (
+    API_BASE_URL, ZOHO_HTTP_POOL_SIZE, ZOHO_CONNECT_TIMEOUT, ZOHO_READ_TIMEOUT, ZOHO_HTTP_GZIP, ZOHO_MAX_RETRIES,
+    BaseZohoClient, RateLimiter, ZohoAPIError, client_gauges, endpoint_name
+)
+from service.zoho_cache import ResponseCache, cache_key
+from service.zoho_service import (
+    STAGES_PATH, STAGE_HISTORY_WORKERS, deal_page_request, get_auth_headers, parse_deal_page,
+    parse_stage_history, parse_stages, stage_history_path, token_manager
+)
+from utils.instrumentation import ProgressReporter
+
+
+class AsyncZohoClient(BaseZohoClient):
+    """
+    ZohoClient for asyncio: one pooled httpx.AsyncClient and per-request
+    timeouts, with the rate limit, retries, instrumentation and response cache of
+    BaseZohoClient. The rate limit is the process-wide one by default, so the
+    threaded and the async client share one request budget.
+    `transport` lets a local ASGI app stand in for the Bigin API.
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, pool_size: int = ZOHO_HTTP_POOL_SIZE,
+                 gzip: bool = ZOHO_HTTP_GZIP, max_retries: int = ZOHO_MAX_RETRIES,
+                 rate_limiter: RateLimiter = None, transport: httpx.AsyncBaseTransport = None,
+                 cache: ResponseCache = None):
+        super().__init__(base_url, max_retries, rate_limiter, cache)
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(ZOHO_READ_TIMEOUT, connect=ZOHO_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={"Accept-Encoding": "gzip, deflate" if gzip else "identity"},
+            transport=transport,
+        )
+
+    async def get(self, path: str, headers: dict = None, params: dict = None):
+        """
+        Rate-limited GET of `path` (relative to the API base URL, or absolute).
+        The last response is returned as-is once the retries are used up;
+        connection errors are re-raised.
+        With the response cache on, cached responses are returned without a request.
+        """
+        url = self.url_for(path)
+        if not self.cache.enabled:
+            return await self.fetch(url, headers, params)
+
+        # The cache reads and writes files: keep them off the event loop
+        key = cache_key(url, params, headers)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return httpx.Response(
+                cached.status_code, headers=cached.headers, content=cached.content,
+                request=httpx.Request("GET", cached.url)
+            )
+        response = await self.fetch(url, headers, params)
+        await asyncio.to_thread(self.cache.set, key, url, response.status_code, response.headers, response.content)
+        return response
+
+    async def fetch(self, url: str, headers: dict = None, params: dict = None):
+        endpoint = endpoint_name(url)
+
+        for attempt in range(self.max_retries + 1):
+            # reserve() only holds the limiter's lock for the bucket arithmetic
+            await asyncio.sleep(self.rate_limiter.reserve())
+            started = time.perf_counter()
+            try:
+                response = await self.http.get(url, headers=headers, params=params)
+            except httpx.TransportError as e:
+                delay = self.connection_error_retry_delay(endpoint, time.perf_counter() - started, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            delay = self.response_retry_delay(endpoint, time.perf_counter() - started, response, attempt)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+        return response
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_client = None
+_client_loop = None
+# aclose() tasks of clients replaced on the running loop (the loop only keeps weak references)
+_closing = set()
+
+
+def retire_async_zoho_client(client: AsyncZohoClient, loop: asyncio.AbstractEventLoop):
+    """
+    Close `client`'s connection pool on `loop`, the loop it was made on: its
+    connections belong to that loop and can't be closed from another one.
+    """
+    if loop.is_closed():
+        # Nothing can run on it any more; the sockets close as the client is collected
+        return
+    if loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is running:
+            task = loop.create_task(client.aclose())
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+    # An idle loop: run it on a thread of its own, this one may be running another loop
+    thread = threading.Thread(target=loop.run_until_complete, args=(client.aclose(),), name="async-zoho-close")
+    thread.start()
+    thread.join()
+
+
+def get_async_zoho_client() -> AsyncZohoClient:
+    """
+    Client for the running event loop, created on first use (an httpx.AsyncClient
+    can't change loops); the previous loop's client is closed on that loop.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        previous, previous_loop = _client, _client_loop
+        _client = AsyncZohoClient()
+        _client_loop = loop
+        if previous is not None:
+            retire_async_zoho_client(previous, previous_loop)
+    return _client
+
+
+def set_async_zoho_client(client: AsyncZohoClient):
+    """Use `client` for the running event loop (e.g. one pointed at a local stub); the one it replaces is closed."""
+    global _client, _client_loop
+    previous, previous_loop = _client, _client_loop
+    _client = client
+    _client_loop = asyncio.get_running_loop()
+    if previous is not None and previous is not client:
+        retire_async_zoho_client(previous, previous_loop)
+
+
+def async_zoho_gauges() -> list:
+    return client_gauges(_client, "async")
+
+
+async def close_async_zoho_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def get_auth_headers_async(client: AsyncZohoClient = None) -> dict:
+    """Headers for a request through `client` (default: the event loop's AsyncZohoClient)."""
+    client = client or get_async_zoho_client()
+    # A token refresh is a blocking POST; only then hop to a worker thread
+    if client.cache.mode != "replay" and token_manager.needs_refresh():
+        return await asyncio.to_thread(get_auth_headers, client)
+    return get_auth_headers(client)
+
+
+async def get_all_stages_async():
+    client = get_async_zoho_client()
+    return parse_stages(await client.get(STAGES_PATH, headers=await get_auth_headers_async(client)))
+
+
+async def iter_deal_pages_async(modified_since: datetime = None, page_token: str = None):
+    """
+    Async iter_deal_pages: yield (deals, next_page_token) for each page of
+    Pipelines records. Raises ZohoAPIError if a page can't be fetched.
+    """
+    client = get_async_zoho_client()
+    while True:
+        request = deal_page_request(await get_auth_headers_async(client), modified_since, page_token)
+        page = parse_deal_page(await client.get("Pipelines", **request))
+        if page is None:
+            return
+        deals, page_token = page
+        yield deals, page_token
+        if not page_token:
+            return
+
+
+async def get_all_deals_async(modified_since: datetime = None, next_page_token: str = None):
+    """
+    Fetch every Pipelines record, following next_page_token.
+    """
+    all_deals = []
+    progress = ProgressReporter("Deals fetched")
+    try:
+        async for deals, _ in iter_deal_pages_async(modified_since, next_page_token):
+            all_deals.extend(deals)
+            progress.update(len(all_deals))
+    except ZohoAPIError as e:
+        print(e)
+    progress.finish()
+    return all_deals
+
+
+async def get_deal_stage_history_async(deal_id: str, headers: dict = None):
+    client = get_async_zoho_client()
+    if headers is None:
+        headers = await get_auth_headers_async(client)
+    return parse_stage_history(await client.get(stage_history_path(deal_id), headers=headers))
+
+
+async def fetch_stage_histories_async(deal_ids: list, concurrency: int = None) -> list:
+    """
+    Fetch the stage history of every deal ID, at most `concurrency` at a time.
+    Results come back in the same order as `deal_ids`; missing IDs yield None.
+    Raises ZohoAPIError if a history can't be fetched, so no deal is stored without it.
+    """
+    semaphore = asyncio.Semaphore(concurrency or STAGE_HISTORY_WORKERS)
+    progress = ProgressReporter("Stage histories fetched", total=len(deal_ids))
+
+    async def fetch(deal_id):
+        if not deal_id:
+            progress.update()
+            return None
+        async with semaphore:
+            stage_history = await get_deal_stage_history_async(deal_id)
+        progress.update()
+        return stage_history
+
+    return await asyncio.gather(*(fetch(deal_id) for deal_id in deal_ids))
+
+
+async def attach_stage_histories_async(deals: list[dict], concurrency: int = None):
+    """Fetch and set deal["stage_history"] for every deal with an id."""
+    stage_histories = await fetch_stage_histories_async([deal.get("id") for deal in deals], concurrency)
+    for deal, stage_history in zip(deals, stage_histories):
+        if deal.get("id"):
+            deal["stage_history"] = stage_history
+    return deals
+
+
+async def get_all_deals_with_stage_history_async(concurrency: int = None, modified_since: datetime = None):
+    deals = await get_all_deals_async(modified_since=modified_since)
+    await attach_stage_histories_async(deals, concurrency)
+    return deals
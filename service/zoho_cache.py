@@ -0,0 +1,178 @@
+# On-disk cache of Zoho GET responses, used by ZohoClient and AsyncZohoClient.
+# Each response is stored under the SHA-256 of its canonical request (URL,
+# sorted query parameters and the headers that change the answer), so reruns
+# and benchmarks can skip the network:
+#   ZOHO_CACHE_MODE=off        no caching (default)
+#   ZOHO_CACHE_MODE=readwrite  serve fresh entries (ZOHO_CACHE_TTL), store new responses
+#   ZOHO_CACHE_MODE=replay     offline: serve entries of any age, a miss raises ZohoCacheMiss
+# Entries go to ZOHO_CACHE_DIR (default $XDG_CACHE_HOME/bigin-zoho or ~/.cache/bigin-zoho).
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+ZOHO_CACHE_MODES = ("off", "readwrite", "replay")
+ZOHO_CACHE_MODE = os.getenv("ZOHO_CACHE_MODE", "off")
+# Cached responses hold customer data: keep them out of the source tree by default
+ZOHO_CACHE_DIR = os.getenv("ZOHO_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "bigin-zoho"
+)
+ZOHO_CACHE_TTL = float(os.getenv("ZOHO_CACHE_TTL", "3600"))
+ZOHO_CACHE_MAX_BYTES = int(os.getenv("ZOHO_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Headers that are part of the cache key (Authorization is not: tokens rotate)
+KEY_HEADERS = ("If-Modified-Since",)
+# Statuses worth replaying: data, and "nothing modified"
+CACHEABLE_STATUS_CODES = {200, 204, 304}
+STORED_HEADERS = ("Content-Type",)
+
+
+class ZohoCacheMiss(Exception):
+    pass
+
+
+class CachedResponse:
+    """A stored response: status, a few headers and the raw body."""
+    __slots__ = ("status_code", "headers", "content", "url")
+
+    def __init__(self, status_code: int, headers: dict, content: bytes, url: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+
+def cache_key(url: str, params: dict = None, headers: dict = None) -> str:
+    """SHA-256 of the request, independent of parameter order and of how the query was encoded."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(str(name), str(value)) for name, value in (params or {}).items() if value is not None]
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    identity = {
+        "url": f"{parts.scheme}://{parts.netloc}{parts.path}",
+        "query": sorted(query),
+        "headers": {name: headers[name.lower()] for name in KEY_HEADERS if name.lower() in headers},
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed response files under `directory` (<key[:2]>/<key>.json).
+    Reads refresh a file's mtime, and once the files add up to more than
+    `max_bytes` the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory: str = ZOHO_CACHE_DIR, mode: str = ZOHO_CACHE_MODE,
+                 ttl: float = ZOHO_CACHE_TTL, max_bytes: int = ZOHO_CACHE_MAX_BYTES):
+        if mode not in ZOHO_CACHE_MODES:
+            raise ValueError(f"Unknown ZOHO_CACHE_MODE '{mode}', expected one of {ZOHO_CACHE_MODES}")
+        self.directory = directory
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str):
+        """The stored CachedResponse, or None. In replay mode a miss raises ZohoCacheMiss."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is not None and (self.mode == "replay" or time.time() - entry["stored_at"] < self.ttl):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass  # evicted since we read it: the entry is still good to serve
+            with self._lock:
+                self.stats["hits"] += 1
+            return CachedResponse(entry["status_code"], entry["headers"], base64.b64decode(entry["body"]), entry["url"])
+
+        with self._lock:
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise ZohoCacheMiss(f"No cached Zoho response for {key} (ZOHO_CACHE_MODE=replay)")
+        return None
+
+    def set(self, key: str, url: str, status_code: int, headers, content: bytes):
+        if self.mode != "readwrite" or status_code not in CACHEABLE_STATUS_CODES:
+            return
+        entry = {
+            "url": url,
+            "status_code": status_code,
+            "headers": {name: headers[name] for name in STORED_HEADERS if name in headers},
+            "body": base64.b64encode(content).decode(),
+            "stored_at": time.time(),
+        }
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            json.dump(entry, f)
+        os.replace(f.name, path)
+
+        with self._lock:
+            self.stats["stores"] += 1
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self) -> list:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        """Delete least recently used files until the cache is back under 90% of max_bytes. Caller holds the lock."""
+        target = self.max_bytes * 0.9
+        files = sorted(self._files())
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                os.remove(path)
+            self._size = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, mode=self.mode, size_bytes=self._size)
@@ -0,0 +1,277 @@
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from dotenv import load_dotenv
+load_dotenv()
+
+from service.zoho_cache import ResponseCache, cache_key
+from utils.instrumentation import increment, record_span
+
+API_BASE_URL = os.getenv("ZOHO_API_BASE_URL", "https://www.zohoapis.in/bigin/v2/")
+
+ZOHO_HTTP_POOL_SIZE = int(os.getenv("ZOHO_HTTP_POOL_SIZE", "16"))
+ZOHO_CONNECT_TIMEOUT = float(os.getenv("ZOHO_CONNECT_TIMEOUT", "5"))
+ZOHO_READ_TIMEOUT = float(os.getenv("ZOHO_READ_TIMEOUT", "30"))
+ZOHO_HTTP_GZIP = os.getenv("ZOHO_HTTP_GZIP", "true").lower() in ("1", "true", "yes")
+ZOHO_REQUESTS_PER_SECOND = float(os.getenv("ZOHO_REQUESTS_PER_SECOND", "10"))
+ZOHO_BURST_SIZE = int(os.getenv("ZOHO_BURST_SIZE", "10"))
+ZOHO_MAX_RETRIES = int(os.getenv("ZOHO_MAX_RETRIES", "5"))
+ZOHO_BACKOFF_BASE = float(os.getenv("ZOHO_BACKOFF_BASE", "0.5"))
+ZOHO_BACKOFF_MAX = float(os.getenv("ZOHO_BACKOFF_MAX", "30"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ZohoAPIError(Exception):
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f"Zoho API error {response.status_code}: {response.text}")
+
+
+class RateLimiter:
+    """
+    Token bucket shared between threads and coroutines: allows `burst`
+    requests at once, then `rate` per second.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token even if it is not there yet; the deficit is the wait
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every caller back for `seconds` (e.g. until Zoho's rate-limit window resets)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    The process-wide Zoho request budget, created on first use. The threaded
+    and the async client both draw from it, since Zoho counts their requests
+    against the same quota.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(ZOHO_REQUESTS_PER_SECOND, ZOHO_BURST_SIZE)
+    return _rate_limiter
+
+
+def endpoint_name(url: str) -> str:
+    """/bigin/v2/Pipelines/8694380000/Stage_History?fields=... -> Pipelines/{id}/Stage_History"""
+    path = urlsplit(url).path
+    base_path = urlsplit(API_BASE_URL).path
+    if path.startswith(base_path):
+        path = path[len(base_path):]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path.strip("/"))
+
+
+def get_rate_limit_delay(response):
+    """
+    Seconds to wait before retrying, from Retry-After or Zoho's X-RATELIMIT-RESET
+    header (None if neither is present).
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    reset = response.headers.get("X-RATELIMIT-RESET")
+    if reset and reset.isdigit():
+        reset = int(reset)
+        if reset > 10 ** 12:  # epoch milliseconds
+            return max(reset / 1000 - time.time(), 0)
+        if reset > 10 ** 9:  # epoch seconds
+            return max(reset - time.time(), 0)
+        return float(reset)
+    return None
+
+
+def cached_to_response(cached) -> requests.Response:
+    """Turn a zoho_cache.CachedResponse back into a requests.Response."""
+    response = requests.Response()
+    response.status_code = cached.status_code
+    response.headers = CaseInsensitiveDict(cached.headers)
+    response._content = cached.content
+    response.url = cached.url
+    response.encoding = "utf-8"
+    return response
+
+
+class BaseZohoClient:
+    """
+    What ZohoClient and the asyncio AsyncZohoClient (service.zoho_async_service)
+    share: the rate limit, the retry and backoff rules, the zoho_request spans
+    and counters, and the response cache. Subclasses only send the requests and wait.
+    """
+
+    def __init__(self, base_url: str, max_retries: int, rate_limiter: RateLimiter = None,
+                 cache: ResponseCache = None):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.cache = cache or ResponseCache()
+
+    def url_for(self, path: str) -> str:
+        """`path` relative to the API base URL, or absolute."""
+        return path if path.startswith("http") else self.base_url + path
+
+    def get_retry_delay(self, response, attempt: int) -> float:
+        delay = get_rate_limit_delay(response) if response is not None else None
+        if delay is None:
+            delay = ZOHO_BACKOFF_BASE * (2 ** attempt)
+            delay += random.uniform(0, delay / 2)
+        return min(delay, ZOHO_BACKOFF_MAX)
+
+    def connection_error_retry_delay(self, endpoint: str, latency: float, error: Exception, attempt: int):
+        """Record a request that didn't get a response; seconds before the retry, or None to re-raise."""
+        record_span("zoho_request", latency, error=True, endpoint=endpoint)
+        increment("zoho_responses", endpoint=endpoint, status="connection_error")
+        if attempt == self.max_retries:
+            return None
+        delay = self.get_retry_delay(None, attempt)
+        increment("zoho_retries", endpoint=endpoint)
+        print(f"Zoho request to {endpoint} failed ({error}), retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+        return delay
+
+    def response_retry_delay(self, endpoint: str, latency: float, response, attempt: int):
+        """Record a response; seconds before the retry, or None when it is the one to return."""
+        record_span("zoho_request", latency, error=response.status_code >= 400, endpoint=endpoint)
+        increment("zoho_responses", endpoint=endpoint, status=response.status_code)
+
+        # Out of quota for this window: slow every caller down, not just this one
+        if response.headers.get("X-RATELIMIT-REMAINING") == "0":
+            reset_delay = get_rate_limit_delay(response)
+            if reset_delay:
+                self.rate_limiter.pause(min(reset_delay, ZOHO_BACKOFF_MAX))
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+            return None
+        delay = self.get_retry_delay(response, attempt)
+        increment("zoho_retries", endpoint=endpoint)
+        print(f"Zoho returned {response.status_code} for {endpoint}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+        return delay
+
+    def get_cache_stats(self) -> dict:
+        return self.cache.get_stats()
+
+
+class ZohoClient(BaseZohoClient):
+    """
+    Shared HTTP layer for the Bigin API: one pooled keep-alive session,
+    per-request timeouts, the process-wide rate limit, retries with exponential
+    backoff on 429 / 5xx / connection errors, per-endpoint spans and counters
+    for /metrics and the optional on-disk response cache (see service.zoho_cache).
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL, pool_size: int = ZOHO_HTTP_POOL_SIZE,
+                 timeout=(ZOHO_CONNECT_TIMEOUT, ZOHO_READ_TIMEOUT), gzip: bool = ZOHO_HTTP_GZIP,
+                 max_retries: int = ZOHO_MAX_RETRIES,
+                 rate_limiter: RateLimiter = None, cache: ResponseCache = None):
+        super().__init__(base_url, max_retries, rate_limiter, cache)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if gzip else "identity"
+
+    def get(self, path: str, headers: dict = None, params: dict = None):
+        """
+        Rate-limited GET of `path` (relative to the API base URL, or absolute).
+        The last response is returned as-is once the retries are used up;
+        connection errors are re-raised.
+        With the response cache on, cached responses are returned without a
+        request (ZohoCacheMiss is raised on a miss in replay mode).
+        """
+        url = self.url_for(path)
+        if not self.cache.enabled:
+            return self.fetch(url, headers, params)
+
+        key = cache_key(url, params, headers)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached_to_response(cached)
+        response = self.fetch(url, headers, params)
+        self.cache.set(key, url, response.status_code, response.headers, response.content)
+        return response
+
+    def fetch(self, url: str, headers: dict = None, params: dict = None):
+        endpoint = endpoint_name(url)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self.connection_error_retry_delay(endpoint, time.perf_counter() - started, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            delay = self.response_retry_delay(endpoint, time.perf_counter() - started, response, attempt)
+            if delay is None:
+                return response
+            time.sleep(delay)
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_zoho_client() -> ZohoClient:
+    """Process-wide client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ZohoClient()
+    return _client
+
+
+def client_gauges(client, kind: str) -> list:
+    """Response cache stats of a ZohoClient / AsyncZohoClient for /metrics."""
+    if client is None or not client.cache.enabled:
+        return []
+    return [
+        (f"zoho_cache_{name}", {"client": kind}, value)
+        for name, value in client.get_cache_stats().items()
+        if name != "mode"
+    ]
+
+
+def zoho_gauges() -> list:
+    return client_gauges(_client, "threaded")
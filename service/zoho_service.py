@@ -1,6 +1,9 @@
 import requests
-from utils.token import save_tokens, load_tokens
+from utils.token import TokenManager
+from service.zoho_client import get_zoho_client, ZohoAPIError
+from utils.instrumentation import ProgressReporter
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -12,18 +15,24 @@ REDIRECT_URI = os.getenv("REDIRECT_URI", "http://localhost:8000/auth")
 SCOPE = "ZohoBigin.modules.ALL,ZohoBigin.settings.ALL"
 
 AUTH_BASE_URL = "https://accounts.zoho.in/oauth/v2/auth"
-TOKEN_URL = "https://accounts.zoho.in/oauth/v2/token"
+TOKEN_URL = os.getenv("ZOHO_TOKEN_URL", "https://accounts.zoho.in/oauth/v2/token")
 
-API_BASE_URL = "https://www.zohoapis.in/bigin/v2/"
+# Stage history is fetched one request per deal, so it is fanned out over a
+# small pool of workers that share the client's rate limit.
+STAGE_HISTORY_WORKERS = int(os.getenv("ZOHO_STAGE_HISTORY_WORKERS", "8"))
 
-def get_oauth_url() -> str:
+DEAL_FIELDS = "Deal_Name,Id,Stage,Amount,Closing_Date,Contact_Name,Pipeline,Created_Time,Modified_Time,Timeline,Other_Info"
+
+def get_oauth_url(state: str) -> str:
+    """Zoho consent URL; `state` comes back to the /auth callback unchanged."""
     return (
         f"{AUTH_BASE_URL}?"
         f"client_id={CLIENT_ID}&"
         f"scope={SCOPE}&"
         f"response_type=code&"
         f"access_type=offline&"
-        f"redirect_uri={REDIRECT_URI}"
+        f"redirect_uri={REDIRECT_URI}&"
+        f"state={state}"
     )
 
 def exchange_code_for_token(code: str) -> dict:
@@ -36,12 +45,15 @@ def exchange_code_for_token(code: str) -> dict:
     }
     response = requests.post(TOKEN_URL, data=payload)
     token_data = response.json()
+    if "access_token" not in token_data:
+        # Keep the stored tokens when the exchange fails
+        raise ValueError(f"Token exchange failed: {token_data.get('error', response.status_code)}")
     expiry_delay = token_data.get("expires_in", 0)
     token_data["expiry_time"] = datetime.now().timestamp() + expiry_delay
-    save_tokens(token_data)
+    token_manager.set_tokens(token_data)
     return token_data
 
-def refresh_access_token(refresh_token: str) -> dict:
+def request_token_refresh(refresh_token: str) -> dict:
     payload = {
         "refresh_token": refresh_token,
         "client_id": CLIENT_ID,
@@ -49,97 +61,165 @@ def refresh_access_token(refresh_token: str) -> dict:
         "grant_type": "refresh_token"
     }
     response = requests.post(TOKEN_URL, data=payload)
-    new_tokens = response.json()
-    tokens = load_tokens()
-    tokens.update(new_tokens)
-    expiry_delay = new_tokens.get("expires_in", 0)
-    tokens["expiry_time"] = datetime.now().timestamp() + expiry_delay
-    save_tokens(tokens)
-    return tokens
+    return response.json()
 
-def get_access_token() -> str:
-    tokens = load_tokens()
-    if not tokens:
-        raise ValueError("No tokens found. Authenticate first.")
-    if datetime.now().timestamp() > tokens.get("expiry_time", 0):
-        tokens = refresh_access_token(tokens["refresh_token"])
-    return tokens["access_token"]
 
+# Process-wide cache of the Zoho tokens, see utils.token.TokenManager
+token_manager = TokenManager(request_token_refresh)
 
-def get_all_stages():
-    access_token = get_access_token()
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}"
-    }
-    response = requests.get(f"{API_BASE_URL}settings/fields?module=Pipelines", headers=headers)
 
-    if response.status_code == 200:
-        response_data = response.json()
+def refresh_access_token(refresh_token: str = None) -> dict:
+    return token_manager.refresh(refresh_token)
 
-    stages = (field for field in response_data.get("fields") if field.get("field_label", "").lower() == "stage")
+def get_access_token() -> str:
+    return token_manager.get_access_token()
 
-    return stages
 
+def get_auth_headers(client=None) -> dict:
+    """Headers for a request through `client` (default: the process-wide ZohoClient)."""
+    if (client or get_zoho_client()).cache.mode == "replay":
+        # Offline replay never reaches Zoho, so don't require (or refresh) tokens
+        return {"Authorization": "Zoho-oauthtoken replay"}
+    return {
+        "Authorization": f"Zoho-oauthtoken {get_access_token()}"
+    }
 
-def get_all_deals(all_deals: list = None, next_page_token: str = None):
-    if all_deals is None: 
-        all_deals = []
 
-    print("Fetching deals... Current count:", len(all_deals))
-    access_token = get_access_token()
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}"
-    }
+# Request building and response parsing shared with service.zoho_async_service;
+# they work on requests and httpx responses alike.
+STAGES_PATH = "settings/fields?module=Pipelines"
 
-    request_url = f"{API_BASE_URL}Pipelines?fields=Deal_Name,Id,Stage,Amount,Closing_Date,Contact_Name,Pipeline,Created_Time,Modified_Time,Timeline,Other_Info"
-    if next_page_token:
-        request_url += f"&page_token={next_page_token}"
 
-    response = requests.get(request_url, headers=headers)
+def stage_history_path(deal_id: str) -> str:
+    return f"Pipelines/{deal_id}/Stage_History?fields=Stage,Modified_Time,Changed_By"
 
-    if response.status_code == 200:
-        data = response.json()
 
-        all_deals.extend(data.get("data", []))
+def parse_stages(response) -> list:
+    if response.status_code != 200:
+        print(f"Error {response.status_code}: {response.text}")
+        return []
+    response_data = response.json()
 
-        next_token = data.get("info", {}).get("next_page_token")
-        if next_token:
-            return get_all_deals(all_deals, next_token)  # recursive call
-        else:
-            return all_deals
+    return [field for field in response_data.get("fields") if field.get("field_label", "").lower() == "stage"]
 
-    print(f"Error {response.status_code}: {response.text}")
-    return all_deals
 
+def deal_page_request(headers: dict, modified_since: datetime = None, page_token: str = None) -> dict:
+    """Keyword arguments of the client's get() for one page of Pipelines records."""
+    headers = dict(headers)
+    if modified_since:
+        headers["If-Modified-Since"] = modified_since.isoformat(timespec="seconds")
 
+    params = {"fields": DEAL_FIELDS}
+    if page_token:
+        params["page_token"] = page_token
+    return {"headers": headers, "params": params}
 
-def get_all_deals_with_stage_history():
-    deals = get_all_deals()
-    for deal in deals:
-        deal_id = deal.get("id")
-        print(f"[{deals.index(deal) + 1}/{len(deals)}] Fetching stage history for deal ID: {deal_id}")
-        if deal_id:
-            stage_history = get_deal_stage_history(deal_id)
-            deal["stage_history"] = stage_history
-    return deals
 
+def parse_deal_page(response):
+    """
+    (deals, next_page_token) of a Pipelines page, or None when nothing (more)
+    was modified since the watermark. Raises ZohoAPIError on an error response.
+    """
+    if response.status_code in (204, 304):
+        return None
+    if response.status_code != 200:
+        raise ZohoAPIError(response)
 
+    data = response.json()
+    return data.get("data", []), data.get("info", {}).get("next_page_token")
 
-def get_deal_stage_history(deal_id: str):
-    access_token = get_access_token()
-    headers = {
-        "Authorization": f"Zoho-oauthtoken {access_token}"
-    }
-    response = requests.get(f"{API_BASE_URL}Pipelines/{deal_id}/Stage_History?fields=Stage,Modified_Time,Changed_By", headers=headers)
 
+def parse_stage_history(response) -> list:
     if response.status_code == 200:
         return response.json().get("data", [])
-    print(f"Error {response.status_code}: {response.text}")
-    return []
+    if response.status_code == 204:
+        return []  # no stage changes recorded
+    # Never hand back an empty history for a failed request: it would be stored
+    # and the watermark would move past the deal
+    raise ZohoAPIError(response)
+
+
+def get_all_stages():
+    client = get_zoho_client()
+    return parse_stages(client.get(STAGES_PATH, headers=get_auth_headers(client)))
+
+
+def iter_deal_pages(modified_since: datetime = None, page_token: str = None):
+    """
+    Yield (deals, next_page_token) for each page of Pipelines records, starting
+    at `page_token` if given. next_page_token is None on the last page.
+    When `modified_since` is given only records modified after it are
+    returned (Zoho's If-Modified-Since header).
+    Raises ZohoAPIError if a page can't be fetched.
+    """
+    client = get_zoho_client()
+    while True:
+        page = parse_deal_page(client.get("Pipelines", **deal_page_request(get_auth_headers(client), modified_since, page_token)))
+        if page is None:
+            return
+        deals, page_token = page
+        yield deals, page_token
+        if not page_token:
+            return
+
+
+def get_all_deals(modified_since: datetime = None, next_page_token: str = None):
+    """
+    Fetch every Pipelines record, following next_page_token.
+    """
+    all_deals = []
+    progress = ProgressReporter("Deals fetched")
+    try:
+        for deals, _ in iter_deal_pages(modified_since, next_page_token):
+            all_deals.extend(deals)
+            progress.update(len(all_deals))
+    except ZohoAPIError as e:
+        print(e)
+    progress.finish()
+    return all_deals
 
 
 
+def get_all_deals_with_stage_history(workers: int = None, modified_since: datetime = None):
+    deals = get_all_deals(modified_since=modified_since)
+    attach_stage_histories(deals, workers)
+    return deals
 
 
+def attach_stage_histories(deals: list[dict], workers: int = None):
+    """Fetch and set deal["stage_history"] for every deal with an id."""
+    deal_ids = [deal.get("id") for deal in deals]
+    stage_histories = fetch_stage_histories(deal_ids, workers)
+    for deal, stage_history in zip(deals, stage_histories):
+        if deal.get("id"):
+            deal["stage_history"] = stage_history
+    return deals
 
 
+def fetch_stage_histories(deal_ids: list, workers: int = None) -> list:
+    """
+    Fetch the stage history of every deal ID concurrently.
+    Results come back in the same order as `deal_ids`; missing IDs yield None.
+    Raises ZohoAPIError if a history can't be fetched, so no deal is stored without it.
+    """
+    workers = workers or STAGE_HISTORY_WORKERS
+
+    def fetch(deal_id):
+        if not deal_id:
+            return None
+        return get_deal_stage_history(deal_id)
+
+    stage_histories = []
+    progress = ProgressReporter("Stage histories fetched", total=len(deal_ids))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for stage_history in executor.map(fetch, deal_ids):
+            stage_histories.append(stage_history)
+            progress.update()
+    return stage_histories
+
+
+def get_deal_stage_history(deal_id: str, headers: dict = None):
+    client = get_zoho_client()
+    if headers is None:
+        headers = get_auth_headers(client)
+    return parse_stage_history(client.get(stage_history_path(deal_id), headers=headers))
@@ -0,0 +1,84 @@
+# Shared fixtures. The services keep process-wide clients (Zoho client, DB
+# pool, gspread client); each fixture swaps in a stub from benchmarks.stubs
+# and puts the original back after the test.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def zoho_stub(monkeypatch):
+    """install_zoho_stub(deals, page_size=200, latency=0.0) -> ZohoStubAdapter"""
+    from benchmarks.stubs import install_zoho_stub
+    from service import zoho_client
+    from service.zoho_service import token_manager
+
+    monkeypatch.setattr(zoho_client, "_client", None)
+    monkeypatch.setattr(token_manager, "_tokens", None)
+    return install_zoho_stub
+
+
+@pytest.fixture
+def zoho_server(monkeypatch):
+    """zoho_stub_server(deals, page_size=200, latency=0.0) -> context manager serving a ZohoStubServer"""
+    from benchmarks.stubs import zoho_stub_server
+    from service import zoho_client
+    from service.zoho_service import token_manager
+
+    monkeypatch.setattr(zoho_client, "_client", None)
+    monkeypatch.setattr(token_manager, "_tokens", None)
+    return zoho_stub_server
+
+
+@pytest.fixture
+def fake_database(monkeypatch):
+    """install_database(deals) -> FakeDatabase"""
+    from benchmarks.stubs import install_database
+    from service import db_pool
+
+    monkeypatch.setattr(db_pool, "_pool", None)
+    return install_database
+
+
+@pytest.fixture
+def async_zoho_stub(monkeypatch):
+    """install_async_zoho_stub(deals, page_size=200, latency=0.0, max_retries=0) -> ZohoStubApp, from the test's loop"""
+    from benchmarks.stubs import install_async_zoho_stub
+    from service import zoho_async_service
+    from service.zoho_service import token_manager
+
+    monkeypatch.setattr(zoho_async_service, "_client", None)
+    monkeypatch.setattr(zoho_async_service, "_client_loop", None)
+    monkeypatch.setattr(token_manager, "_tokens", None)
+    return install_async_zoho_stub
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def postgres(fake_database, monkeypatch):
+    """
+    Pool of the scratch Postgres at TEST_DB_URL (skipped when unset), with an
+    empty Bigin.deals table and no side tables, so the code under test creates
+    them like on a fresh database.
+    """
+    from service import supabase_serice
+
+    db_url = os.getenv("TEST_DB_URL")
+    if not db_url:
+        pytest.skip("TEST_DB_URL is not set")
+    pool = fake_database([], db_url)
+    with pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS "Bigin"."stage_transitions", "Bigin"."weekly_pipeline_metrics"')
+        cursor.execute('TRUNCATE "Bigin"."deals"')
+    monkeypatch.setattr(supabase_serice, "_created_tables", set())
+    monkeypatch.setattr(supabase_serice, "DB_WRITE_STAGE_TRANSITIONS", True)
+    monkeypatch.setattr(supabase_serice, "DB_WRITE_WEEKLY_AGGREGATES", True)
+    yield pool
+    pool.closeall()
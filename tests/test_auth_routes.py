@@ -0,0 +1,117 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from routes import zoho_routes
+from utils import auth
+
+API_KEY = "test-admin-key"
+TOKENS = {"access_token": "secret-access", "refresh_token": "secret-refresh", "expiry_time": 1700000000}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", API_KEY)
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def exchanged(monkeypatch):
+    """Codes passed to exchange_code_for_token (which does nothing else)."""
+    codes = []
+    monkeypatch.setattr(zoho_routes, "exchange_code_for_token", lambda code: codes.append(code) or dict(TOKENS))
+    return codes
+
+
+def oauth_state(redirect) -> str:
+    assert redirect.status_code == 307
+    return parse_qs(urlparse(redirect.headers["location"]).query)["state"][0]
+
+
+def test_routes_stay_open_without_an_admin_key(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", None)
+    monkeypatch.setattr(zoho_routes, "refresh_access_token", lambda: dict(TOKENS))
+    client = TestClient(main.app)
+    assert client.get("/refresh-token").status_code == 200
+    assert client.get("/get-oauth-code", follow_redirects=False).status_code == 307
+
+
+@pytest.mark.parametrize("path", ["/refresh-token", "/get-oauth-code", "/oauth-link", "/stages", "/deals",
+                                  "/sync-jobs", "/metrics"])
+@pytest.mark.parametrize("headers", [{}, {"X-API-Key": "wrong-key"}])
+def test_routes_reject_missing_or_wrong_key(client, path, headers):
+    assert client.get(path, headers=headers, follow_redirects=False).status_code == 401
+
+
+def test_refresh_token_does_not_return_tokens(client, monkeypatch):
+    monkeypatch.setattr(zoho_routes, "refresh_access_token", lambda: dict(TOKENS))
+    response = client.get("/refresh-token", headers={"X-API-Key": API_KEY})
+    assert response.status_code == 200
+    assert response.json() == {"message": "Token refreshed successfully", "expiry_time": TOKENS["expiry_time"]}
+    assert "secret" not in response.text
+
+
+def test_auth_callback_needs_the_state_from_get_oauth_code(client, exchanged):
+    assert client.get("/auth", params={"code": "c1"}).status_code == 400
+    assert client.get("/auth", params={"code": "c1", "state": "forged"}).status_code == 400
+    assert exchanged == []
+
+    state = oauth_state(client.get("/get-oauth-code", headers={"X-API-Key": API_KEY}, follow_redirects=False))
+
+    response = client.get("/auth", params={"code": "c1", "state": state})
+    assert response.status_code == 200
+    assert response.json() == {"message": "Tokens saved successfully"}
+    assert "secret" not in response.text
+    assert exchanged == ["c1"]
+
+    # A state is good for one callback only
+    assert client.get("/auth", params={"code": "c2", "state": state}).status_code == 400
+
+
+def test_oauth_link_starts_the_consent_once_without_the_key(client, exchanged):
+    link = client.get("/oauth-link", headers={"X-API-Key": API_KEY}).json()["url"]
+    assert urlparse(link).path == "/get-oauth-code"
+
+    # What a browser does: follow the link, no header
+    state = oauth_state(client.get(link, follow_redirects=False))
+    assert client.get(link, follow_redirects=False).status_code == 401
+
+    assert client.get("/auth", params={"code": "c1", "state": state}).status_code == 200
+    assert exchanged == ["c1"]
+
+
+def test_oauth_state_is_checked_by_any_worker(client, exchanged, monkeypatch):
+    state = oauth_state(client.get("/get-oauth-code", headers={"X-API-Key": API_KEY}, follow_redirects=False))
+    # Another worker: nothing it holds in memory knows about the state
+    monkeypatch.setattr(zoho_routes, "used_tokens", zoho_routes.TTLCache(maxsize=256, ttl=600))
+
+    assert client.get("/auth", params={"code": "c1", "state": state}).status_code == 200
+
+
+def test_oauth_tokens_expire_and_are_bound_to_their_purpose(monkeypatch):
+    link_ticket = auth.sign_token("oauth-link", 300)
+    assert auth.verify_token("oauth-link", link_ticket)
+    assert not auth.verify_token("oauth-state", link_ticket)
+    assert not auth.verify_token("oauth-link", link_ticket[:-1] + ("0" if link_ticket[-1] != "0" else "1"))
+
+    now = auth.time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + 301)
+    assert not auth.verify_token("oauth-link", link_ticket)
+
+
+def test_failed_code_exchange_is_a_bad_gateway(client, monkeypatch):
+    def exchange(code):
+        raise ValueError("Token exchange failed: invalid_code")
+
+    monkeypatch.setattr(zoho_routes, "exchange_code_for_token", exchange)
+    state = auth.sign_token("oauth-state", 600)
+    response = client.get("/auth", params={"code": "bad", "state": state})
+    assert response.status_code == 502
+
+
+def test_metrics_scrape_needs_the_key(client):
+    response = client.get("/metrics", headers={"X-API-Key": API_KEY})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,166 @@
+import threading
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+from service import db_pool
+from service.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Just what ConnectionPool touches; `broken` makes the health check query fail."""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, query, vars=None):
+                if connection.broken:
+                    raise psycopg2.OperationalError("server closed the connection unexpectedly")
+                connection.queries.append(query)
+
+        return Cursor()
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The pool's monotonic clock, moved by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(db_pool, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def connections():
+    """Every connection the pools under test opened, and the factory opening them."""
+    opened = []
+
+    def connect(dsn, cursor_factory=None):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return opened, connect
+
+
+def test_caller_beyond_max_size_times_out(connections):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=0, max_size=1, timeout=0.05, connect=connect)
+    connection = pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+    pool.putconn(connection)
+    assert pool.getconn() is connection
+    assert len(opened) == 1
+
+
+def test_waiting_caller_gets_the_returned_connection(connections):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=0, max_size=1, timeout=5, connect=connect)
+    connection = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+
+    pool.putconn(connection)
+    waiter.join(5)
+    assert got == [connection]
+    assert len(opened) == 1
+
+
+def test_connection_idle_past_check_after_is_health_checked(connections, clock):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=0, max_size=2, check_after=30, connect=connect)
+    pool.putconn(pool.getconn())
+
+    # Recently used: handed out without a query
+    clock[0] += 10
+    pool.putconn(pool.getconn())
+    assert opened[0].queries == []
+
+    clock[0] += 31
+    assert pool.getconn() is opened[0]
+    assert opened[0].queries == ["SELECT 1"]
+
+
+def test_broken_connection_is_replaced(connections, clock):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=0, max_size=2, check_after=30, connect=connect)
+    pool.putconn(pool.getconn())
+
+    opened[0].broken = True
+    clock[0] += 31
+    assert pool.getconn() is opened[1]
+    assert opened[0].closed
+    stats = pool.stats()
+    assert (stats["failed_health_checks"], stats["connections_closed"], stats["size"]) == (1, 1, 1)
+
+
+def test_closed_connection_is_replaced_without_a_query(connections, clock):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=0, max_size=2, connect=connect)
+    pool.putconn(pool.getconn())
+
+    opened[0].closed = 1
+    assert pool.getconn() is opened[1]
+    assert opened[0].queries == []
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_idle_connections_above_min_size_are_closed(connections, clock):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=1, max_size=3, max_idle=60, connect=connect)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+
+    clock[0] += 61
+    # One of the two is closed, the other stays for min_size
+    assert pool.getconn() is second
+    assert first.closed and not second.closed
+    stats = pool.stats()
+    assert (stats["connections_closed"], stats["size"]) == (1, 1)
+
+
+def test_connections_are_replaced_after_max_lifetime(connections, clock):
+    opened, connect = connections
+    pool = ConnectionPool("fake", min_size=1, max_size=2, max_lifetime=100, connect=connect)
+
+    # Expired while idle: closed on the next checkout, even below min_size
+    pool.putconn(pool.getconn())
+    clock[0] += 101
+    assert pool.getconn() is opened[1]
+    assert opened[0].closed
+
+    # Expired while checked out: closed when returned
+    clock[0] += 101
+    pool.putconn(opened[1])
+    assert opened[1].closed
+    assert pool.stats()["idle"] == 0
+    assert pool.getconn() is opened[2]
@@ -0,0 +1,27 @@
+# insert_deals_in_supabase against a real Postgres (set TEST_DB_URL, see test_metric_sql.py).
+import time
+
+from benchmarks.synthetic import generate_deals, to_zoho_record
+from service.supabase_serice import insert_deals_in_supabase
+
+
+def records(deals):
+    return [dict(to_zoho_record(deal), stage_history=deal["stage_history"]) for deal in deals]
+
+
+def test_upsert_counts_inserted_and_updated_rows(postgres, record_property):
+    deals = generate_deals(10_000, seed=11)
+    assert insert_deals_in_supabase(records(deals[::3])) == {"inserted": 3334, "updated": 0}
+
+    # New and stored ids mixed in every batch; RETURNING (xmax = 0) tells them apart
+    started = time.perf_counter()
+    result = insert_deals_in_supabase(records(deals))
+    elapsed = time.perf_counter() - started
+    record_property("upsert_10k_seconds", round(elapsed, 3))
+    print(f"Upserted 10k deals (6666 new, 3334 stored) in {elapsed:.2f}s")
+
+    assert result == {"inserted": 6666, "updated": 3334}
+    with postgres.connection() as connection, connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM "Bigin"."deals"')
+        assert cursor.fetchone() == (10_000,)
+    assert insert_deals_in_supabase(records(deals[:10])) == {"inserted": 0, "updated": 10}
@@ -0,0 +1,43 @@
+import gc
+import json
+import os
+import tracemalloc
+
+from benchmarks.synthetic import iter_sample_deals
+from service.deal_model import DealSet
+
+DEALS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deals.json")
+# deals.json scaled 25x; benchmarks.run's deal_set_memory entry does the same at 1000x
+SCALED_DEALS = 10000
+
+
+def traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        gc.collect()
+        return built, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def test_deal_set_takes_less_memory_than_the_rows():
+    rows, rows_bytes = traced_bytes(lambda: list(iter_sample_deals(SCALED_DEALS)))
+    del rows
+    deal_set, deal_set_bytes = traced_bytes(lambda: DealSet.from_records(iter_sample_deals(SCALED_DEALS)))
+    assert len(deal_set) == SCALED_DEALS
+    assert deal_set_bytes < rows_bytes * 0.6
+
+
+def test_rows_come_back_unchanged():
+    with open(DEALS_FILE) as f:
+        deals = json.load(f)
+    deals.append(dict(deals[0], id="as-text", stage_history=json.dumps(deals[0]["stage_history"])))
+    deals.append({"id": "bare", "pipeline": "Sales Pipeline Standard"})
+
+    deal_set = DealSet.from_records(deals)
+
+    assert [deal.row() for deal in deal_set] == deals
+    assert [list(deal.row()) for deal in deal_set] == [list(deal) for deal in deals]
@@ -0,0 +1,99 @@
+import importlib.util
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from benchmarks.synthetic import generate_deals
+from service.metric_serice import get_deals_metrics
+
+DEALS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deals.json")
+ENGINES = [
+    "python",
+    pytest.param("numpy", marks=pytest.mark.skipif(importlib.util.find_spec("numpy") is None,
+                                                   reason="numpy is not installed")),
+]
+
+
+def baseline_deals_metrics(deals):
+    """get_deals_metrics as it was before the DealSet and the numpy engine; the reference both engines must agree with."""
+    today = date.today()
+    overdue = []
+    due_today = []
+    for deal in deals:
+        closing_date = deal.get("closing_date")
+        if not closing_date:
+            continue
+        try:
+            if isinstance(closing_date, str):
+                closing_date = datetime.strptime(closing_date, "%Y-%m-%d").date()
+            elif isinstance(closing_date, datetime):
+                closing_date = closing_date.date()
+        except Exception:
+            continue
+        if closing_date < today:
+            overdue.append(deal)
+        elif closing_date == today:
+            due_today.append(deal)
+
+    def in_pipeline(selected, pipeline):
+        return [deal for deal in selected if deal.get("pipeline") == pipeline]
+
+    return {
+        "total_deals": len(deals),
+        "total_overdue": len(overdue),
+        "total_due_today": len(due_today),
+        "total_due_today_list": due_today,
+        "sales_total": len(in_pipeline(deals, "Sales")),
+        "sales_overdue": in_pipeline(overdue, "Sales"),
+        "sales_due_today": in_pipeline(due_today, "Sales"),
+        "qual_total": len(in_pipeline(deals, "Qual")),
+        "quals_overdue": in_pipeline(overdue, "Qual"),
+        "quals_due_today": in_pipeline(due_today, "Qual"),
+        "slowmo_total": len(in_pipeline(deals, "SloMo")),
+        "slowmo_overdue": in_pipeline(overdue, "SloMo"),
+        "slowmo_due_today": in_pipeline(due_today, "SloMo"),
+    }
+
+
+def messy_closing_deals(seed: int, count: int = 300) -> list[dict]:
+    """Synthetic deals whose closing dates are missing, malformed, or around today in every accepted type."""
+    rng = random.Random(seed)
+    today = date.today()
+    deals = generate_deals(count, seed=seed)
+    for deal in deals:
+        day = today + timedelta(days=rng.choice([-400, -30, -1, 0, 0, 1, 30]))
+        deal["closing_date"] = rng.choice([
+            None, "", "not a date", "2025/09/03", "2025-13-01", day.isoformat(),
+            f"{day.year}-{day.month}-{day.day}",  # not zero-padded, still accepted by strptime
+            datetime.combine(day, datetime.min.time()), day.isoformat(), day.isoformat(),
+        ])
+        if rng.random() < 0.05:
+            deal["pipeline"] = rng.choice([None, "Partnerships"])
+    return deals
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("seed", range(3))
+def test_messy_closing_dates_match_baseline(engine, seed):
+    deals = messy_closing_deals(seed)
+    expected = baseline_deals_metrics(deals)
+    assert get_deals_metrics(deals, engine=engine) == expected
+    assert expected["total_overdue"] and expected["total_due_today"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_deals_json_matches_baseline(engine):
+    with open(DEALS_FILE) as f:
+        deals = json.load(f)
+    expected = baseline_deals_metrics(deals)
+    assert get_deals_metrics(deals, engine=engine) == expected
+    assert expected["total_overdue"]
+
+
+def test_engines_agree():
+    pytest.importorskip("numpy")
+    deals = messy_closing_deals(seed=7)
+    assert get_deals_metrics(deals, engine="numpy") == get_deals_metrics(deals, engine="python")
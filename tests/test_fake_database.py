@@ -0,0 +1,64 @@
+from psycopg2 import sql
+
+from benchmarks.stubs import gsheet_stub, render_query
+from benchmarks.synthetic import generate_deals, to_zoho_record
+from service import supabase_serice
+from service.supabase_serice import get_deal_fingerprints, get_deals_watermark, insert_deals_in_supabase
+
+
+def records(deals):
+    return [dict(to_zoho_record(deal), stage_history=deal["stage_history"]) for deal in deals]
+
+
+def test_fake_upsert_tells_new_ids_from_stored_ones(fake_database):
+    deals = generate_deals(10, seed=8)
+    database = fake_database(deals[:4])
+
+    assert insert_deals_in_supabase(records(deals), batch_size=3) == {"inserted": 6, "updated": 4}
+    assert insert_deals_in_supabase(records(deals[:2])) == {"inserted": 0, "updated": 2}
+    assert sorted(database.deals) == sorted(deal["id"] for deal in deals)
+
+
+def test_fake_answers_reads_by_id_and_watermark(fake_database):
+    deals = generate_deals(5, seed=9)
+    fake_database([])
+    insert_deals_in_supabase(records(deals))
+
+    fingerprints = get_deal_fingerprints([deals[1]["id"], 1])
+    assert list(fingerprints) == [deals[1]["id"]]
+    history = deals[1]["stage_history"]
+    assert fingerprints[deals[1]["id"]][1:] == (deals[1]["stage"], len(history), history)
+    assert get_deals_watermark() == max(row["modified_time"] for row in supabase_serice.iter_deals())
+
+
+def test_installing_the_fake_leaves_the_write_flags_alone(fake_database):
+    flags = (supabase_serice.DB_WRITE_STAGE_TRANSITIONS, supabase_serice.DB_WRITE_WEEKLY_AGGREGATES)
+    fake_database(generate_deals(3))
+    assert (supabase_serice.DB_WRITE_STAGE_TRANSITIONS, supabase_serice.DB_WRITE_WEEKLY_AGGREGATES) == flags
+
+
+def test_fake_leaves_psycopg2_quoting_alone(fake_database):
+    as_string = sql.Identifier.as_string
+    fake_database(generate_deals(3, seed=10))
+    insert_deals_in_supabase(records(generate_deals(3, seed=11)))
+    assert sql.Identifier.as_string is as_string
+
+
+def test_fake_renders_statements_like_psycopg2(postgres):
+    statement = sql.SQL("SELECT {}, {} FROM {}.{} WHERE {} = %s AND note = {}").format(
+        sql.Identifier("id"), sql.Identifier('odd"name'), sql.Identifier("Bigin"), sql.Identifier("deals"),
+        sql.Placeholder("id"), sql.Literal("it's"),
+    )
+    with postgres.connection() as connection:
+        assert render_query(statement) == statement.as_string(connection)
+        upsert = supabase_serice.build_upsert_statement()
+        assert render_query(upsert) == upsert.as_string(connection)
+
+
+def test_gsheet_stub_puts_the_client_back():
+    from service import spreadsheet_service
+
+    get_gsheet_client = spreadsheet_service.get_gsheet_client
+    with gsheet_stub([["1", "Deal"]]) as worksheet:
+        assert spreadsheet_service.get_gsheet_client().open_by_key("key").worksheet("Deals") is worksheet
+    assert spreadsheet_service.get_gsheet_client is get_gsheet_client
@@ -0,0 +1,158 @@
+import re
+
+import pytest
+
+import main
+from utils import instrumentation
+from utils.instrumentation import ProgressReporter, increment, record_span, render_prometheus, span
+
+TYPE_LINE = re.compile(r"# TYPE ([a-zA-Z_:][a-zA-Z0-9_:]*) (counter|gauge|summary|histogram|untyped)")
+SAMPLE_LINE = re.compile(r"([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)")
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(,|$)')
+SUMMARY_SUFFIXES = ("_count", "_sum")
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, "INSTRUMENTATION_ENABLED", True)
+    monkeypatch.setattr(instrumentation, "_spans", {})
+    monkeypatch.setattr(instrumentation, "_counters", {})
+    monkeypatch.setattr(instrumentation, "_gauge_sources", [])
+
+
+def parse_labels(text: str) -> dict:
+    labels = {}
+    position = 0
+    while position < len(text):
+        match = LABEL.match(text, position)
+        assert match, f"bad label set {text!r}"
+        value = re.sub(r"\\(.)", lambda escape: {"n": "\n"}.get(escape.group(1), escape.group(1)), match.group(2))
+        labels[match.group(1)] = value
+        position = match.end()
+    return labels
+
+
+def parse_prometheus(text: str) -> list[tuple]:
+    """
+    Parse the text exposition format strictly enough to catch what scrapers
+    reject: every sample belongs to the family declared just before it, and a
+    family's TYPE line and samples appear once, in one block.
+    Returns (family, sample name, labels, value) tuples.
+    """
+    assert text.endswith("\n")
+    samples = []
+    seen_families = set()
+    family = kind = None
+    for line in text[:-1].split("\n"):
+        type_match = TYPE_LINE.fullmatch(line)
+        if type_match:
+            family, kind = type_match.groups()
+            assert family not in seen_families, f"{family} declared twice"
+            seen_families.add(family)
+            continue
+        sample_match = SAMPLE_LINE.fullmatch(line)
+        assert sample_match, f"bad line {line!r}"
+        name, label_text, value = sample_match.groups()
+        allowed = {family} | ({family + suffix for suffix in SUMMARY_SUFFIXES} if kind == "summary" else set())
+        assert name in allowed, f"{name} outside its family block (current: {family})"
+        samples.append((family, name, parse_labels(label_text or ""), float(value)))
+    return samples
+
+
+def test_render_prometheus_is_valid_text_format():
+    awkward = 'quote " backslash \\ newline \n end'
+    # Two span names with labels sorting in between, so families would interleave if rendered per key
+    record_span("zoho_request", 0.2, endpoint="Pipelines")
+    record_span("db_statement", 0.01, verb="SELECT")
+    record_span("zoho_request", 0.4, error=True, endpoint=awkward)
+    record_span("db_statement", 0.03, verb="INSERT")
+    increment("zoho_responses", endpoint="Pipelines", status=200)
+    increment("zoho_responses", endpoint=awkward, status=500)
+    instrumentation.register_gauge_source(lambda: [("pool_in_use", {}, 2), ("job_progress", {"job": "x"}, None)])
+
+    samples = parse_prometheus(render_prometheus())
+
+    by_key = {(name, tuple(sorted(labels.items()))): value for _, name, labels, value in samples}
+    assert by_key[("zoho_request_seconds_count", (("endpoint", awkward),))] == 1
+    assert by_key[("zoho_request_seconds_sum", (("endpoint", "Pipelines"),))] == pytest.approx(0.2)
+    assert by_key[("zoho_request_errors_total", (("endpoint", awkward),))] == 1
+    assert by_key[("zoho_request_seconds_max", (("endpoint", awkward),))] == pytest.approx(0.4)
+    assert by_key[("db_statement_seconds_count", (("verb", "INSERT"),))] == 1
+    assert by_key[("zoho_responses_total", (("endpoint", awkward), ("status", "500")))] == 1
+    assert by_key[("pool_in_use", ())] == 2
+    # Gauges without a value are left out
+    assert not any(name == "job_progress" for _, name, _, _ in samples)
+
+
+def test_gauge_families_from_several_sources_stay_together():
+    # Like zoho_gauges and async_zoho_gauges, each with its own zoho_cache_* samples
+    for client in ("threaded", "async"):
+        instrumentation.register_gauge_source(lambda client=client: [
+            ("zoho_cache_hits", {"client": client}, 3),
+            ("zoho_cache_misses", {"client": client}, 1),
+        ])
+
+    samples = parse_prometheus(render_prometheus())
+
+    assert [(name, labels["client"]) for _, name, labels, _ in samples] == [
+        ("zoho_cache_hits", "async"), ("zoho_cache_hits", "threaded"),
+        ("zoho_cache_misses", "async"), ("zoho_cache_misses", "threaded"),
+    ]
+
+
+def test_span_records_an_error_and_reraises():
+    with pytest.raises(ValueError, match="boom"):
+        with span("sheet_update", sheet="Weekly"):
+            raise ValueError("boom")
+    with span("sheet_update", sheet="Weekly"):
+        pass
+
+    (count, _, _, errors), = instrumentation._spans.values()
+    assert (count, errors) == (2, 1)
+
+
+def test_disabled_instrumentation_records_nothing(monkeypatch):
+    monkeypatch.setattr(instrumentation, "INSTRUMENTATION_ENABLED", False)
+    with span("zoho_request", endpoint="Pipelines"):
+        increment("zoho_responses", status=200)
+    assert render_prometheus() == "\n"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake time.monotonic for the instrumentation module; set clock.now to move it."""
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(instrumentation.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_progress_reporter_prints_at_most_once_per_interval(clock, capsys):
+    progress = ProgressReporter("Deals upserted", total=100, interval=5)
+    for done in range(1, 101):
+        clock.now += 0.1  # 10 seconds for the whole loop
+        progress.update(done)
+
+    lines = capsys.readouterr().out.splitlines()
+    # Once after 5s, once after 10s... and the last item
+    assert [line.split()[0] for line in lines] == ["[50/100]", "[100/100]"]
+    assert lines[-1] == "[100/100] Deals upserted (10/s)"
+
+
+def test_progress_reporter_finish_prints_the_unreported_count_once(clock, capsys):
+    progress = ProgressReporter("Deals fetched", interval=5)
+    for _ in range(3):
+        clock.now += 1
+        progress.update(advance=200)
+    progress.finish()
+    progress.finish()
+
+    assert capsys.readouterr().out.splitlines() == ["Deals fetched: 600 (200/s)"]
+
+
+def test_create_app_records_a_span_instead_of_printing(capsys):
+    main.create_app()
+
+    assert capsys.readouterr().out == ""
+    assert instrumentation._spans[("app_create", ())][0] == 1
@@ -0,0 +1,71 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.synthetic import generate_deals, to_db_row
+from service.metric_export import export_weekly_metrics, load_weekly_metrics
+from service.metric_serice import aggregate_weekly_metrics
+from utils.utils import get_weeks_for_months
+
+
+@pytest.fixture(scope="module")
+def weekly_metrics():
+    """A {week: metrics} backfill over stored deal rows, as JSON would carry it (datetimes as text)."""
+    deals = [to_db_row(deal) for deal in generate_deals(300, seed=5, days=90, end=datetime(2025, 9, 30, tzinfo=timezone.utc))]
+    weeks = get_weeks_for_months(datetime(2025, 7, 1).date(), datetime(2025, 10, 1).date())
+    metrics = {week["name"]: results for week, results in zip(weeks, aggregate_weekly_metrics(deals, weeks, "python"))}
+    return json.loads(json.dumps(metrics, default=str))
+
+
+@pytest.fixture(params=["json", "gz", "msgpack"])
+def extension(request):
+    if request.param == "msgpack":
+        pytest.importorskip("msgpack")
+    return request.param
+
+
+def test_backfill_round_trips(weekly_metrics, extension, tmp_path):
+    path = str(tmp_path / f"metrics.{extension}")
+    written = export_weekly_metrics(weekly_metrics, path)
+
+    assert load_weekly_metrics(path) == weekly_metrics
+    distinct = {
+        deal["id"]
+        for results in weekly_metrics.values() for result in results
+        for key in ("new_deals_list", "closed_deals_list", "won_deals_list", "movements_list")
+        for deal in result[key]
+    }
+    assert written["deals"] == len(distinct) > 0
+
+
+def test_one_week_round_trips(weekly_metrics, extension, tmp_path):
+    week = next(results for results in weekly_metrics.values() if any(result["movements_list"] for result in results))
+    path = str(tmp_path / f"week.{extension}")
+    export_weekly_metrics(week, path)
+
+    assert load_weekly_metrics(path) == week
+
+
+def test_plain_json_dump_loads_as_is(weekly_metrics, tmp_path):
+    path = tmp_path / "metrics.json"
+    path.write_text(json.dumps(weekly_metrics))
+    assert load_weekly_metrics(str(path)) == weekly_metrics
+
+
+def test_deal_table_written_before_the_metrics_loads(weekly_metrics, tmp_path):
+    # The layout exports had before the writer streamed the weeks: the deal table first
+    week = next(results for results in weekly_metrics.values() if any(result["movements_list"] for result in results))
+    deals = {deal["id"]: deal for result in week for key in result if key.endswith("_list") for deal in result[key]}
+    columns = list(next(iter(deals.values())))
+    document = {
+        "format": "weekly_metrics_compact", "version": 1,
+        "deal_columns": columns, "deals": [[deal[column] for column in columns] for deal in deals.values()],
+        "metrics": [
+            {key: [deal["id"] for deal in value] if key.endswith("_list") else value for key, value in result.items()}
+            for result in week
+        ],
+    }
+    path = tmp_path / "week.json"
+    path.write_text(json.dumps(document))
+    assert load_weekly_metrics(str(path)) == week
@@ -0,0 +1,84 @@
+# The SQL engines against a real Postgres: set TEST_DB_URL to a scratch
+# database (its Bigin schema is emptied and refilled) to run these tests.
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.synthetic import generate_deals, to_zoho_record
+from service import supabase_serice
+from service.metric_serice import aggregate_weekly_metrics
+from utils.utils import get_weeks_for_months
+
+EST = timezone(timedelta(hours=-5))
+
+
+def in_id_order(weekly_results):
+    """The weekly results with each deal list sorted by id (the stored buckets keep no order)."""
+    return [
+        [
+            {
+                key: sorted(value, key=lambda deal: deal["id"]) if key.endswith("_list") else value
+                for key, value in result.items()
+            }
+            for result in results
+        ]
+        for results in weekly_results
+    ]
+
+
+def zoho_records(deals: list[dict]) -> list[dict]:
+    """Generated deals as Pipelines records with their history, a third of them in a UTC-5 offset."""
+    records = []
+    for i, deal in enumerate(deals):
+        history = deal["stage_history"]
+        if i % 3 == 0:
+            # Transitions on the other side of UTC, so the day margin in the query matters
+            history = [
+                dict(entry, Modified_Time=datetime.fromisoformat(entry["Modified_Time"]).astimezone(EST).isoformat())
+                for entry in history
+            ]
+        records.append(dict(to_zoho_record(deal), stage_history=history))
+    return records
+
+
+@pytest.fixture
+def loaded_deals(postgres):
+    """Generated deals upserted through insert_deals_in_supabase, read back in id order."""
+    deals = generate_deals(400, seed=3, days=120, end=datetime(2025, 11, 30, tzinfo=timezone.utc))
+    supabase_serice.insert_deals_in_supabase(zoho_records(deals), batch_size=150)
+    return sorted(supabase_serice.iter_deals(), key=lambda deal: deal["id"])
+
+
+def test_sql_engine_matches_python_engine(loaded_deals):
+    from service.metric_sql import aggregate_weekly_metrics_sql
+
+    weeks = get_weeks_for_months(date(2025, 7, 1), date(2025, 12, 1))
+    expected = aggregate_weekly_metrics(loaded_deals, weeks, "python")
+    assert aggregate_weekly_metrics_sql(weeks) == expected
+    # The deal lists come back in id order, like the python engine over id-ordered deals
+    assert any(len(result["movements_list"]) > 1 for results in expected for result in results)
+
+
+def test_stored_aggregates_match_python_engine(loaded_deals):
+    from service.weekly_aggregates import aggregate_weekly_metrics_stored
+
+    weeks = get_weeks_for_months(date(2025, 7, 1), date(2025, 12, 1))
+    expected = in_id_order(aggregate_weekly_metrics(loaded_deals, weeks, "python"))
+    assert in_id_order(aggregate_weekly_metrics_stored(weeks)) == expected
+
+
+def test_rebuild_stage_transitions_runs_on_one_connection(loaded_deals, postgres, monkeypatch):
+    from service.metric_sql import aggregate_weekly_metrics_sql
+
+    weeks = get_weeks_for_months(date(2025, 7, 1), date(2025, 12, 1))
+    expected = aggregate_weekly_metrics_sql(weeks)
+    with postgres.connection() as connection, connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM "Bigin"."stage_transitions"')
+        (stored,) = cursor.fetchone()
+        cursor.execute('DELETE FROM "Bigin"."stage_transitions" WHERE position > 0')
+
+    # Reading the deals on a second connection would wait for the first one and time out
+    monkeypatch.setattr(postgres, "max_size", 1)
+    monkeypatch.setattr(postgres, "timeout", 1)
+    assert supabase_serice.rebuild_stage_transitions(batch_size=150) == stored
+    assert aggregate_weekly_metrics_sql(weeks) == expected
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.synthetic import generate_deals, to_db_row
+from routes import metrics_routes
+from service.metric_serice import get_deals_metrics
+from utils import auth
+from utils.cache import bump_data_version
+
+API_KEY = "test-admin-key"
+HEADERS = {"X-API-Key": API_KEY}
+
+
+@pytest.fixture
+def deals(monkeypatch):
+    """The deals behind /deal-metrics/current, with a log of the metrics computations."""
+    deals = [{"id": 1}, {"id": 2}]
+    computed = []
+
+    def count_deals(rows):
+        computed.append(len(rows))
+        return {"total_deals": len(rows)}
+
+    monkeypatch.setattr(metrics_routes, "fetch_deal_set", lambda **filters: list(deals))
+    monkeypatch.setattr(metrics_routes, "get_deals_metrics", count_deals)
+    metrics_routes.metrics_cache.clear()
+    yield deals, computed
+    metrics_routes.metrics_cache.clear()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", API_KEY)
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("path", ["/deal-metrics/current", "/deal-metrics/weekly"])
+@pytest.mark.parametrize("headers", [{}, {"X-API-Key": "wrong-key"}])
+def test_metrics_need_the_api_key(client, path, headers):
+    assert client.get(path, headers=headers).status_code == 401
+
+
+def test_matching_etag_gets_a_304(client, deals):
+    _, computed = deals
+    response = client.get("/deal-metrics/current", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json() == {"total_deals": 2}
+    etag = response.headers["ETag"]
+
+    cached = client.get("/deal-metrics/current", headers=dict(HEADERS, **{"If-None-Match": etag}))
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+    assert computed == [2]
+
+
+@pytest.mark.parametrize("if_none_match", ["W/{etag}", '"other", {etag}', '"other",W/{etag}', "*"])
+def test_weak_and_listed_etags_match(client, deals, if_none_match):
+    etag = client.get("/deal-metrics/current", headers=HEADERS).headers["ETag"]
+    headers = dict(HEADERS, **{"If-None-Match": if_none_match.format(etag=etag)})
+    assert client.get("/deal-metrics/current", headers=headers).status_code == 304
+
+
+@pytest.mark.parametrize("if_none_match", ['"other"', 'W/"other", "stale"'])
+def test_other_etags_get_the_body(client, deals, if_none_match):
+    response = client.get("/deal-metrics/current", headers=dict(HEADERS, **{"If-None-Match": if_none_match}))
+    assert response.status_code == 200
+    assert response.json() == {"total_deals": 2}
+
+
+def test_new_data_version_invalidates_the_cache(client, deals):
+    rows, computed = deals
+    etag = client.get("/deal-metrics/current", headers=HEADERS).headers["ETag"]
+
+    # A sync stored a deal
+    rows.append({"id": 3})
+    bump_data_version()
+    assert len(metrics_routes.metrics_cache) == 0
+
+    response = client.get("/deal-metrics/current", headers=dict(HEADERS, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.json() == {"total_deals": 3}
+    assert response.headers["ETag"] != etag
+    assert computed == [2, 3]
+
+
+def test_current_metrics_of_the_stored_deals(client, fake_database):
+    deals = generate_deals(30, seed=4)
+    fake_database(deals)
+    metrics_routes.metrics_cache.clear()
+
+    response = client.get("/deal-metrics/current", headers=HEADERS)
+    expected = get_deals_metrics([to_db_row(deal) for deal in deals])
+    assert response.json() == json.loads(json.dumps(expected, default=str))
+    metrics_routes.metrics_cache.clear()
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.synthetic import generate_deals
+from service.metric_serice import get_deals_metrics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    # A None entry in sys.modules makes `import numpy` raise ImportError
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    monkeypatch.delitem(sys.modules, "service.metric_vectorized", raising=False)
+
+
+def test_numpy_engine_without_numpy_raises_clear_error(without_numpy):
+    deals = generate_deals(20, seed=5)
+    assert get_deals_metrics(deals, engine="python")["total_deals"] == 20
+    with pytest.raises(ImportError, match="requirements-optional.txt"):
+        get_deals_metrics(deals, engine="numpy")
+
+
+def test_app_imports_without_numpy():
+    code = "import sys; sys.modules['numpy'] = None; import main, cli"
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,69 @@
+from service import spreadsheet_service
+
+
+class LayoutWorksheet:
+    """A worksheet handle over a shared grid of cells; gspread hands out a new handle per open."""
+
+    def __init__(self, cells: list[list], writes: list):
+        self.cells = cells
+        self.writes = writes
+        self.reads = 0
+
+    def get_all_values(self):
+        self.reads += 1
+        return [list(row) for row in self.cells]
+
+    def batch_update(self, data):
+        self.writes.append([update["range"] for update in data])
+
+
+class LayoutSpreadsheet:
+    def __init__(self, cells, writes):
+        self.cells = cells
+        self.writes = writes
+        self.opened = []
+
+    def worksheet(self, title):
+        self.opened.append(LayoutWorksheet(self.cells, self.writes))
+        return self.opened[-1]
+
+
+def summary_cells(sales_row: int) -> list[list]:
+    cells = [[""] * 4 for _ in range(20)]
+    cells[0][0] = "Overall_Summary"
+    cells[sales_row - 1][1] = "Sales_Summary"
+    cells[10][2] = "Quals_Summary"
+    cells[14][3] = "Slowmo_Summary"
+    return cells
+
+
+def test_layout_is_read_once_per_refresh_and_follows_moved_labels(monkeypatch):
+    cells = summary_cells(sales_row=5)
+    writes = []
+    spreadsheet = LayoutSpreadsheet(cells, writes)
+    client = type("Client", (), {"open_by_key": lambda self, key: spreadsheet})()
+    monkeypatch.setattr(spreadsheet_service, "get_gsheet_client", lambda: client)
+
+    spreadsheet_service.update_deals_sheet_summary({"total_deals": 3})
+    assert spreadsheet.opened[0].reads == 1
+    assert writes[-1] == ["A4", "B8", "C14", "D18"]
+
+    # Someone moves Sales_Summary down two rows; the sheet keeps its size
+    cells[:] = summary_cells(sales_row=7)
+    spreadsheet_service.update_deals_sheet_summary({"total_deals": 3})
+    assert spreadsheet.opened[1].reads == 1
+    assert writes[-1] == ["A4", "B10", "C14", "D18"]
+
+
+def test_tables_read_the_layout_once(monkeypatch):
+    cells = [[""] * 4 for _ in range(20)]
+    for row, label in ((1, "Due_Today"), (6, "Sales_Overdue"), (11, "Quals_Overdue"), (16, "Slowmo_Overdue")):
+        cells[row - 1][1] = label
+    writes = []
+    spreadsheet = LayoutSpreadsheet(cells, writes)
+    client = type("Client", (), {"open_by_key": lambda self, key: spreadsheet})()
+    monkeypatch.setattr(spreadsheet_service, "get_gsheet_client", lambda: client)
+
+    spreadsheet_service.update_deals_sheet_tables({})
+    assert spreadsheet.opened[0].reads == 1
+    assert writes == [["A4", "B9", "B14", "B19"]]
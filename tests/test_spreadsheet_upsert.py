@@ -0,0 +1,53 @@
+from benchmarks.stubs import FakeWorksheet
+from service.spreadsheet_service import DEAL_SHEET_COLUMNS, upsert_rows_to_worksheet
+
+
+def sheet_row(deal_id: int, stage: str = "Replied", amount=None) -> list:
+    return [deal_id, f"Deal {deal_id}", amount, stage, 500 + deal_id, f"Contact {deal_id}", "2025-10-01", None]
+
+
+def make_worksheet(rows):
+    return FakeWorksheet(DEAL_SHEET_COLUMNS, [["" if value is None else value for value in row] for row in rows])
+
+
+def test_only_changed_and_new_rows_are_written():
+    worksheet = make_worksheet([sheet_row(1), sheet_row(2), sheet_row(3, amount=1500.0)])
+    rows = [
+        sheet_row(1),                  # unchanged
+        sheet_row(2, stage="Won"),     # changed
+        sheet_row(3, amount=1500),     # unchanged: 1500 == 1500.0 once normalized
+        sheet_row(4),                  # new
+        sheet_row(5, stage="Old"),     # new, but overridden below (last one wins)
+        sheet_row(5),
+    ]
+
+    result = upsert_rows_to_worksheet(worksheet, rows, batch_size=500)
+
+    assert result == {"updated": 1, "appended": 2, "unchanged": 2}
+    # get_all_records + one batch_update + one append_rows
+    assert worksheet.requests == 3
+    assert [row[0] for row in worksheet.rows] == [1, 2, 3, 4, 5]
+    assert worksheet.rows[1][3] == "Won"
+    assert worksheet.rows[4][3] == "Replied"
+
+
+def test_writes_are_batched():
+    worksheet = make_worksheet([sheet_row(deal_id) for deal_id in range(1, 6)])
+    rows = [sheet_row(deal_id, stage="Won") for deal_id in range(1, 6)] + [sheet_row(deal_id) for deal_id in range(6, 11)]
+
+    result = upsert_rows_to_worksheet(worksheet, rows, batch_size=2)
+
+    assert result == {"updated": 5, "appended": 5, "unchanged": 0}
+    # get_all_records + 3 batch_update (2+2+1) + 3 append_rows (2+2+1)
+    assert worksheet.requests == 7
+    assert [row[3] for row in worksheet.rows] == ["Won"] * 5 + ["Replied"] * 5
+
+
+def test_nothing_changed_makes_no_writes():
+    existing = [sheet_row(deal_id) for deal_id in range(1, 4)]
+    worksheet = make_worksheet(existing)
+
+    result = upsert_rows_to_worksheet(worksheet, existing)
+
+    assert result == {"updated": 0, "appended": 0, "unchanged": 3}
+    assert worksheet.requests == 1
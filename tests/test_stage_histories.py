@@ -0,0 +1,25 @@
+from benchmarks.synthetic import generate_deals
+from service.zoho_service import fetch_stage_histories
+
+
+def test_concurrent_fetch_matches_sequential_and_overlaps(zoho_server):
+    deals = generate_deals(40, seed=3)
+    deal_ids = [str(deal["id"]) for deal in deals]
+    deal_ids.insert(20, None)
+    expected = [deal["stage_history"] for deal in deals]
+    expected.insert(20, None)
+
+    # Every Stage_History request takes 10ms, like a (fast) round trip to Zoho
+    with zoho_server(deals, latency=0.01) as server:
+        sequential = fetch_stage_histories(deal_ids, workers=1)
+        assert server.max_in_flight == 1
+
+        concurrent = fetch_stage_histories(deal_ids, workers=8)
+        assert server.history_requests == 2 * len(deals)
+        # The workers' requests were answered at the same time, over pooled
+        # keep-alive connections rather than one connection per request
+        assert 1 < server.max_in_flight <= 8
+        assert server.connections <= 8
+
+    assert sequential == expected
+    assert concurrent == sequential
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from benchmarks.synthetic import generate_deals
+from service import sync_service
+from service.supabase_serice import insert_deals_in_supabase, iter_deals
+from service.zoho_client import ZohoAPIError
+
+
+@pytest.fixture
+def synced_ids(monkeypatch, tmp_path, fake_database):
+    """Run syncs against the fake database; returns the list of deal ids upserted, page by page."""
+    monkeypatch.setattr(sync_service, "SYNC_CHECKPOINT_FILE", str(tmp_path / "sync_checkpoint.json"))
+    fake_database([])
+    pages = []
+    insert = sync_service.insert_deals_in_supabase
+
+    def recording_insert(deals):
+        pages.append([deal["id"] for deal in deals])
+        return insert(deals)
+
+    monkeypatch.setattr(sync_service, "insert_deals_in_supabase", recording_insert)
+    return pages
+
+
+def test_failed_stage_history_keeps_page_for_next_run(zoho_stub, synced_ids):
+    deals = generate_deals(5, seed=4)
+    adapter = zoho_stub(deals, page_size=2)
+    failing_id = str(deals[3]["id"])
+    adapter.history_errors[failing_id] = 404
+
+    with pytest.raises(ZohoAPIError):
+        sync_service.sync_deals(full_resync=True, resume=False, force_refetch=True)
+    # The first page is stored; the page with the failed history is not, not even partly
+    assert synced_ids == [[str(deals[0]["id"]), str(deals[1]["id"])]]
+    assert sync_service.load_checkpoint()["next_page_token"] == "1"
+
+    del adapter.history_errors[failing_id]
+    totals = sync_service.sync_deals(force_refetch=True)
+    assert synced_ids[1:] == [[str(deals[2]["id"]), failing_id], [str(deals[4]["id"])]]
+    assert totals["deals"] == 5
+    assert not os.path.exists(sync_service.SYNC_CHECKPOINT_FILE)
+
+
+def cancel_on_page(monkeypatch, cancel_event, page: int):
+    """Set `cancel_event` while page number `page` is being stored."""
+    insert = sync_service.insert_deals_in_supabase
+    calls = []
+
+    def insert_then_cancel(deals):
+        calls.append(deals)
+        if len(calls) == page:
+            cancel_event.set()
+        return insert(deals)
+
+    monkeypatch.setattr(sync_service, "insert_deals_in_supabase", insert_then_cancel)
+
+
+def test_cancel_stops_before_next_page(zoho_stub, synced_ids, monkeypatch):
+    zoho_stub(generate_deals(5, seed=6), page_size=2)
+    cancel_event = threading.Event()
+    cancel_on_page(monkeypatch, cancel_event, page=1)
+
+    with pytest.raises(sync_service.SyncCancelled):
+        sync_service.sync_deals(full_resync=True, resume=False, force_refetch=True, cancel_event=cancel_event)
+    assert len(synced_ids) == 1
+    assert sync_service.load_checkpoint()["next_page_token"] == "1"
+
+
+def test_cancel_during_last_page_finishes_the_run(zoho_stub, synced_ids, monkeypatch):
+    zoho_stub(generate_deals(5, seed=6), page_size=2)
+    cancel_event = threading.Event()
+    cancel_on_page(monkeypatch, cancel_event, page=3)
+
+    totals = sync_service.sync_deals(full_resync=True, resume=False, force_refetch=True, cancel_event=cancel_event)
+    assert totals["pages"] == 3 and totals["deals"] == 5
+    assert not os.path.exists(sync_service.SYNC_CHECKPOINT_FILE)
+
+
+@pytest.fixture(params=["fake", "postgres"])
+def stored_deals(request, monkeypatch, tmp_path):
+    """A database for whole syncs: the fake, and Postgres when TEST_DB_URL is set."""
+    monkeypatch.setattr(sync_service, "SYNC_CHECKPOINT_FILE", str(tmp_path / "sync_checkpoint.json"))
+    if request.param == "postgres":
+        request.getfixturevalue("postgres")
+    else:
+        request.getfixturevalue("fake_database")([])
+    return lambda: {deal["id"]: deal for deal in iter_deals()}
+
+
+def test_unchanged_deals_reuse_their_stored_history(zoho_stub, stored_deals):
+    deals = generate_deals(9, seed=12)
+    adapter = zoho_stub(deals, page_size=4)
+    first = sync_service.sync_deals(full_resync=True, resume=False)
+    assert adapter.history_requests == 9 and first["history_calls_saved"] == 0
+
+    # One deal moved on in Zoho: new stage, new Modified_Time, one more history entry
+    moved = adapter.records[5]
+    moved["Stage"] = "Closed Won"
+    moved["Modified_Time"] = "2030-01-01T10:00:00+05:30"
+    history = adapter.histories[moved["id"]]
+    history.insert(0, {"id": "1", "Stage": "Closed Won", "Modified_Time": moved["Modified_Time"]})
+
+    adapter.history_requests = 0
+    progress = {}
+    second = sync_service.sync_deals(full_resync=True, resume=False, progress=progress)
+    assert adapter.history_requests == 1
+    assert second["history_calls_saved"] == 8
+    assert (progress["histories_fetched"], progress["histories_reused"]) == (1, 8)
+
+    stored = stored_deals()
+    assert json.loads(stored[int(moved["id"])]["stage_history"]) == history
+    # The reused histories are written back unchanged, not dropped
+    assert all(json.loads(stored[deal["id"]]["stage_history"]) == deal["stage_history"]
+               for deal in deals if str(deal["id"]) != moved["id"])
+
+
+def test_force_refetch_fetches_every_history(zoho_stub, stored_deals):
+    adapter = zoho_stub(generate_deals(6, seed=13), page_size=4)
+    sync_service.sync_deals(full_resync=True, resume=False)
+
+    adapter.history_requests = 0
+    totals = sync_service.sync_deals(full_resync=True, resume=False, force_refetch=True)
+    assert adapter.history_requests == 6
+    assert totals["history_calls_saved"] == 0
+
+
+def test_deal_without_stage_changes_reuses_its_empty_history(zoho_stub, stored_deals):
+    deals = generate_deals(4, seed=14)
+    adapter = zoho_stub(deals)
+    adapter.histories[str(deals[0]["id"])] = []
+    sync_service.sync_deals(full_resync=True, resume=False)
+    assert json.loads(stored_deals()[deals[0]["id"]]["stage_history"]) == []
+
+    adapter.history_requests = 0
+    totals = sync_service.sync_deals(full_resync=True, resume=False)
+    assert adapter.history_requests == 0 and totals["history_calls_saved"] == 4
+    assert json.loads(stored_deals()[deals[0]["id"]]["stage_history"]) == []
+
+
+def test_deal_stored_without_history_is_fetched(zoho_stub, stored_deals):
+    deals = generate_deals(4, seed=18)
+    adapter = zoho_stub(deals)
+    # Stored with a NULL stage_history, as by a plain insert of the Pipelines records
+    insert_deals_in_supabase([adapter.records[0]])
+    sync_service.sync_deals(full_resync=True, resume=False)
+    assert adapter.history_requests == 4
+
+    adapter.history_requests = 0
+    totals = sync_service.sync_deals(full_resync=True, resume=False)
+    assert adapter.history_requests == 0 and totals["history_calls_saved"] == 4
+
+
+def modify_in_zoho(adapter, index: int, modified_time: str):
+    """Move the stub's record at `index` to Closed Won at `modified_time`; returns its id."""
+    record = adapter.records[index]
+    record["Stage"] = "Closed Won"
+    record["Modified_Time"] = modified_time
+    adapter.histories[record["id"]].insert(0, {"id": "1", "Stage": "Closed Won", "Modified_Time": modified_time})
+    return record["id"]
+
+
+def test_incremental_sync_fetches_only_modified_deals(zoho_stub, synced_ids):
+    deals = generate_deals(8, seed=15)
+    adapter = zoho_stub(deals, page_size=3)
+    sync_service.sync_deals(full_resync=True, resume=False)
+    watermark = max(datetime.fromisoformat(record["Modified_Time"]) for record in adapter.records)
+
+    modified = [
+        modify_in_zoho(adapter, 2, "2030-01-01T10:00:00+05:30"),
+        modify_in_zoho(adapter, 6, "2030-01-02T10:00:00+05:30"),
+    ]
+    adapter.history_requests = 0
+    synced_ids.clear()
+    progress = {}
+    totals = sync_service.sync_deals(progress=progress)
+
+    assert adapter.modified_since[-1] == watermark.isoformat(timespec="seconds")
+    assert synced_ids == [modified]
+    assert adapter.history_requests == 2
+    assert (totals["deals"], totals["inserted"], totals["updated"]) == (2, 0, 2)
+    assert progress["histories_fetched"] == 2
+
+    stored = {deal["id"]: deal for deal in iter_deals()}
+    for deal_id in modified:
+        assert stored[int(deal_id)]["stage"] == "Closed Won"
+        assert json.loads(stored[int(deal_id)]["stage_history"]) == adapter.histories[deal_id]
+    assert len(stored) == 8
+
+
+def test_incremental_sync_stops_when_nothing_changed(zoho_stub, synced_ids):
+    adapter = zoho_stub(generate_deals(5, seed=16), page_size=2)
+    sync_service.sync_deals(full_resync=True, resume=False)
+
+    adapter.history_requests = 0
+    synced_ids.clear()
+    totals = sync_service.sync_deals()
+    # The stub answers 304: no page is stored and no history fetched
+    assert adapter.modified_since[-1] is not None
+    assert synced_ids == []
+    assert adapter.history_requests == 0
+    assert totals["pages"] == 0 and totals["deals"] == 0
+
+
+def test_resumed_incremental_sync_keeps_its_original_watermark(zoho_stub, synced_ids, monkeypatch):
+    adapter = zoho_stub(generate_deals(8, seed=17), page_size=2)
+    sync_service.sync_deals(full_resync=True, resume=False)
+    watermark = max(datetime.fromisoformat(record["Modified_Time"]) for record in adapter.records)
+
+    modified = [modify_in_zoho(adapter, i, f"2030-01-0{i + 1}T10:00:00+05:30") for i in (1, 4, 7)]
+    cancel_event = threading.Event()
+    cancel_on_page(monkeypatch, cancel_event, page=1)
+    synced_ids.clear()
+    with pytest.raises(sync_service.SyncCancelled):
+        sync_service.sync_deals(cancel_event=cancel_event)
+
+    # The first page has moved the stored watermark, the checkpoint still has the run's own
+    checkpoint = sync_service.load_checkpoint()
+    assert datetime.fromisoformat(checkpoint["modified_since"]) == watermark
+    assert sync_service.get_deals_watermark() > watermark
+
+    totals = sync_service.sync_deals()
+    assert adapter.modified_since[-1] == watermark.isoformat(timespec="seconds")
+    assert totals["deals"] == 3
+    assert sorted(deal_id for page in synced_ids for deal_id in page) == sorted(modified)
+    assert not os.path.exists(sync_service.SYNC_CHECKPOINT_FILE)
+
+
+def test_deal_page_request_copies_the_headers():
+    from service.zoho_service import deal_page_request
+
+    headers = {"Authorization": "Zoho-oauthtoken test"}
+    request = deal_page_request(headers, datetime.fromisoformat("2025-09-13T10:39:20+05:30"), "2")
+    assert request["headers"] == dict(headers, **{"If-Modified-Since": "2025-09-13T10:39:20+05:30"})
+    assert headers == {"Authorization": "Zoho-oauthtoken test"}
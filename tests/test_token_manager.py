@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from service import zoho_service
+from utils import token
+from utils.token import TokenManager
+
+
+@pytest.fixture
+def token_endpoint(monkeypatch):
+    """A local OAuth token endpoint that counts refresh requests and answers after 100ms."""
+    refreshes = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+            refreshes.append(form["refresh_token"][0])
+            time.sleep(0.1)
+            body = json.dumps({"access_token": f"access-{len(refreshes)}", "expires_in": 3600}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(zoho_service, "TOKEN_URL", f"http://127.0.0.1:{server.server_port}/oauth/v2/token")
+    yield refreshes
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def token_file(monkeypatch, tmp_path):
+    path = tmp_path / "zoho_tokens.json"
+    monkeypatch.setattr(token, "TOKEN_FILE", str(path))
+    return path
+
+
+def test_concurrent_callers_share_one_refresh(token_endpoint, token_file):
+    manager = TokenManager(zoho_service.request_token_refresh)
+    manager.set_tokens({"access_token": "expired", "refresh_token": "refresh-1", "expiry_time": time.time() - 10})
+
+    threads = 16
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(manager.get_access_token())
+
+    workers = [threading.Thread(target=call) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert token_endpoint == ["refresh-1"]
+    assert results == ["access-1"] * threads
+    stored = json.loads(token_file.read_text())
+    assert stored["access_token"] == "access-1"
+    assert stored["refresh_token"] == "refresh-1"
+
+
+def test_fresh_token_makes_no_request(token_endpoint, token_file):
+    manager = TokenManager(zoho_service.request_token_refresh)
+    manager.set_tokens({"access_token": "valid", "refresh_token": "refresh-1", "expiry_time": time.time() + 3600})
+
+    assert manager.get_access_token() == "valid"
+    assert token_endpoint == []
+
+
+def test_token_file_written_after_the_first_call_is_picked_up(token_endpoint, token_file):
+    manager = TokenManager(zoho_service.request_token_refresh)
+    with pytest.raises(ValueError, match="Authenticate first"):
+        manager.get_access_token()
+
+    # The OAuth callback ran in another worker
+    token_file.write_text(json.dumps({"access_token": "new", "refresh_token": "refresh-1", "expiry_time": time.time() + 3600}))
+    assert manager.get_access_token() == "new"
+    assert token_endpoint == []
+
+
+def test_expired_token_is_reloaded_before_refreshing(token_endpoint, token_file):
+    manager = TokenManager(zoho_service.request_token_refresh)
+    manager.set_tokens({"access_token": "expired", "refresh_token": "refresh-1", "expiry_time": time.time() - 10})
+
+    # Another worker refreshed and saved the tokens meanwhile
+    token_file.write_text(json.dumps({"access_token": "theirs", "refresh_token": "refresh-1", "expiry_time": time.time() + 3600}))
+    assert manager.get_access_token() == "theirs"
+    assert token_endpoint == []
@@ -0,0 +1,88 @@
+# Bigin.weekly_pipeline_metrics against a real Postgres (see the `postgres`
+# fixture: skipped unless TEST_DB_URL points at a scratch database).
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks.synthetic import generate_deals, to_zoho_record
+from service.supabase_serice import insert_deals_in_supabase
+from service.weekly_aggregates import (
+    aggregates_table, check_weekly_aggregates, read_weekly_aggregate_ids, rebuild_weekly_aggregates
+)
+from utils.utils import get_weeks_for_months
+
+WEEKS = get_weeks_for_months(date(2025, 8, 1), date(2025, 12, 1))
+
+
+def load_deals(count: int = 150, seed: int = 5) -> list[dict]:
+    deals = generate_deals(count, seed=seed, days=60, end=datetime(2025, 11, 30, tzinfo=timezone.utc))
+    insert_deals_in_supabase([dict(to_zoho_record(deal), stage_history=deal["stage_history"]) for deal in deals])
+    return deals
+
+
+def shifted(deal: dict, days: int) -> dict:
+    """`deal` created and moved `days` days earlier."""
+    def shift(value: str) -> str:
+        return (datetime.fromisoformat(value) - timedelta(days=days)).isoformat(sep=" ")
+
+    history = [dict(entry, Modified_Time=shift(entry["Modified_Time"])) for entry in deal["stage_history"]]
+    return dict(deal, created_time=shift(deal["created_time"]), modified_time=shift(deal["modified_time"]),
+                stage_history=history)
+
+
+def weeks_with(deal_id: int, metric: str) -> list[str]:
+    return [
+        week["name"]
+        for week, buckets in zip(WEEKS, read_weekly_aggregate_ids(WEEKS))
+        for bucket in buckets.values()
+        if deal_id in bucket[metric]
+    ]
+
+
+def test_check_finds_no_differences_after_upserts(postgres):
+    load_deals()
+    assert check_weekly_aggregates(WEEKS) == []
+    assert any(weeks_with(deal["id"], "new") for deal in generate_deals(5, seed=5))
+
+
+def test_check_reports_tampered_buckets(postgres):
+    load_deals()
+    with postgres.connection() as connection, connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {aggregates_table().as_string(connection)} SET new_ids = '{{}}'")
+    mismatches = check_weekly_aggregates(WEEKS)
+    assert mismatches and {mismatch["metric"] for mismatch in mismatches} == {"new"}
+    assert all(mismatch["missing"] and not mismatch["unexpected"] for mismatch in mismatches)
+
+
+def test_upsert_moves_a_deal_between_weeks(postgres):
+    deals = load_deals()
+    for deal in deals:
+        before = weeks_with(deal["id"], "new")
+        moved = shifted(deal, 21)
+        insert_deals_in_supabase([dict(to_zoho_record(moved), stage_history=moved["stage_history"])])
+        after = weeks_with(deal["id"], "new")
+        if before and after:
+            break
+    assert before and before != after
+    assert len(after) == 1
+    assert check_weekly_aggregates(WEEKS) == []
+
+
+def test_rebuild_restores_the_buckets_on_one_connection(postgres, monkeypatch):
+    load_deals()
+    expected = read_weekly_aggregate_ids(WEEKS)
+    with postgres.connection() as connection, connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {aggregates_table().as_string(connection)}")
+    assert check_weekly_aggregates(WEEKS) != []
+
+    # Reading the deals on a second connection would wait for the first one and time out
+    monkeypatch.setattr(postgres, "max_size", 1)
+    monkeypatch.setattr(postgres, "timeout", 1)
+    assert rebuild_weekly_aggregates(batch_size=40) == 150
+    assert check_weekly_aggregates(WEEKS) == []
+    rebuilt = read_weekly_aggregate_ids(WEEKS)
+    assert [
+        {pipeline: {metric: sorted(ids) for metric, ids in bucket.items()} for pipeline, bucket in week.items()}
+        for week in rebuilt
+    ] == [
+        {pipeline: {metric: sorted(ids) for metric, ids in bucket.items()} for pipeline, bucket in week.items()}
+        for week in expected
+    ]
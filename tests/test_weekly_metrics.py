@@ -0,0 +1,189 @@
+import json
+import os
+import random
+from datetime import date, datetime, timezone
+
+import pytest
+
+from benchmarks.synthetic import generate_deals
+from service.metric_serice import (
+    aggregate_weekly_metrics, calculate_weekly_metrics_for_weeks, calculate_weekly_spreadsheet_metrics
+)
+from utils.constants import (
+    CLOSED_QUAL_LOST, CLOSED_SALES_LOST, CLOSED_SLOWMO_LOST,
+    CLOSED_QUAL_POSITIVE, CLOSED_SALES_POSITIVE, CLOSED_SLOWMO_POSITIVE
+)
+from utils.utils import get_week_data, get_weeks_for_months
+
+DEALS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deals.json")
+ENGINES = ["python", "numpy"]
+
+
+def baseline_weekly_metrics(deals, week_data):
+    """
+    calculate_weekly_spreadsheet_metrics as it was before the single-pass
+    engines, taking the week instead of its offset. The reference the engines
+    must agree with.
+    """
+    closed_stages = {
+        "Qual": CLOSED_QUAL_LOST + CLOSED_QUAL_POSITIVE,
+        "Sales": CLOSED_SALES_LOST + CLOSED_SALES_POSITIVE,
+        "SloMo": CLOSED_SLOWMO_LOST + CLOSED_SLOWMO_POSITIVE
+    }
+    positive_stages = {
+        "Qual": CLOSED_QUAL_POSITIVE,
+        "Sales": CLOSED_SALES_POSITIVE,
+        "SloMo": CLOSED_SLOWMO_POSITIVE
+    }
+    results = []
+    week_start_date = datetime.fromtimestamp(week_data["start_date"]).date()
+    week_end_date = datetime.fromtimestamp(week_data["end_date"]).date()
+
+    for pipeline in ["Sales", "Qual", "SloMo"]:
+        pipeline_deals = [deal for deal in deals if deal.get("pipeline") == pipeline]
+
+        new_deals = []
+        for deal in pipeline_deals:
+            created_time = deal.get("created_time")
+            if created_time:
+                try:
+                    if isinstance(created_time, str):
+                        created_date = datetime.fromisoformat(created_time.replace('Z', '+00:00')).date()
+                    else:
+                        created_date = created_time.date()
+                    if week_start_date <= created_date <= week_end_date:
+                        new_deals.append(deal)
+                except Exception:
+                    continue
+
+        closed_deals = []
+        won_deals = []
+        for deal in pipeline_deals:
+            stage_history = deal.get("stage_history", [])
+            if deal.get("stage") in closed_stages.get(pipeline, []):
+                for stage_entry in stage_history:
+                    stage_name = stage_entry.get("Stage")
+                    modified_time = stage_entry.get("Modified_Time")
+                    if stage_name in closed_stages.get(pipeline, []) and modified_time:
+                        try:
+                            if isinstance(modified_time, str):
+                                modified_date = datetime.fromisoformat(modified_time).date()
+                            else:
+                                modified_date = modified_time.date()
+                            if week_start_date <= modified_date <= week_end_date:
+                                closed_deals.append(deal)
+                                if stage_name in positive_stages.get(pipeline, []):
+                                    won_deals.append(deal)
+                                break
+                        except Exception:
+                            continue
+
+        movements = []
+        for deal in pipeline_deals:
+            for stage_entry in deal.get("stage_history", []):
+                modified_time = stage_entry.get("Modified_Time")
+                if modified_time:
+                    try:
+                        if isinstance(modified_time, str):
+                            modified_date = datetime.fromisoformat(modified_time).date()
+                        else:
+                            modified_date = modified_time.date()
+                        if week_start_date <= modified_date <= week_end_date:
+                            if deal not in movements:
+                                movements.append(deal)
+                            break
+                    except Exception:
+                        continue
+
+        win_percentage = 0
+        if len(closed_deals) > 0:
+            win_percentage = round((len(won_deals) / len(closed_deals)) * 100, 1)
+        results.append({
+            "week": week_data["name"],
+            "pipeline": pipeline,
+            "new_deals": len(new_deals),
+            "closed_deals": len(closed_deals),
+            "total_movements": len(movements),
+            "win_percentage": win_percentage,
+            "new_deals_list": new_deals,
+            "closed_deals_list": closed_deals,
+            "won_deals_list": won_deals,
+            "movements_list": movements
+        })
+    return results
+
+
+def messy_deals(seed: int, count: int = 300) -> list[dict]:
+    """Synthetic deals plus the irregular rows real data has: missing times, bad timestamps, other pipelines."""
+    rng = random.Random(seed)
+    deals = generate_deals(count, seed=seed, days=120, end=datetime(2025, 11, 30, tzinfo=timezone.utc))
+    for deal in deals:
+        roll = rng.random()
+        if roll < 0.03:
+            deal["created_time"] = None
+        elif roll < 0.06:
+            deal["stage_history"] = []
+        elif roll < 0.09:
+            deal["stage_history"][0]["Modified_Time"] = "not a timestamp"
+        elif roll < 0.12:
+            deal["stage_history"][-1]["Modified_Time"] = None
+        elif roll < 0.14:
+            deal["pipeline"] = None
+    return deals
+
+
+def assert_matches_baseline(deals, weeks, engine):
+    computed = aggregate_weekly_metrics(deals, weeks, engine)
+    for week, results in zip(weeks, computed):
+        assert results == baseline_weekly_metrics(deals, week), week["name"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("seed", range(5))
+def test_randomized_deals_match_baseline(engine, seed):
+    weeks = get_weeks_for_months(date(2025, 7, 1), date(2025, 12, 1))
+    assert_matches_baseline(messy_deals(seed), weeks, engine)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_deals_json_matches_baseline(engine):
+    with open(DEALS_FILE) as f:
+        deals = json.load(f)
+    weeks = get_weeks_for_months(date(2025, 6, 1), date(2025, 12, 1))
+    assert_matches_baseline(deals, weeks, engine)
+    # The fixture data actually exercises every metric
+    totals = [result for results in aggregate_weekly_metrics(deals, weeks, engine) for result in results]
+    assert all(sum(result[key] for result in totals) for key in ("new_deals", "closed_deals", "total_movements"))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_current_week_entry_point_matches_baseline(engine):
+    deals = generate_deals(200, seed=11, days=21)
+    expected = baseline_weekly_metrics(deals, get_week_data(0))
+    assert calculate_weekly_spreadsheet_metrics(deals, 0, engine) == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_backfill_matches_baseline_week_by_week(engine):
+    with open(DEALS_FILE) as f:
+        deals = json.load(f)
+    weeks = get_weeks_for_months(date(2025, 6, 1), date(2025, 12, 1))
+    expected = {week["name"]: baseline_weekly_metrics(deals, week) for week in weeks}
+    assert len(expected) == len(weeks)
+    assert calculate_weekly_metrics_for_weeks(deals, weeks, engine) == expected
+
+
+def test_deal_columns_are_kept_on_the_deal_set_until_it_changes():
+    from service.deal_model import DealSet
+    from service.metric_vectorized import as_deal_columns
+
+    deals = generate_deals(50, seed=12, days=21)
+    deal_set = DealSet.from_records(deals[:40])
+    columns = as_deal_columns(deal_set)
+    assert as_deal_columns(deal_set) is columns
+
+    for deal in deals[40:]:
+        deal_set.add(deal)
+    assert len(as_deal_columns(deal_set)) == 50
+    weeks = get_weeks_for_months(date(2025, 7, 1), date(2025, 12, 1))
+    assert aggregate_weekly_metrics(deal_set, weeks, "numpy") == aggregate_weekly_metrics(deals, weeks, "python")
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import main
+from benchmarks.synthetic import generate_deals, to_zoho_record
+from service import zoho_async_service, zoho_client
+from service.zoho_async_service import AsyncZohoClient, fetch_stage_histories_async
+from service.zoho_client import RateLimiter, ZohoAPIError, ZohoClient
+from service.zoho_service import fetch_stage_histories
+from utils import auth
+
+pytestmark = pytest.mark.anyio
+
+API_KEY = "test-admin-key"
+
+
+@pytest.fixture
+def app_client(monkeypatch):
+    """The FastAPI app over ASGI, on the test's event loop like the Zoho stub."""
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", API_KEY)
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app), base_url="http://test", headers={"X-API-Key": API_KEY}
+    )
+
+
+async def test_deals_route_follows_every_page(async_zoho_stub, app_client):
+    deals = generate_deals(45, seed=1)
+    stub = async_zoho_stub(deals, page_size=10)
+
+    async with app_client:
+        response = await app_client.get("/deals")
+
+    assert response.status_code == 200
+    assert response.json()["deals"] == [to_zoho_record(deal) for deal in deals]
+    assert stub.requests == 5
+
+
+async def test_stages_route(async_zoho_stub, app_client):
+    async_zoho_stub(generate_deals(3))
+
+    async with app_client:
+        response = await app_client.get("/stages")
+
+    assert response.status_code == 200
+    assert [field["api_name"] for field in response.json()["stages"]] == ["Stage"]
+
+
+async def test_async_stage_histories_match_threaded_client(async_zoho_stub, zoho_stub):
+    deals = generate_deals(30, seed=2)
+    zoho_stub(deals)
+    async_zoho_stub(deals, latency=0.005)
+    deal_ids = [str(deal["id"]) for deal in deals] + [None]
+
+    expected = await asyncio.to_thread(fetch_stage_histories, deal_ids, 4)
+    assert await fetch_stage_histories_async(deal_ids, concurrency=4) == expected
+    assert expected[0] == deals[0]["stage_history"] and expected[-1] is None
+
+
+async def test_failed_async_stage_history_raises(async_zoho_stub):
+    deals = generate_deals(5, seed=3)
+    stub = async_zoho_stub(deals)
+    stub.history_errors[str(deals[2]["id"])] = 500
+
+    with pytest.raises(ZohoAPIError):
+        await fetch_stage_histories_async([str(deal["id"]) for deal in deals])
+
+
+async def test_clients_share_the_process_rate_limit(monkeypatch):
+    monkeypatch.setattr(zoho_client, "_rate_limiter", None)
+    async_client = AsyncZohoClient()
+    try:
+        assert ZohoClient().rate_limiter is async_client.rate_limiter is zoho_client.get_rate_limiter()
+    finally:
+        await async_client.aclose()
+
+
+async def test_threaded_and_async_requests_draw_from_one_budget(async_zoho_stub, zoho_stub):
+    deals = generate_deals(10, seed=4)
+    zoho_stub(deals)
+    async_zoho_stub(deals)
+    # 20 requests per second, no burst: 10 requests take 0.45s however they are split
+    limiter = RateLimiter(rate=20, burst=1)
+    zoho_client.get_zoho_client().rate_limiter = limiter
+    zoho_async_service.get_async_zoho_client().rate_limiter = limiter
+    deal_ids = [str(deal["id"]) for deal in deals]
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        asyncio.to_thread(fetch_stage_histories, deal_ids[:5], 5),
+        fetch_stage_histories_async(deal_ids[5:], concurrency=5),
+    )
+    # Two separate buckets would let both halves through in about 0.2s
+    assert time.perf_counter() - started >= 0.4
+
+
+async def current_client():
+    return zoho_async_service.get_async_zoho_client()
+
+
+@pytest.fixture
+def no_async_client(monkeypatch):
+    monkeypatch.setattr(zoho_async_service, "_client", None)
+    monkeypatch.setattr(zoho_async_service, "_client_loop", None)
+
+
+def test_client_of_an_idle_loop_is_closed_when_the_loop_changes(no_async_client):
+    first_loop = asyncio.new_event_loop()
+    try:
+        first = first_loop.run_until_complete(current_client())
+        second = asyncio.run(current_client())
+        assert second is not first
+        assert first.http.is_closed and not second.http.is_closed
+    finally:
+        first_loop.close()
+    # The loop of `second` is gone by now: it is dropped without an error
+    third = asyncio.run(current_client())
+    assert not third.http.is_closed
+    asyncio.run(zoho_async_service.close_async_zoho_client())
+
+
+def test_client_of_a_running_loop_is_closed_on_it(no_async_client):
+    first_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=first_loop.run_forever)
+    thread.start()
+    try:
+        first = asyncio.run_coroutine_threadsafe(current_client(), first_loop).result()
+        asyncio.run(current_client())
+        # The aclose() is scheduled on first_loop; this waits for it
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), first_loop).result()
+        assert first.http.is_closed
+    finally:
+        first_loop.call_soon_threadsafe(first_loop.stop)
+        thread.join()
+        first_loop.close()
+    asyncio.run(zoho_async_service.close_async_zoho_client())
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.stubs import ZOHO_STUB_BASE_URL
+from benchmarks.synthetic import generate_deals
+from service import zoho_cache, zoho_client, zoho_service
+from service.zoho_cache import ResponseCache, ZohoCacheMiss, cache_key
+from utils import token
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The zoho_cache clock, moved by hand."""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(zoho_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def store(cache: ResponseCache, name: str) -> str:
+    url = f"{ZOHO_STUB_BASE_URL}{name}"
+    key = cache_key(url)
+    cache.set(key, url, 200, {"Content-Type": "application/json"}, b'{"data": []}')
+    return key
+
+
+def stub_client(adapter, cache: ResponseCache) -> zoho_client.ZohoClient:
+    client = zoho_client.ZohoClient(
+        base_url=ZOHO_STUB_BASE_URL,
+        rate_limiter=zoho_client.RateLimiter(rate=1e9, burst=10 ** 9),
+        cache=cache,
+    )
+    client.session.mount(ZOHO_STUB_BASE_URL, adapter)
+    return client
+
+
+def test_replay_miss_raises(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode="replay")
+    with pytest.raises(ZohoCacheMiss):
+        cache.get(cache_key(f"{ZOHO_STUB_BASE_URL}Pipelines"))
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_replay_client_needs_no_tokens(zoho_stub, tmp_path, monkeypatch):
+    adapter = zoho_stub(generate_deals(5, seed=1))
+    zoho_client._client = stub_client(adapter, ResponseCache(str(tmp_path), mode="readwrite"))
+    stages = zoho_service.get_all_stages()
+    assert stages and adapter.requests == 1
+
+    # Offline with ZOHO_CACHE_MODE unset: the replay cache handed to the client decides
+    monkeypatch.setattr(zoho_service.token_manager, "_tokens", None)
+    monkeypatch.setattr(token, "TOKEN_FILE", str(tmp_path / "missing.json"))
+    zoho_client._client = stub_client(adapter, ResponseCache(str(tmp_path), mode="replay"))
+    assert zoho_service.get_all_stages() == stages
+    with pytest.raises(ZohoCacheMiss):
+        zoho_service.get_deal_stage_history("1")
+    assert adapter.requests == 1
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), mode="readwrite", ttl=60)
+    key = store(cache, "Pipelines")
+
+    clock[0] += 59
+    assert cache.get(key).content == b'{"data": []}'
+    clock[0] += 2
+    assert cache.get(key) is None
+    # Replay serves entries of any age
+    assert ResponseCache(str(tmp_path), mode="replay", ttl=60).get(key) is not None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), mode="readwrite")
+    keys = [store(cache, f"Pipelines/{i}") for i in range(3)]
+    entry_size = cache.get_stats()["size_bytes"] / 3
+    cache.max_bytes = entry_size * 3.5
+
+    # Oldest first: 0, 1, 2; reading 0 makes 1 the least recently used
+    for age, key in zip((30, 20, 10), keys):
+        mtime = zoho_cache.os.path.getmtime(cache._path(key)) - age
+        zoho_cache.os.utime(cache._path(key), (mtime, mtime))
+    assert cache.get(keys[0]) is not None
+
+    keys.append(store(cache, "Pipelines/3"))
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2], keys[3]))
+
+
+def test_entry_evicted_while_being_read_is_still_served(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), mode="readwrite")
+    key = store(cache, "Pipelines")
+
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(zoho_cache.os, "utime", evicted)
+    assert cache.get(key).content == b'{"data": []}'
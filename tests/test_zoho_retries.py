@@ -0,0 +1,165 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from service import zoho_async_service, zoho_client
+from service.zoho_cache import ResponseCache
+
+BASE_URL = "https://zoho.test/bigin/v2/"
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Answers each request with the next (status, headers) of `script`; an exception in it is raised instead."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        answer = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        if isinstance(answer, Exception):
+            raise answer
+        status, headers = answer
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = b'{"data": []}'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """zoho_client's clock: sleep() only records the delay and moves the time on."""
+    state = SimpleNamespace(now=1_700_000_000.0, sleeps=[])
+
+    def sleep(seconds):
+        state.sleeps.append(seconds)
+        state.now += seconds
+
+    now = lambda: state.now
+    monkeypatch.setattr(zoho_client, "time", SimpleNamespace(time=now, monotonic=now, perf_counter=now, sleep=sleep))
+    # No jitter: backoff is exactly ZOHO_BACKOFF_BASE * 2 ** attempt
+    monkeypatch.setattr(zoho_client.random, "uniform", lambda low, high: 0)
+    return state
+
+
+def scripted_client(clock, script, max_retries=5):
+    """A ZohoClient over `script`, with no cache and a rate limit that never waits."""
+    client = zoho_client.ZohoClient(
+        base_url=BASE_URL, max_retries=max_retries,
+        rate_limiter=zoho_client.RateLimiter(rate=1e9, burst=10 ** 9),
+        cache=ResponseCache(mode="off"),
+    )
+    adapter = ScriptedAdapter(script)
+    client.session.mount(BASE_URL, adapter)
+    return client, adapter
+
+
+@pytest.mark.parametrize("status", sorted(zoho_client.RETRY_STATUS_CODES))
+def test_retryable_status_is_retried(clock, status):
+    client, adapter = scripted_client(clock, [(status, {}), (200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert adapter.sent == 2
+    assert clock.sleeps == [0.5]
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_client_errors_are_not_retried(clock, status):
+    client, adapter = scripted_client(clock, [(status, {}), (200, {})])
+    assert client.get("Pipelines").status_code == status
+    assert adapter.sent == 1
+    assert clock.sleeps == []
+
+
+def test_backoff_doubles_up_to_the_cap(clock, monkeypatch):
+    monkeypatch.setattr(zoho_client, "ZOHO_BACKOFF_MAX", 3)
+    client, adapter = scripted_client(clock, [(503, {})] * 4 + [(200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert clock.sleeps == [0.5, 1.0, 2.0, 3]
+
+
+def test_retry_after_sets_the_wait(clock):
+    client, adapter = scripted_client(clock, [(429, {"Retry-After": "7"}), (200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert clock.sleeps == [7.0]
+
+
+@pytest.mark.parametrize("reset, wait", [
+    ("12", 12.0),                          # seconds from now
+    (str(1_700_000_000 + 20), 20.0),       # epoch seconds
+    (str((1_700_000_000 + 9) * 1000), 9.0),  # epoch milliseconds
+])
+def test_ratelimit_reset_sets_the_wait(clock, reset, wait):
+    client, adapter = scripted_client(clock, [(429, {"X-RATELIMIT-RESET": reset}), (200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert clock.sleeps == [wait]
+
+
+def test_exhausted_quota_holds_back_the_next_request(clock):
+    client, adapter = scripted_client(clock, [(200, {"X-RATELIMIT-REMAINING": "0", "X-RATELIMIT-RESET": "4"}), (200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert clock.sleeps == []
+
+    client.get("Pipelines")
+    assert clock.sleeps == [4.0]
+
+
+def test_gives_up_after_max_retries(clock):
+    client, adapter = scripted_client(clock, [(503, {})], max_retries=2)
+    assert client.get("Pipelines").status_code == 503
+    assert adapter.sent == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_connection_error_is_raised_after_max_retries(clock):
+    client, adapter = scripted_client(clock, [requests.ConnectionError("connection refused")], max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.get("Pipelines")
+    assert adapter.sent == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_connection_error_is_retried(clock):
+    client, adapter = scripted_client(clock, [requests.Timeout("read timed out"), (200, {})])
+    assert client.get("Pipelines").status_code == 200
+    assert clock.sleeps == [0.5]
+
+
+@pytest.mark.anyio
+async def test_async_client_follows_the_same_rules(clock, monkeypatch):
+    async def sleep(seconds):
+        if seconds > 0:
+            clock.sleeps.append(seconds)
+            clock.now += seconds
+
+    monkeypatch.setattr(zoho_async_service, "asyncio", SimpleNamespace(sleep=sleep, to_thread=asyncio.to_thread))
+    script = [(429, {"Retry-After": "7"}), (503, {}), (503, {})]
+    sent = []
+
+    def answer(request):
+        sent.append(request.url.path)
+        status, headers = script.pop(0)
+        return httpx.Response(status, headers=headers, json={"data": []})
+
+    client = zoho_async_service.AsyncZohoClient(
+        base_url=BASE_URL, max_retries=2,
+        rate_limiter=zoho_client.RateLimiter(rate=1e9, burst=10 ** 9),
+        transport=httpx.MockTransport(answer), cache=ResponseCache(mode="off"),
+    )
+    try:
+        assert (await client.get("Pipelines")).status_code == 503
+    finally:
+        await client.aclose()
+    assert len(sent) == 3
+    assert clock.sleeps == [7.0, 1.0]
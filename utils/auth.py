@@ -0,0 +1,54 @@
+# API key for the routes that act on the Zoho account: OAuth, token refresh,
+# syncs, the raw Zoho data, the metrics and /metrics. Callers send it in the
+# X-API-Key header. The check is opt-in: while ADMIN_API_KEY is unset every
+# route stays open, as it was before the key existed.
+#
+# The OAuth state and the one-time OAuth links are signed tokens rather than
+# server-side entries, so any uvicorn worker can check a token another one issued.
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException
+load_dotenv()
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+# Signing key of the tokens, the same in every worker: OAUTH_STATE_SECRET, else the
+# Zoho client secret. The random fallback only holds within one process.
+TOKEN_SECRET = (os.getenv("OAUTH_STATE_SECRET") or os.getenv("CLIENT_SECRET") or secrets.token_hex(32)).encode()
+
+
+def api_key_matches(x_api_key: str) -> bool:
+    """Whether `x_api_key` is ADMIN_API_KEY (always true while it is unset)."""
+    if not ADMIN_API_KEY:
+        return True
+    return bool(x_api_key) and hmac.compare_digest(x_api_key.encode(), ADMIN_API_KEY.encode())
+
+
+def require_api_key(x_api_key: str = Header(None)):
+    if not api_key_matches(x_api_key):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-API-Key header")
+
+
+def _token_mac(purpose: str, body: str) -> str:
+    return hmac.new(TOKEN_SECRET, f"{purpose}:{body}".encode(), hashlib.sha256).hexdigest()
+
+
+def sign_token(purpose: str, ttl: float) -> str:
+    """A random token for `purpose` ("oauth-state", "oauth-link"...) that verify_token accepts for `ttl` seconds."""
+    body = f"{int(time.time() + ttl)}.{secrets.token_urlsafe(16)}"
+    return f"{body}.{_token_mac(purpose, body)}"
+
+
+def verify_token(purpose: str, token: str) -> bool:
+    """Whether `token` was made by sign_token for `purpose` and has not expired."""
+    if not token or token.count(".") != 2:
+        return False
+    body, mac = token.rsplit(".", 1)
+    if not hmac.compare_digest(mac, _token_mac(purpose, body)):
+        return False
+    expires_at = body.split(".", 1)[0]
+    return expires_at.isdigit() and time.time() < int(expires_at)
@@ -0,0 +1,231 @@
+# Lightweight in-process instrumentation: timed spans and counters around
+# the external calls (Zoho, Postgres, Google Sheets) and the metric phases,
+# rendered in the Prometheus text format by GET /metrics, plus rate-limited
+# progress lines and an opt-in profiler for sync jobs.
+#
+#   with span("zoho_request", endpoint="Pipelines"):   -> zoho_request_seconds{endpoint="Pipelines"}
+#   increment("zoho_responses", status="200")          -> zoho_responses_total{status="200"}
+#
+# INSTRUMENTATION_ENABLED=false turns spans and counters into no-ops.
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds between two progress lines of the same loop
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "5"))
+# "cprofile" or "pyinstrument" profiles every sync job; empty disables profiling
+JOB_PROFILER = os.getenv("JOB_PROFILER", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+JOB_PROFILERS = ("cprofile", "pyinstrument")
+
+_lock = threading.Lock()
+# (name, labels) -> [count, total seconds, max seconds, errors]
+_spans = {}
+# (name, labels) -> value
+_counters = {}
+_gauge_sources = []
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def record_span(name: str, seconds: float, error: bool = False, **labels):
+    if not INSTRUMENTATION_ENABLED:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        stats = _spans.get(key)
+        if stats is None:
+            stats = _spans[key] = [0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        stats[3] += int(error)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time the block as one `name` span; an exception counts as an error and is re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_span(name, time.perf_counter() - started, error=True, **labels)
+        raise
+    record_span(name, time.perf_counter() - started, **labels)
+
+
+def increment(name: str, value: float = 1, **labels):
+    if not INSTRUMENTATION_ENABLED:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_gauge_source(source):
+    """
+    Add a callable returning (name, labels, value) tuples, read on every
+    /metrics scrape (pool sizes, cache hits, job progress...).
+    """
+    _gauge_sources.append(source)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """Every span, counter and gauge in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        spans = sorted(_spans.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    # A metric family's samples have to be contiguous: one pass per family
+    for span_name in sorted({name for (name, _), _ in spans}):
+        family = [(_format_labels(labels), stats) for (name, labels), stats in spans if name == span_name]
+        declare(f"{span_name}_seconds", "summary")
+        for label_text, (count, total, _, _) in family:
+            lines.append(f"{span_name}_seconds_count{label_text} {count}")
+            lines.append(f"{span_name}_seconds_sum{label_text} {total:.6f}")
+        declare(f"{span_name}_seconds_max", "gauge")
+        lines.extend(f"{span_name}_seconds_max{label_text} {stats[2]:.6f}" for label_text, stats in family)
+        declare(f"{span_name}_errors_total", "counter")
+        lines.extend(f"{span_name}_errors_total{label_text} {stats[3]}" for label_text, stats in family)
+
+    for (name, labels), value in counters:
+        declare(f"{name}_total", "counter")
+        lines.append(f"{name}_total{_format_labels(labels)} {value}")
+
+    # Several sources can report one family (zoho_cache_* for both Zoho clients):
+    # gather them all, then write each family in one block
+    gauges = sorted(
+        (name, _label_key(labels), value)
+        for source in list(_gauge_sources)
+        for name, labels, value in source()
+        if value is not None
+    )
+    for name, labels, value in gauges:
+        declare(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class PhaseTimer:
+    """
+    Times the consecutive phases of one computation without nesting blocks:
+    mark("load") records the time since the timer started (or since the
+    previous mark) as a metrics_phase span with phase="load" and `labels`.
+    """
+
+    def __init__(self, computation: str, **labels):
+        self.labels = dict(labels, computation=computation)
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        record_span("metrics_phase", now - self._last, phase=phase, **self.labels)
+        self._last = now
+
+
+class ProgressReporter:
+    """
+    Progress of a long loop, printed at most every `interval` seconds instead
+    of once per row: "[done/total] label (rate/s)", or "label: done" when the
+    total is unknown. The line for the last item (done == total) is always
+    printed; call finish() for loops without a total.
+    """
+
+    def __init__(self, label: str, total: int = None, interval: float = None):
+        self.label = label
+        self.total = total
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.done = 0
+        self.started = time.monotonic()
+        self._printed_at = self.started
+        self._printed_done = None
+
+    def update(self, done: int = None, advance: int = 1, detail: str = None):
+        """Set the count to `done` (or add `advance`) and print if the interval has passed."""
+        self.done = done if done is not None else self.done + advance
+        now = time.monotonic()
+        if now - self._printed_at >= self.interval or (self.total is not None and self.done >= self.total):
+            self._print(now, detail)
+
+    def finish(self, detail: str = None):
+        if self._printed_done != self.done:
+            self._print(time.monotonic(), detail)
+
+    def _print(self, now: float, detail: str = None):
+        elapsed = now - self.started
+        rate = f" ({self.done / elapsed:.0f}/s)" if elapsed > 0 else ""
+        if self.total is not None:
+            line = f"[{self.done}/{self.total}] {self.label}{rate}"
+        else:
+            line = f"{self.label}: {self.done}{rate}"
+        print(line + (f" {detail}" if detail else ""))
+        self._printed_at = now
+        self._printed_done = self.done
+
+
+@contextmanager
+def profile_job(name: str, profiler: str = None):
+    """
+    Profile the block with cProfile or pyinstrument (`profiler`, default
+    JOB_PROFILER) and write the result to PROFILE_DIR: <name>.prof for
+    cProfile (open with snakeviz or pstats), <name>.html for pyinstrument.
+    Only the calling thread is profiled: time spent in worker threads shows
+    up as waiting on them. Without a profiler the block just runs.
+    """
+    profiler = profiler or JOB_PROFILER
+    if not profiler:
+        yield
+        return
+    if profiler not in JOB_PROFILERS:
+        raise ValueError(f"Unknown JOB_PROFILER '{profiler}', expected one of {JOB_PROFILERS}")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        # async_mode="disabled": the job runs in its own thread, not on an event loop
+        profile = Profiler(async_mode="disabled")
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            path = os.path.join(PROFILE_DIR, f"{name}.html")
+            with open(path, "w") as f:
+                f.write(profile.output_html())
+            print(f"Profile written to {path}")
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        path = os.path.join(PROFILE_DIR, f"{name}.prof")
+        profile.dump_stats(path)
+        print(f"Profile written to {path}")
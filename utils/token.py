@@ -1,14 +1,85 @@
 import json
 import os
+import tempfile
+import threading
+import time
 
 TOKEN_FILE = "keys/zoho_tokens.json"
+# Refresh this many seconds before the access token actually expires
+TOKEN_REFRESH_MARGIN = int(os.getenv("ZOHO_TOKEN_REFRESH_MARGIN", "300"))
 
 def save_tokens(token_data: dict):
-    with open(TOKEN_FILE, "w") as f:
+    # Write to a temp file next to the real one and swap it in, so readers
+    # never see a half-written file
+    token_dir = os.path.dirname(TOKEN_FILE) or "."
+    with tempfile.NamedTemporaryFile("w", dir=token_dir, suffix=".tmp", delete=False) as f:
         json.dump(token_data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name, TOKEN_FILE)
 
 def load_tokens() -> dict:
     if not os.path.exists(TOKEN_FILE):
         return {}
     with open(TOKEN_FILE, "r") as f:
         return json.load(f)
+
+
+class TokenManager:
+    """
+    Keeps the OAuth tokens in memory and refreshes the access token shortly
+    before it expires. Concurrent callers that find it expired wait on one
+    refresh instead of each starting their own.
+    `refresh_fn(refresh_token)` must return the token endpoint's JSON response.
+    """
+
+    def __init__(self, refresh_fn, refresh_margin: int = TOKEN_REFRESH_MARGIN):
+        self.refresh_fn = refresh_fn
+        self.refresh_margin = refresh_margin
+        self._tokens = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, tokens: dict) -> bool:
+        return time.time() < tokens.get("expiry_time", 0) - self.refresh_margin
+
+    def needs_refresh(self) -> bool:
+        tokens = self._tokens
+        return not tokens or not self._is_fresh(tokens)
+
+    def get_access_token(self) -> str:
+        tokens = self._tokens
+        if tokens and self._is_fresh(tokens):
+            return tokens["access_token"]
+
+        with self._lock:
+            if not self._tokens or not self._is_fresh(self._tokens):
+                # The file may be newer than what we hold: written by the OAuth
+                # callback after we started, or refreshed by another worker
+                self._tokens = load_tokens() or self._tokens
+            if not self._tokens:
+                raise ValueError("No tokens found. Authenticate first.")
+            # Another thread may have refreshed while we waited for the lock
+            if not self._is_fresh(self._tokens):
+                self._refresh()
+            return self._tokens["access_token"]
+
+    def refresh(self, refresh_token: str = None) -> dict:
+        """Force a refresh (single-flight with get_access_token)."""
+        with self._lock:
+            return self._refresh(refresh_token)
+
+    def _refresh(self, refresh_token: str = None) -> dict:
+        tokens = dict(self._tokens or load_tokens())
+        new_tokens = self.refresh_fn(refresh_token or tokens["refresh_token"])
+        if "access_token" not in new_tokens:
+            raise ValueError(f"Token refresh failed: {new_tokens}")
+        tokens.update(new_tokens)
+        tokens["expiry_time"] = time.time() + new_tokens.get("expires_in", 0)
+        save_tokens(tokens)
+        self._tokens = tokens
+        return tokens
+
+    def set_tokens(self, token_data: dict):
+        with self._lock:
+            save_tokens(token_data)
+            self._tokens = token_data
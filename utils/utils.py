@@ -25,6 +25,11 @@ def get_week_data(previous_week_count=0):
     else:
         today = date.today()
 
+    return get_week_data_for_date(today)
+
+
+def get_week_data_for_date(today: date):
+    """Week of the month containing `today`, in the get_week_data format."""
     year = today.year
     month = today.strftime("%B").lower() 
     
@@ -41,4 +46,23 @@ def get_week_data(previous_week_count=0):
         "name": f"{year}_{month}_week_{week_label}",
         "start_date": get_time_stamp(week_start),
         "end_date": get_time_stamp(week_end)
-    }
\ No newline at end of file
+    }
+
+
+def get_weeks_for_offsets(first_offset: int, last_offset: int):
+    """get_week_data for every offset from first_offset to last_offset (inclusive)."""
+    step = 1 if last_offset >= first_offset else -1
+    return [get_week_data(offset) for offset in range(first_offset, last_offset + step, step)]
+
+
+def get_weeks_for_months(start_month: date, end_month: date):
+    """Every week (1st, 8th, 15th, 22nd and 29th start) of the months from start_month to end_month."""
+    weeks = []
+    month = start_month.replace(day=1)
+    while month <= end_month:
+        days_in_month = calendar.monthrange(month.year, month.month)[1]
+        for day in (1, 8, 15, 22, 29):
+            if day <= days_in_month:
+                weeks.append(get_week_data_for_date(month.replace(day=day)))
+        month = month + timedelta(days=days_in_month)
+    return weeks